@@ -0,0 +1,228 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from models import Tool
+
+ANALYSIS_CACHE_DIR = os.environ.get(
+    "ANALYSIS_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "analysis"),
+)
+ANALYSIS_CACHE_TTL = int(os.environ.get("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600)))
+ANALYSIS_CACHE_MAX_BYTES = int(os.environ.get("ANALYSIS_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+ANALYSIS_CACHE_MEMORY_ENTRIES = int(os.environ.get("ANALYSIS_CACHE_MEMORY_ENTRIES", "256"))
+# Eviction trims the directory to this fraction of max_bytes, so the next writes don't each rescan it
+ANALYSIS_CACHE_EVICT_TO = 0.9
+
+# Lines whose only job is to say when or how fast a tool ran
+VOLATILE_LINES = [
+    re.compile(r"^Starting Nmap .*"),
+    re.compile(r"^Nmap done: .*scanned in .*"),
+    re.compile(r"^Service detection performed\..*"),
+    re.compile(r"^\+ (Start|End) Time:.*"),
+    re.compile(r"^\+ \d+ host\(s\) tested.*"),
+    re.compile(r"^Generated: .*"),
+    re.compile(r"^Scan simulated in .*"),
+]
+# Fragments that change between otherwise identical runs
+VOLATILE_FRAGMENTS = [
+    (re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:?\d{2}| ?[A-Z]{2,4})?"), "<time>"),
+    (re.compile(r"\(\d+(\.\d+)?s latency\)"), "(<latency>)"),
+    (re.compile(r"\d+(\.\d+)? ?(seconds|secs|ms)\b"), "<duration>"),
+]
+
+
+def normalize_output(output: str) -> str:
+    lines = []
+    for line in output.splitlines():
+        line = line.rstrip()
+        if any(pattern.match(line) for pattern in VOLATILE_LINES):
+            continue
+        for pattern, replacement in VOLATILE_FRAGMENTS:
+            line = pattern.sub(replacement, line)
+        lines.append(line)
+    return "\n".join(lines).strip()
+
+
+def analysis_key(target: str, tools: List[Tool], outputs: List[str], prompt_version: str,
+                 baseline_id: Optional[str] = None) -> str:
+    """Content hash of everything that determines the model's answer.
+
+    A differential analysis updates the baseline scan's answer, so its key
+    also names the baseline.
+    """
+    fields = {
+        "prompt": prompt_version,
+        "target": target.strip().lower(),
+        "tools": [tool.value for tool in tools],
+        "outputs": [normalize_output(output) for output in outputs],
+    }
+    if baseline_id is not None:
+        fields["baseline"] = baseline_id
+    payload = json.dumps(fields, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class AnalysisCache:
+    """Two-tier (memory LRU + on-disk) cache of raw analysis responses.
+
+    Disk entries expire after `ttl` seconds; once the directory grows past
+    `max_bytes` the least recently used files are removed. Disk reads and
+    writes run in a thread, since entries can hold whole tool outputs.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = ANALYSIS_CACHE_DIR,
+        ttl: int = ANALYSIS_CACHE_TTL,
+        max_bytes: int = ANALYSIS_CACHE_MAX_BYTES,
+        memory_entries: int = ANALYSIS_CACHE_MEMORY_ENTRIES,
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats: Dict[str, int] = {"memoryHits": 0, "diskHits": 0, "misses": 0, "evictions": 0}
+        self._disk_bytes: Optional[int] = None  # measured by the first write, then kept up to date
+        self._disk_lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    async def get(self, key: str, ttl: Optional[int] = None) -> Optional[str]:
+        """Cached text, if stored less than `ttl` (default: the cache's ttl) seconds ago"""
+        now = time.time()
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        entry = self._memory.get(key)
+        if entry is not None:
+            stored_at, text = entry
+            if now - stored_at < ttl:
+                self._memory.move_to_end(key)
+                self.stats["memoryHits"] += 1
+                return text
+            del self._memory[key]
+
+        entry = await asyncio.to_thread(self._read_disk, key, now, ttl) if self.directory else None
+        if entry is not None:
+            stored_at, text = entry
+            self._remember(key, stored_at, text)
+            self.stats["diskHits"] += 1
+            return text
+
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, key: str, text: str):
+        now = time.time()
+        self._remember(key, now, text)
+        if self.directory:
+            await asyncio.to_thread(self._write_disk, key, now, text)
+
+    def report(self) -> Dict[str, int]:
+        lookups = self.stats["memoryHits"] + self.stats["diskHits"] + self.stats["misses"]
+        hits = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "hits": hits,
+            "lookups": lookups,
+            "hitRate": round(hits / lookups, 3) if lookups else 0.0,
+            "memoryEntries": len(self._memory),
+        }
+
+    def _remember(self, key: str, stored_at: float, text: str):
+        self._memory[key] = (stored_at, text)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read_disk(self, key: str, now: float, ttl: int) -> Optional[tuple]:
+        """(storedAt, text) of a fresh disk entry; runs in a worker thread"""
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if now - entry["storedAt"] >= ttl:
+            if now - entry["storedAt"] >= self.ttl:
+                with self._disk_lock:
+                    self._removed(_remove(path))
+            return None
+        try:
+            os.utime(path)  # mtime doubles as last-access time for eviction
+        except OSError:
+            pass
+        return entry["storedAt"], entry["text"]
+
+    def _write_disk(self, key: str, now: float, text: str):
+        path = self._path(key)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"storedAt": now, "text": text}, f)
+        written = os.path.getsize(tmp)
+        with self._disk_lock:
+            replaced = _size(path)
+            os.replace(tmp, path)
+            if self._disk_bytes is None:
+                self._evict_disk()  # first write: measure what earlier runs left behind
+                return
+            self._disk_bytes += written - replaced
+            if self._disk_bytes > self.max_bytes:
+                self._evict_disk()
+
+    def _removed(self, size: int):
+        if size and self._disk_bytes is not None:
+            self._disk_bytes -= size
+
+    def _evict_disk(self):
+        """Drop expired entries, then the least recently used ones down to EVICT_TO; called with the lock held"""
+        now = time.time()
+        files = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime >= self.ttl:
+                _remove(entry.path)
+                self.stats["evictions"] += 1
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        files.sort()
+        while total > self.max_bytes * ANALYSIS_CACHE_EVICT_TO and files:
+            _, size, path = files.pop(0)
+            _remove(path)
+            total -= size
+            self.stats["evictions"] += 1
+        self._disk_bytes = total
+
+
+def _size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _remove(path: str) -> int:
+    """Delete a file, returning the bytes freed (0 if it was already gone)"""
+    size = _size(path)
+    try:
+        os.remove(path)
+    except OSError:
+        return 0
+    return size
@@ -0,0 +1,420 @@
+import asyncio
+import fcntl
+import gzip
+import mmap
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from metrics import Counter
+from storage import DATABASE_PATH, ConnectionPool, _migrate, _transaction
+
+ARCHIVE_DIR = os.environ.get(
+    "ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(DATABASE_PATH)), "archive")
+)
+# Uncompressed text per gzip block; a range read only inflates the blocks it overlaps
+ARCHIVE_BLOCK_BYTES = int(os.environ.get("ARCHIVE_BLOCK_BYTES", str(64 * 1024)))
+# A segment file is closed and a new one started once it grows past this
+ARCHIVE_SEGMENT_BYTES = int(os.environ.get("ARCHIVE_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+ARCHIVE_LEVEL = int(os.environ.get("ARCHIVE_LEVEL", "6"))
+# Output older than this is dropped by compaction
+ARCHIVE_RETENTION_DAYS = float(os.environ.get("ARCHIVE_RETENTION_DAYS", "90"))
+# Closed segments with less live data than this fraction are rewritten
+ARCHIVE_COMPACT_RATIO = float(os.environ.get("ARCHIVE_COMPACT_RATIO", "0.5"))
+ARCHIVE_COMPACT_INTERVAL = float(os.environ.get("ARCHIVE_COMPACT_INTERVAL", "3600"))
+# An unclosed segment untouched this long belongs to a process that died
+ARCHIVE_SEGMENT_IDLE = 3600
+# Most lines returned by one range read
+ARCHIVE_MAX_LINES = int(os.environ.get("ARCHIVE_MAX_LINES", "5000"))
+
+ARCHIVE_BYTES = Counter("archive_bytes_total", "Tool output written to the archive", ["kind"])
+
+ARCHIVE_MIGRATIONS = [
+    """
+    CREATE TABLE segments (
+        name TEXT PRIMARY KEY,
+        closed INTEGER NOT NULL DEFAULT 0,
+        createdAt REAL NOT NULL
+    );
+    CREATE TABLE streams (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scanId TEXT NOT NULL,
+        tool TEXT NOT NULL,
+        endpoint TEXT NOT NULL,
+        lines INTEGER NOT NULL,
+        bytes INTEGER NOT NULL,
+        compressedBytes INTEGER NOT NULL,
+        createdAt REAL NOT NULL
+    );
+    CREATE INDEX idx_streams_scan ON streams (scanId);
+    CREATE INDEX idx_streams_created_at ON streams (createdAt);
+    CREATE TABLE blocks (
+        streamId INTEGER NOT NULL REFERENCES streams (id) ON DELETE CASCADE,
+        firstLine INTEGER NOT NULL,
+        lines INTEGER NOT NULL,
+        segment TEXT NOT NULL,
+        offset INTEGER NOT NULL,
+        length INTEGER NOT NULL,
+        PRIMARY KEY (streamId, firstLine)
+    );
+    CREATE INDEX idx_blocks_segment ON blocks (segment);
+    """,
+]
+
+Block = Tuple[int, int, str, int, int]  # first line, line count, segment, offset, compressed length
+
+
+class SegmentWriter:
+    """This process's open segment file; compressed blocks are only ever appended.
+
+    Each process writes its own segments, so appends never interleave.
+    Every block is a complete gzip member, which makes a segment a valid
+    (if mixed) .gz file even without the index. Appends happen on the
+    archive's writer thread; the event loop only takes retired segments.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.name: Optional[str] = None
+        self.size = 0
+        self.retired: List[str] = []  # rolled over, to be marked closed in the index
+        self._file = None
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    def append(self, data: bytes) -> Tuple[str, int]:
+        with self._lock:
+            # Roll well before compaction would take an idle segment for an abandoned one
+            idle = time.monotonic() - self._last_write > ARCHIVE_SEGMENT_IDLE / 2
+            if self._file is None or self.size >= ARCHIVE_SEGMENT_BYTES or idle:
+                self._roll()
+            offset = self.size
+            self._file.write(data)
+            self._file.flush()
+            self.size += len(data)
+            self._last_write = time.monotonic()
+            return self.name, offset
+
+    def take_retired(self, busy: Set[str]) -> List[str]:
+        """Rolled-over segments no open stream still has unindexed blocks in"""
+        with self._lock:
+            retired = [name for name in self.retired if name not in busy]
+            self.retired = [name for name in self.retired if name in busy]
+            return retired
+
+    def sync(self):
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+
+    def close(self) -> Optional[str]:
+        if self._file is None:
+            return None
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        return self.name
+
+    def _roll(self):
+        if self.close():
+            self.retired.append(self.name)
+        self.name = _segment_name()
+        self._file = open(os.path.join(self.directory, self.name), "ab")
+        self.size = 0
+
+
+class ArchiveStream:
+    """One tool run's stdout, compressed block by block as the lines arrive.
+
+    write() is called from the event loop for every line, so full blocks
+    are handed to the archive's single writer thread to compress and
+    append; one thread keeps every stream's blocks in write order.
+    """
+
+    def __init__(self, archive: "OutputArchive", scan_id: str, tool: str, endpoint: str):
+        self.archive = archive
+        self.scan_id = scan_id
+        self.tool = tool
+        self.endpoint = endpoint
+        self.lines = 0
+        self.bytes = 0
+        self.compressed = 0
+        self.blocks: List[Block] = []
+        self.error: Optional[OSError] = None
+        self._buffer: List[str] = []
+        self._buffered = 0
+        self._pending: Optional[Future] = None  # the last block handed to the writer thread
+
+    def write(self, line: str):
+        if self.error is not None:
+            return
+        self._buffer.append(line)
+        self._buffered += len(line) + 1
+        if self._buffered >= ARCHIVE_BLOCK_BYTES:
+            self._flush_block()
+
+    def write_text(self, text: str):
+        for line in text.splitlines():
+            self.write(line)
+
+    def _flush_block(self):
+        self._pending = self.archive.writer.submit(self._write_block, self._buffer)
+        self._buffer, self._buffered = [], 0
+
+    def _write_block(self, lines: List[str]):
+        """Writer thread: compress one block and append it to the open segment"""
+        if self.error is not None:
+            return
+        raw = ("\n".join(lines) + "\n").encode("utf-8", "replace")
+        data = gzip.compress(raw, compresslevel=ARCHIVE_LEVEL, mtime=0)
+        try:
+            segment, offset = self.archive.segments.append(data)
+        except OSError as e:
+            # Losing the archive copy must not fail the scan; close() reports it
+            self.error = e
+            return
+        self.blocks.append((self.lines, len(lines), segment, offset, len(data)))
+        self.lines += len(lines)
+        self.bytes += len(raw)
+        self.compressed += len(data)
+
+    async def close(self):
+        """Write the last block and index the stream, replacing any earlier run of the same tool"""
+        if self._buffer:
+            self._flush_block()
+        if self._pending is not None:
+            # The writer runs blocks in order, so this one finishing means all of them have
+            await asyncio.wrap_future(self._pending)
+        ARCHIVE_BYTES.inc(self.bytes, kind="raw")
+        ARCHIVE_BYTES.inc(self.compressed, kind="compressed")
+        if self.error is not None:
+            print(f"Archiving {self.tool} output of scan {self.scan_id} failed: {self.error}")
+            self.archive._open.discard(self)
+            return
+        if not self.lines:
+            self.archive._open.discard(self)
+            return
+        await asyncio.wrap_future(self.archive.writer.submit(self.archive.segments.sync))
+        self.archive._open.discard(self)
+        # A rolled-over segment is only closed once no open stream still has unindexed blocks in it
+        retired = self.archive.segments.take_retired(self.archive.busy_segments())
+        await self.archive.pool.run(_transaction, _save_stream, self, retired, time.time())
+
+
+class OutputArchive:
+    """Append-only archive of raw tool output with a line-range index.
+
+    Output is gzip-compressed in blocks of ~ARCHIVE_BLOCK_BYTES into
+    segment files while the tool runs. The SQLite index records each
+    block's first line and byte range, so reading lines 10000-10100 of a
+    nikto report maps the segment and inflates one or two blocks instead
+    of the whole file. Scan records never carry the output itself.
+    """
+
+    def __init__(self, directory: str = ARCHIVE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.pool = ConnectionPool(os.path.join(directory, "index.db"), 2)
+        self.pool.run_sync(_migrate, ARCHIVE_MIGRATIONS)
+        self.segments = SegmentWriter(directory)
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix="archive-writer")
+        self._open: Set[ArchiveStream] = set()
+
+    def stream(self, scan_id: str, tool: str, endpoint: Optional[str] = None) -> ArchiveStream:
+        """Start archiving one tool run; close() it when the run ends, however it ends"""
+        stream = ArchiveStream(self, scan_id, tool, endpoint or "")
+        self._open.add(stream)
+        return stream
+
+    def busy_segments(self) -> Set[str]:
+        """Segments this process may still append to or index blocks in"""
+        busy = {block[2] for stream in self._open for block in stream.blocks}
+        if self.segments.name:
+            busy.add(self.segments.name)
+        return busy
+
+    async def streams(self, scan_id: str) -> List[dict]:
+        rows = await self.pool.run(
+            _rows,
+            "SELECT tool, endpoint, lines, bytes, compressedBytes, createdAt FROM streams WHERE scanId = ? ORDER BY id",
+            (scan_id,),
+        )
+        return [
+            {"tool": tool, "endpoint": endpoint or None, "lines": lines, "bytes": size,
+             "compressedBytes": compressed, "archivedAt": created}
+            for tool, endpoint, lines, size, compressed, created in rows
+        ]
+
+    async def read(self, scan_id: str, tool: str, endpoint: Optional[str], start: int, end: int) -> Optional[dict]:
+        """Lines [start, end) of one archived stream, or None if there is no such stream"""
+        end = min(end, start + ARCHIVE_MAX_LINES)
+        for attempt in range(2):
+            try:
+                return await self.pool.run(_read_range, self.directory, scan_id, tool, endpoint or "", start, end)
+            except FileNotFoundError:
+                # Compaction moved the blocks between the index lookup and the read
+                if attempt:
+                    raise
+
+    async def forget_scan(self, scan_id: str):
+        """Drop a scan's output from the index; compaction reclaims the space"""
+        await self.pool.run(_transaction, _delete_streams, scan_id)
+
+    async def compact(self) -> dict:
+        """Expire old output and rewrite or delete segments that are mostly dead"""
+        return await asyncio.to_thread(self._compact_locked, self.busy_segments())
+
+    def _compact_locked(self, busy: Set[str]) -> dict:
+        # One compactor at a time across every process sharing the directory
+        with open(os.path.join(self.directory, "compact.lock"), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return {"skipped": True}
+            return self.pool.run_sync(_compact, self.directory, busy, time.time())
+
+    async def close(self):
+        await asyncio.to_thread(self.writer.shutdown)
+        name = self.segments.close()
+        if name:
+            await self.pool.run(_transaction, _close_segments, [name])
+        self.pool.close()
+
+
+def _segment_name() -> str:
+    return f"{int(time.time())}-{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}.gz"
+
+
+def _rows(conn: sqlite3.Connection, sql: str, params: tuple) -> list:
+    return conn.execute(sql, params).fetchall()
+
+
+def _save_stream(conn: sqlite3.Connection, stream: ArchiveStream, retired: List[str], now: float):
+    _delete_streams(conn, stream.scan_id, stream.tool, stream.endpoint)
+    stream_id = conn.execute(
+        "INSERT INTO streams (scanId, tool, endpoint, lines, bytes, compressedBytes, createdAt) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (stream.scan_id, stream.tool, stream.endpoint, stream.lines, stream.bytes, stream.compressed, now),
+    ).lastrowid
+    conn.executemany(
+        "INSERT OR IGNORE INTO segments (name, createdAt) VALUES (?, ?)",
+        [(segment, now) for segment in {block[2] for block in stream.blocks}],
+    )
+    conn.executemany(
+        "INSERT INTO blocks (streamId, firstLine, lines, segment, offset, length) VALUES (?, ?, ?, ?, ?, ?)",
+        [(stream_id, *block) for block in stream.blocks],
+    )
+    _close_segments(conn, retired)
+
+
+def _close_segments(conn: sqlite3.Connection, names: List[str]):
+    now = time.time()
+    for name in names:
+        conn.execute("INSERT OR IGNORE INTO segments (name, createdAt) VALUES (?, ?)", (name, now))
+        conn.execute("UPDATE segments SET closed = 1 WHERE name = ?", (name,))
+
+
+def _delete_streams(conn: sqlite3.Connection, scan_id: str, tool: Optional[str] = None, endpoint: str = ""):
+    if tool is None:
+        conn.execute("DELETE FROM streams WHERE scanId = ?", (scan_id,))
+    else:
+        conn.execute(
+            "DELETE FROM streams WHERE scanId = ? AND tool = ? AND endpoint = ?", (scan_id, tool, endpoint)
+        )
+
+
+def _read_range(conn: sqlite3.Connection, directory: str, scan_id: str, tool: str, endpoint: str,
+                start: int, end: int) -> Optional[dict]:
+    row = conn.execute(
+        "SELECT id, lines FROM streams WHERE scanId = ? AND tool = ? AND endpoint = ? ORDER BY id DESC LIMIT 1",
+        (scan_id, tool, endpoint),
+    ).fetchone()
+    if row is None:
+        return None
+    stream_id, total = row
+    start, end = max(0, start), min(end, total)
+    blocks = conn.execute(
+        "SELECT firstLine, segment, offset, length FROM blocks "
+        "WHERE streamId = ? AND firstLine < ? AND firstLine + lines > ? ORDER BY firstLine",
+        (stream_id, end, start),
+    ).fetchall() if start < end else []
+
+    lines: List[str] = []
+    maps: Dict[str, mmap.mmap] = {}
+    try:
+        for first, segment, offset, length in blocks:
+            if segment not in maps:
+                with open(os.path.join(directory, segment), "rb") as f:
+                    maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            text = gzip.decompress(maps[segment][offset:offset + length]).decode("utf-8", "replace")
+            block = text.split("\n")[:-1]
+            lines.extend(block[max(0, start - first):end - first])
+    finally:
+        for mapped in maps.values():
+            mapped.close()
+    return {"from": start, "to": start + len(lines), "total": total, "lines": lines}
+
+
+def _compact(conn: sqlite3.Connection, directory: str, busy: Set[str], now: float) -> dict:
+    cutoff = now - ARCHIVE_RETENTION_DAYS * 86400
+    expired = _transaction(
+        conn, lambda c: c.execute("DELETE FROM streams WHERE createdAt < ?", (cutoff,)).rowcount
+    )
+    report = {"expiredStreams": expired, "deletedSegments": 0, "rewrittenSegments": 0, "reclaimedBytes": 0}
+
+    known = {name: closed for name, closed in conn.execute("SELECT name, closed FROM segments").fetchall()}
+    on_disk = {name for name in os.listdir(directory) if name.endswith(".gz")}
+    for name in sorted(on_disk | set(known)):
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            _transaction(conn, lambda c: c.execute("DELETE FROM segments WHERE name = ?", (name,)))
+            continue
+        # Still being appended to by this or another live process
+        if name in busy or (not known.get(name) and stat.st_mtime > now - ARCHIVE_SEGMENT_IDLE):
+            continue
+        live = conn.execute("SELECT COALESCE(SUM(length), 0) FROM blocks WHERE segment = ?", (name,)).fetchone()[0]
+        if live == 0:
+            _transaction(conn, lambda c: c.execute("DELETE FROM segments WHERE name = ?", (name,)))
+            os.remove(path)
+            report["deletedSegments"] += 1
+            report["reclaimedBytes"] += stat.st_size
+        elif live < stat.st_size * ARCHIVE_COMPACT_RATIO:
+            _rewrite_segment(conn, directory, name, now)
+            report["rewrittenSegments"] += 1
+            report["reclaimedBytes"] += stat.st_size - live
+    if any(report.values()):
+        print(f"Archive compaction: {report}")
+    return report
+
+
+def _rewrite_segment(conn: sqlite3.Connection, directory: str, name: str, now: float):
+    """Copy a segment's live blocks into a new closed segment, repoint the index, then delete the old file"""
+    blocks = conn.execute(
+        "SELECT streamId, firstLine, offset, length FROM blocks WHERE segment = ? ORDER BY offset", (name,)
+    ).fetchall()
+    replacement = _segment_name()
+    moved = []
+    with open(os.path.join(directory, name), "rb") as source, open(os.path.join(directory, replacement), "wb") as target:
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for stream_id, first, offset, length in blocks:
+                moved.append((replacement, target.tell(), stream_id, first, name))
+                target.write(mapped[offset:offset + length])
+        target.flush()
+        os.fsync(target.fileno())
+
+    def repoint(conn):
+        conn.execute("INSERT INTO segments (name, closed, createdAt) VALUES (?, 1, ?)", (replacement, now))
+        conn.executemany(
+            "UPDATE blocks SET segment = ?, offset = ? WHERE streamId = ? AND firstLine = ? AND segment = ?", moved
+        )
+        conn.execute("DELETE FROM segments WHERE name = ?", (name,))
+
+    _transaction(conn, repoint)
+    os.remove(os.path.join(directory, name))
@@ -0,0 +1,359 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import anthropic
+
+from llm import LLM_MODEL, Lane, get_gateway
+from storage import DATABASE_PATH, ConnectionPool, _migrate, _transaction
+
+BATCH_DB_PATH = os.environ.get(
+    "BATCH_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(DATABASE_PATH)), "batches.db")
+)
+# Deferred analyses are collected this long before they are submitted as one batch...
+BATCH_WINDOW_SECONDS = float(os.environ.get("BATCH_WINDOW_SECONDS", "300"))
+# ...or sooner, once this many are waiting
+BATCH_MAX_REQUESTS = int(os.environ.get("BATCH_MAX_REQUESTS", "1000"))
+# How often pending batches are checked for results
+BATCH_POLL_SECONDS = float(os.environ.get("BATCH_POLL_SECONDS", "30"))
+# Requests claimed by a process that died before submitting them are released after this long
+BATCH_CLAIM_SECONDS = float(os.environ.get("BATCH_CLAIM_SECONDS", "300"))
+# Same budget as the synchronous analysis calls
+BATCH_MAX_TOKENS = 2000
+# Direct retries of a request its batch could not answer before the scan's analysis is failed
+BATCH_MAX_ATTEMPTS = int(os.environ.get("BATCH_MAX_ATTEMPTS", "3"))
+
+BATCH_MIGRATIONS = [
+    """
+    CREATE TABLE deferred_scans (
+        scanId TEXT PRIMARY KEY,
+        context TEXT NOT NULL,
+        round INTEGER NOT NULL DEFAULT 0,
+        createdAt REAL NOT NULL
+    );
+    CREATE TABLE deferred_requests (
+        customId TEXT PRIMARY KEY,
+        scanId TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        prompt TEXT NOT NULL,
+        batchId TEXT,
+        claimedAt REAL,
+        result TEXT,
+        error TEXT,
+        createdAt REAL NOT NULL
+    );
+    CREATE INDEX idx_deferred_requests_scan ON deferred_requests (scanId);
+    CREATE INDEX idx_deferred_requests_batch ON deferred_requests (batchId);
+    CREATE TABLE analysis_batches (
+        id TEXT PRIMARY KEY,
+        requests INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        submittedAt REAL NOT NULL,
+        endedAt REAL
+    );
+    """,
+    """
+    ALTER TABLE deferred_requests ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0;
+    """,
+]
+
+# Called with a deferred scan's replies, in the order its prompts were given. Returns
+# follow-up prompts for another round (e.g. merging partial analyses) or None when done.
+ResultHandler = Callable[[str, List[str], dict], Awaitable[Optional[List[str]]]]
+# Called with a deferred scan's id, the error and its context once its analysis is given up
+FailureHandler = Callable[[str, str, dict], Awaitable[None]]
+
+
+class BatchAnalyzer:
+    """Runs non-urgent scan analyses through the Message Batches API.
+
+    defer() records a scan's prompts in a SQLite file shared by the API and
+    the workers; nothing is sent yet. run(), in the API process, submits
+    whatever is waiting once per BATCH_WINDOW_SECONDS (or BATCH_MAX_REQUESTS),
+    polls the open batches and hands each scan's replies to the handler.
+    A request the batch could not answer is retried on the synchronous path,
+    up to BATCH_MAX_ATTEMPTS times; after that, or on an error retrying
+    cannot fix, the scan goes to the failure handler instead.
+    """
+
+    def __init__(self, path: str = BATCH_DB_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.pool = ConnectionPool(path, 2)
+        self.pool.run_sync(_migrate, BATCH_MIGRATIONS)
+
+    async def defer(self, scan_id: str, prompts: List[str], context: dict):
+        """Queue a scan's analysis prompts for the next batch; `context` comes back to the handler"""
+        await self.pool.run(_transaction, _defer, scan_id, prompts, context, time.time())
+
+    async def forget(self, scan_id: str):
+        """Drop a cancelled or deleted scan; answers already in flight are ignored when they arrive"""
+        await self.pool.run(_transaction, _forget, scan_id)
+
+    async def run(self, handler: ResultHandler, on_failure: FailureHandler):
+        while True:
+            try:
+                await self.submit()
+                await self.poll()
+                await self.deliver(handler, on_failure)
+            except Exception as e:
+                print(f"Batch analysis: {e!r}")
+            await asyncio.sleep(BATCH_POLL_SECONDS)
+
+    async def submit(self, force: bool = False) -> Optional[str]:
+        """Send waiting requests as one batch if the window has passed (or `force`); returns the batch id"""
+        claim = f"claim-{uuid.uuid4().hex}"
+        window = 0 if force else BATCH_WINDOW_SECONDS
+        rows = await self.pool.run(_transaction, _claim, claim, time.time(), window)
+        if not rows:
+            return None
+        requests = [
+            {
+                "custom_id": custom_id,
+                "params": {
+                    "model": LLM_MODEL,
+                    "max_tokens": BATCH_MAX_TOKENS,
+                    "messages": [{"role": "user", "content": prompt}],
+                },
+            }
+            for custom_id, prompt in rows
+        ]
+        try:
+            batch = await get_gateway().create_batch(requests)
+        except BaseException:
+            await self.pool.run(_transaction, _unclaim, claim)
+            raise
+        await self.pool.run(_transaction, _submitted, claim, batch["id"], len(rows), time.time())
+        print(f"Batch analysis: submitted {len(rows)} requests as {batch['id']}")
+        return batch["id"]
+
+    async def poll(self):
+        """Collect the replies of every batch that has ended"""
+        open_batches = await self.pool.run(
+            _query, "SELECT id FROM analysis_batches WHERE status != 'ended'", ()
+        )
+        for (batch_id,) in open_batches:
+            batch = await get_gateway().get_batch(batch_id)
+            if batch.get("processing_status") != "ended":
+                continue
+            results = {}
+            for line in await get_gateway().batch_results(batch):
+                result = line["result"]
+                if result.get("type") == "succeeded":
+                    results[line["custom_id"]] = (result["message"]["content"][0]["text"], None)
+                else:
+                    error = result.get("error") or {}
+                    results[line["custom_id"]] = (None, error.get("message") or result.get("type", "errored"))
+            if await self.pool.run(_transaction, _ended, batch_id, results, time.time()):
+                failed = sum(1 for text, _ in results.values() if text is None)
+                print(f"Batch analysis: {batch_id} ended, {len(results) - failed} answered, {failed} failed")
+
+    async def deliver(self, handler: ResultHandler, on_failure: FailureHandler):
+        """Retry failed requests synchronously, then pass every fully answered scan to the handler"""
+        failed = await self.pool.run(
+            _query,
+            "SELECT customId, scanId, prompt, error, attempts FROM deferred_requests WHERE error IS NOT NULL "
+            "ORDER BY scanId, seq", ()
+        )
+        given_up = set()
+        for custom_id, scan_id, prompt, error, attempts in failed:
+            if scan_id in given_up:
+                continue
+            print(f"Batch analysis: {custom_id} failed in its batch ({error}), analyzing it directly")
+            try:
+                message = await get_gateway().create(
+                    lane=Lane.BACKGROUND, model=LLM_MODEL, max_tokens=BATCH_MAX_TOKENS,
+                    messages=[{"role": "user", "content": prompt}],
+                )
+            except anthropic.APIError as e:
+                attempts += 1
+                if attempts < BATCH_MAX_ATTEMPTS and _retryable(e):
+                    print(f"Batch analysis: {custom_id} failed again ({attempts}/{BATCH_MAX_ATTEMPTS}): {e!r}")
+                    await self.pool.run(_transaction, _attempted, custom_id, str(e))
+                    continue
+                given_up.add(scan_id)
+                await self._give_up(scan_id, on_failure, f"analysis request failed: {e}")
+                continue
+            await self.pool.run(_transaction, _answer, custom_id, message.content[0].text)
+
+        ready = await self.pool.run(_query, READY_SQL, ())
+        for (scan_id,) in ready:
+            taken = await self.pool.run(_transaction, _take_replies, scan_id)
+            if taken is None:
+                continue  # another API process got there first
+            replies, context, turn = taken
+            try:
+                follow_up = await handler(scan_id, replies, context)
+            except Exception as e:
+                print(f"Batch analysis: could not record the analysis of scan {scan_id}: {e!r}")
+                await self._give_up(scan_id, on_failure, f"could not record the analysis: {e}", context)
+                continue
+            if follow_up:
+                await self.pool.run(_transaction, _next_round, scan_id, follow_up, turn + 1, time.time())
+            else:
+                await self.pool.run(_transaction, _forget, scan_id)
+
+    async def _give_up(self, scan_id: str, on_failure: FailureHandler, error: str, context: Optional[dict] = None):
+        stored = await self.pool.run(_transaction, _drop, scan_id)
+        context = context if context is not None else stored
+        if context is None:
+            return  # forgotten meanwhile
+        print(f"Batch analysis: giving up on scan {scan_id}: {error}")
+        try:
+            await on_failure(scan_id, error, context)
+        except Exception as e:
+            print(f"Batch analysis: could not record the failure of scan {scan_id}: {e!r}")
+
+    async def report(self) -> dict:
+        waiting, scans = (await self.pool.run(
+            _query,
+            "SELECT COUNT(*), COUNT(DISTINCT scanId) FROM deferred_requests WHERE batchId IS NULL", ()
+        ))[0]
+        batches = await self.pool.run(
+            _query,
+            "SELECT id, requests, status, submittedAt, endedAt FROM analysis_batches "
+            "ORDER BY submittedAt DESC LIMIT 20", ()
+        )
+        return {
+            "waitingRequests": waiting,
+            "waitingScans": scans,
+            "batches": [
+                {"id": batch_id, "requests": requests, "status": status, "submittedAt": submitted, "endedAt": ended}
+                for batch_id, requests, status, submitted, ended in batches
+            ],
+        }
+
+    async def close(self):
+        self.pool.close()
+
+
+# Scans whose every request has a reply
+READY_SQL = """
+    SELECT s.scanId FROM deferred_scans s
+    WHERE EXISTS (SELECT 1 FROM deferred_requests r WHERE r.scanId = s.scanId)
+    AND NOT EXISTS (SELECT 1 FROM deferred_requests r WHERE r.scanId = s.scanId AND r.result IS NULL)
+"""
+
+
+def _query(conn: sqlite3.Connection, sql: str, params: tuple) -> list:
+    return conn.execute(sql, params).fetchall()
+
+
+def _insert_requests(conn: sqlite3.Connection, scan_id: str, prompts: List[str], turn: int, now: float):
+    # custom_id allows [a-zA-Z0-9_-] only
+    conn.executemany(
+        "INSERT INTO deferred_requests (customId, scanId, seq, prompt, createdAt) VALUES (?, ?, ?, ?, ?)",
+        [(f"{scan_id}_{turn}_{i}", scan_id, i, prompt, now) for i, prompt in enumerate(prompts)],
+    )
+
+
+def _defer(conn: sqlite3.Connection, scan_id: str, prompts: List[str], context: dict, now: float):
+    _forget(conn, scan_id)  # a requeued scan replaces what its earlier run deferred
+    conn.execute(
+        "INSERT INTO deferred_scans (scanId, context, createdAt) VALUES (?, ?, ?)",
+        (scan_id, json.dumps(context), now),
+    )
+    _insert_requests(conn, scan_id, prompts, 0, now)
+
+
+def _forget(conn: sqlite3.Connection, scan_id: str):
+    conn.execute("DELETE FROM deferred_requests WHERE scanId = ?", (scan_id,))
+    conn.execute("DELETE FROM deferred_scans WHERE scanId = ?", (scan_id,))
+
+
+def _claim(conn: sqlite3.Connection, claim: str, now: float, window: float) -> List[tuple]:
+    conn.execute(
+        "UPDATE deferred_requests SET batchId = NULL, claimedAt = NULL WHERE batchId LIKE 'claim-%' AND claimedAt < ?",
+        (now - BATCH_CLAIM_SECONDS,),
+    )
+    waiting, oldest = conn.execute(
+        "SELECT COUNT(*), MIN(createdAt) FROM deferred_requests WHERE batchId IS NULL"
+    ).fetchone()
+    if not waiting or (waiting < BATCH_MAX_REQUESTS and oldest > now - window):
+        return []
+    rows = conn.execute(
+        "SELECT customId, prompt FROM deferred_requests WHERE batchId IS NULL ORDER BY createdAt LIMIT ?",
+        (BATCH_MAX_REQUESTS,),
+    ).fetchall()
+    conn.executemany(
+        "UPDATE deferred_requests SET batchId = ?, claimedAt = ? WHERE customId = ?",
+        [(claim, now, custom_id) for custom_id, _ in rows],
+    )
+    return rows
+
+
+def _unclaim(conn: sqlite3.Connection, claim: str):
+    conn.execute("UPDATE deferred_requests SET batchId = NULL, claimedAt = NULL WHERE batchId = ?", (claim,))
+
+
+def _submitted(conn: sqlite3.Connection, claim: str, batch_id: str, count: int, now: float):
+    conn.execute("UPDATE deferred_requests SET batchId = ? WHERE batchId = ?", (batch_id, claim))
+    conn.execute(
+        "INSERT INTO analysis_batches (id, requests, status, submittedAt) VALUES (?, ?, 'in_progress', ?)",
+        (batch_id, count, now),
+    )
+
+
+def _ended(conn: sqlite3.Connection, batch_id: str, results: Dict[str, tuple], now: float) -> bool:
+    if not conn.execute(
+        "UPDATE analysis_batches SET status = 'ended', endedAt = ? WHERE id = ? AND status != 'ended'",
+        (now, batch_id),
+    ).rowcount:
+        return False
+    conn.executemany(
+        "UPDATE deferred_requests SET result = ?, error = ? WHERE customId = ? AND batchId = ?",
+        [(text, error, custom_id, batch_id) for custom_id, (text, error) in results.items()],
+    )
+    # Requests missing from the results entirely are retried like failed ones
+    conn.execute(
+        "UPDATE deferred_requests SET error = 'no result' WHERE batchId = ? AND result IS NULL AND error IS NULL",
+        (batch_id,),
+    )
+    return True
+
+
+def _retryable(error: anthropic.APIError) -> bool:
+    """Client errors other than rate limiting fail the same way every time"""
+    status = getattr(error, "status_code", None)
+    return status is None or status == 429 or status >= 500
+
+
+def _attempted(conn: sqlite3.Connection, custom_id: str, error: str):
+    conn.execute(
+        "UPDATE deferred_requests SET attempts = attempts + 1, error = ? WHERE customId = ?", (error, custom_id)
+    )
+
+
+def _drop(conn: sqlite3.Connection, scan_id: str) -> Optional[dict]:
+    """Forget a scan, returning the context it was deferred with"""
+    row = conn.execute("SELECT context FROM deferred_scans WHERE scanId = ?", (scan_id,)).fetchone()
+    _forget(conn, scan_id)
+    return json.loads(row[0]) if row else None
+
+
+def _answer(conn: sqlite3.Connection, custom_id: str, text: str):
+    conn.execute(
+        "UPDATE deferred_requests SET result = ?, error = NULL WHERE customId = ? AND result IS NULL", (text, custom_id)
+    )
+
+
+def _take_replies(conn: sqlite3.Connection, scan_id: str) -> Optional[tuple]:
+    row = conn.execute("SELECT context, round FROM deferred_scans WHERE scanId = ?", (scan_id,)).fetchone()
+    replies = [
+        result for (result,) in conn.execute(
+            "SELECT result FROM deferred_requests WHERE scanId = ? ORDER BY seq", (scan_id,)
+        ).fetchall()
+    ]
+    if row is None or not replies or any(result is None for result in replies):
+        return None
+    conn.execute("DELETE FROM deferred_requests WHERE scanId = ?", (scan_id,))
+    return replies, json.loads(row[0]), row[1]
+
+
+def _next_round(conn: sqlite3.Connection, scan_id: str, prompts: List[str], turn: int, now: float):
+    if conn.execute("UPDATE deferred_scans SET round = ? WHERE scanId = ?", (turn, scan_id)).rowcount:
+        _insert_requests(conn, scan_id, prompts, turn, now)
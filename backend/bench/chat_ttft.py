@@ -0,0 +1,61 @@
+"""Time-to-first-token for /api/chat/stream versus the blocking /api/chat.
+
+Start the fake Messages API and the backend pointed at it, then run:
+
+  python bench/fake_llm.py &
+  ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=x uvicorn main:app &
+  python bench/chat_ttft.py --requests 20
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+async def measure_stream(client: httpx.AsyncClient, prompt: str):
+    start = time.perf_counter()
+    first = None
+    async with client.stream("POST", "/api/chat/stream", json={"prompt": prompt}) as response:
+        async for line in response.aiter_lines():
+            if first is None and line == "event: token":
+                first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+async def measure_blocking(client: httpx.AsyncClient, prompt: str):
+    start = time.perf_counter()
+    await client.post("/api/chat", json={"prompt": prompt})
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(name: str, samples):
+    ttft = [s[0] for s in samples if s[0] is not None]
+    total = [s[1] for s in samples]
+    print(f"{name:>9}: ttft p50={percentile(ttft, 0.5) * 1000:.0f}ms "
+          f"p99={percentile(ttft, 0.99) * 1000:.0f}ms  "
+          f"total p50={percentile(total, 0.5) * 1000:.0f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Chat time-to-first-token benchmark")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--prompt", default="Which services should I patch first?")
+    args = parser.parse_args()
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=120) as client:
+        streamed = [await measure_stream(client, args.prompt) for _ in range(args.requests)]
+        blocking = [await measure_blocking(client, args.prompt) for _ in range(args.requests)]
+    summarize("stream", streamed)
+    summarize("blocking", blocking)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
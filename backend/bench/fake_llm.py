@@ -0,0 +1,189 @@
+"""Local stand-in for the Anthropic Messages API.
+
+Point the backend at it with ANTHROPIC_BASE_URL=http://127.0.0.1:8765 and
+any ANTHROPIC_API_KEY. Timing and failures are controlled with environment variables:
+
+  FAKE_LLM_LATENCY      seconds before the first byte (default 0.5)
+  FAKE_LLM_TOKEN_DELAY  seconds between streamed tokens (default 0.02)
+  FAKE_LLM_REPLY        reply text (default: a canned scan analysis)
+  FAKE_BATCH_SECONDS    seconds a Message Batch takes to end (default 5)
+  FAKE_BATCH_ERRORS     share of batch requests answered with an error (default 0)
+  FAKE_LLM_FAILURES     statuses to answer the next /v1/messages calls with, e.g. "429,529"
+
+Tests run it in-process instead: hand LLMGateway an httpx client on
+httpx.ASGITransport(app=app) and set the module globals directly.
+
+Run: python bench/fake_llm.py [--port 8765]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+LATENCY = float(os.environ.get("FAKE_LLM_LATENCY", "0.5"))
+TOKEN_DELAY = float(os.environ.get("FAKE_LLM_TOKEN_DELAY", "0.02"))
+BATCH_SECONDS = float(os.environ.get("FAKE_BATCH_SECONDS", "5"))
+BATCH_ERRORS = float(os.environ.get("FAKE_BATCH_ERRORS", "0"))
+# Consumed one per /v1/messages call, before any reply is produced
+failures: List[int] = [int(status) for status in os.environ.get("FAKE_LLM_FAILURES", "").split(",") if status.strip()]
+REPLY = os.environ.get(
+    "FAKE_LLM_REPLY",
+    "ISSUES: 3\nCRITICAL: 1\nRISK_SCORE: 64\n"
+    "SUMMARY: Outdated OpenSSH and an exposed admin panel.\n"
+    "AI_SUMMARY: SSH is several releases behind and /admin answers without auth. "
+    "Patch OpenSSH and restrict the admin panel to the VPN.",
+)
+
+ERROR_TYPES = {400: "invalid_request_error", 429: "rate_limit_error", 500: "api_error", 529: "overloaded_error"}
+
+app = FastAPI()
+batches: Dict[str, dict] = {}  # id -> {"requests", "created", "results"}
+
+
+def _tokens(text: str):
+    # Roughly token-sized pieces, keeping the whitespace attached
+    word = ""
+    for ch in text:
+        word += ch
+        if ch in " \n":
+            yield word
+            word = ""
+    if word:
+        yield word
+
+
+def _usage(body: dict) -> dict:
+    prompt = json.dumps(body.get("messages", []))
+    return {"input_tokens": len(prompt) // 4 + 1, "output_tokens": len(REPLY) // 4 + 1}
+
+
+def _message(body: dict, text: str) -> dict:
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "fake"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": _usage(body),
+    }
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/v1/messages")
+async def messages(request: Request):
+    body = await request.json()
+    if failures:
+        status = failures.pop(0)
+        return JSONResponse(
+            {"type": "error", "error": {"type": ERROR_TYPES.get(status, "api_error"), "message": f"Fake {status}"}},
+            status_code=status,
+        )
+    await asyncio.sleep(LATENCY)
+    if not body.get("stream"):
+        return _message(body, REPLY)
+
+    async def stream():
+        start = _message(body, "")
+        start["content"] = []
+        start["stop_reason"] = None
+        start["usage"]["output_tokens"] = 0
+        yield _sse("message_start", {"type": "message_start", "message": start})
+        yield _sse("content_block_start", {
+            "type": "content_block_start", "index": 0,
+            "content_block": {"type": "text", "text": ""},
+        })
+        for token in _tokens(REPLY):
+            yield _sse("content_block_delta", {
+                "type": "content_block_delta", "index": 0,
+                "delta": {"type": "text_delta", "text": token},
+            })
+            await asyncio.sleep(TOKEN_DELAY)
+        yield _sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+        yield _sse("message_delta", {
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": _usage(body)["output_tokens"]},
+        })
+        yield _sse("message_stop", {"type": "message_stop"})
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+def _timestamp(seconds: float) -> str:
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _batch(batch_id: str, request: Request) -> dict:
+    batch = batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="batch not found")
+    ended = time.time() >= batch["created"] + BATCH_SECONDS
+    counts = {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+    if ended:
+        for line in batch["results"]:
+            counts[line["result"]["type"]] += 1
+    else:
+        counts["processing"] = len(batch["requests"])
+    return {
+        "id": batch_id,
+        "type": "message_batch",
+        "processing_status": "ended" if ended else "in_progress",
+        "request_counts": counts,
+        "created_at": _timestamp(batch["created"]),
+        "ended_at": _timestamp(batch["created"] + BATCH_SECONDS) if ended else None,
+        "expires_at": _timestamp(batch["created"] + timedelta(days=1).total_seconds()),
+        "cancel_initiated_at": None,
+        "archived_at": None,
+        "results_url": str(request.url_for("batch_results", batch_id=batch_id)) if ended else None,
+    }
+
+
+@app.post("/v1/messages/batches")
+async def create_batch(request: Request):
+    body = await request.json()
+    batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+    results = []
+    for item in body["requests"]:
+        if random.random() < BATCH_ERRORS:
+            result = {"type": "errored", "error": {"type": "api_error", "message": "Internal server error"}}
+        else:
+            result = {"type": "succeeded", "message": _message(item["params"], REPLY)}
+        results.append({"custom_id": item["custom_id"], "result": result})
+    batches[batch_id] = {"requests": body["requests"], "created": time.time(), "results": results}
+    return _batch(batch_id, request)
+
+
+@app.get("/v1/messages/batches/{batch_id}")
+async def get_batch(batch_id: str, request: Request):
+    return _batch(batch_id, request)
+
+
+@app.get("/v1/messages/batches/{batch_id}/results", name="batch_results")
+async def batch_results(batch_id: str, request: Request):
+    if _batch(batch_id, request)["processing_status"] != "ended":
+        raise HTTPException(status_code=409, detail="batch has not ended")
+    lines = "".join(json.dumps(line) + "\n" for line in batches[batch_id]["results"])
+    return PlainTextResponse(lines, media_type="application/x-jsonl")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,107 @@
+"""Synthetic tool output for benchmarks: nmap XML, nuclei JSONL and nikto text.
+
+Output is deterministic for a given seed, so runs on different commits see
+exactly the same input. The stub scanners generate it on the fly; this
+script also writes it to files for replaying (STUB_<TOOL>_FIXTURE) or for
+feeding the parsers directly:
+
+  python bench/fixtures.py --out bench/fixtures --nmap-ports 1000 --nuclei-matches 50000
+"""
+import argparse
+import json
+import os
+import random
+from typing import Iterator
+
+SERVICES = [
+    ("ssh", "OpenSSH", "8.9p1"), ("http", "nginx", "1.18.0"), ("https", "nginx", "1.18.0"),
+    ("mysql", "MySQL", "5.7.42"), ("ftp", "vsftpd", "3.0.3"), ("smtp", "Postfix smtpd", ""),
+    ("telnet", "", ""), ("http-proxy", "Squid http proxy", "4.13"), ("rdp", "", ""), ("redis", "Redis", "6.0.16"),
+]
+SEVERITIES = ["critical", "high", "medium", "low", "info"]
+NIKTO_MESSAGES = [
+    "The anti-clickjacking X-Frame-Options header is not present.",
+    "The X-Content-Type-Options header is not set.",
+    "Apache default file found.",
+    "Directory indexing found.",
+    "Server may leak inodes via ETags.",
+    "Admin login page/section found.",
+]
+
+
+def nmap_xml(host: str, ports: int, seed: int = 0) -> Iterator[str]:
+    rng = random.Random(f"nmap:{host}:{seed}")
+    yield '<?xml version="1.0"?>'
+    yield f'<nmaprun scanner="nmap" args="nmap -sV -F -oX - {host}">'
+    yield (
+        f'<host><address addr="10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}" '
+        f'addrtype="ipv4"/><hostnames><hostname name="{host}"/></hostnames><ports>'
+    )
+    for port in sorted(rng.sample(range(1, 65536), min(ports, 65535))):
+        name, product, version = rng.choice(SERVICES)
+        tunnel = ' tunnel="ssl"' if name == "https" else ""
+        yield (
+            f'<port protocol="tcp" portid="{port}"><state state="open"/>'
+            f'<service name="{name}" product="{product}" version="{version}"{tunnel}/></port>'
+        )
+    yield "</ports></host>"
+    yield '<runstats><finished time="1"/></runstats></nmaprun>'
+
+
+def nuclei_jsonl(target: str, matches: int, seed: int = 0) -> Iterator[str]:
+    rng = random.Random(f"nuclei:{target}:{seed}")
+    host = target.split("://")[-1].split("/")[0]
+    for i in range(matches):
+        year = rng.randrange(2015, 2025)
+        yield json.dumps({
+            "template-id": f"CVE-{year}-{rng.randrange(1000, 50000)}",
+            "info": {
+                "name": f"Synthetic check {i}",
+                "severity": rng.choice(SEVERITIES),
+                "description": "Generated for benchmarking. " * rng.randrange(1, 6),
+                "reference": [f"https://example.invalid/{i}"],
+            },
+            "host": host,
+            "port": str(rng.choice([80, 443, 8080, 8443])),
+            "matched-at": f"{target.rstrip('/')}/path/{i}",
+        })
+
+
+def nikto_lines(target: str, items: int, port: int = 80, seed: int = 0) -> Iterator[str]:
+    rng = random.Random(f"nikto:{target}:{seed}")
+    yield "- Nikto v2.5.0"
+    yield "+ Target IP:          10.0.0.5"
+    yield f"+ Target Hostname:    {target}"
+    yield f"+ Target Port:        {port}"
+    yield "+ Server: Apache/2.4.49"
+    for i in range(items):
+        yield f"+ /path{i}/: {rng.choice(NIKTO_MESSAGES)}"
+    yield f"+ 8102 requests: 0 error(s) and {items} item(s) reported on remote host"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+    parser.add_argument("--target", default="bench.local")
+    parser.add_argument("--nmap-ports", type=int, default=1000)
+    parser.add_argument("--nuclei-matches", type=int, default=50000)
+    parser.add_argument("--nikto-items", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    outputs = {
+        "nmap.xml": nmap_xml(args.target, args.nmap_ports, args.seed),
+        "nuclei.jsonl": nuclei_jsonl(f"http://{args.target}", args.nuclei_matches, args.seed),
+        "nikto.txt": nikto_lines(args.target, args.nikto_items, seed=args.seed),
+    }
+    for name, lines in outputs.items():
+        path = os.path.join(args.out, name)
+        with open(path, "w") as f:
+            for line in lines:
+                f.write(line + "\n")
+        print(f"{path}: {os.path.getsize(path) / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,473 @@
+"""Offline load scenarios for the backend, recorded to JSON for comparing commits.
+
+Starts the fake Messages API and the backend (pointed at it, with the stub
+scanners first on PATH and a throwaway database), runs each scenario and
+writes throughput, latency percentiles and backend memory to a JSON file:
+
+  python bench/load.py --out bench/results/$(git rev-parse --short HEAD).json
+  python bench/load.py --scenarios lists --dataset-scans 50000
+  python bench/load.py --compare bench/results/before.json bench/results/after.json
+
+Scenarios:
+  scan_start  concurrent POST /api/scans/start, then wait for every scan to finish
+  lists       scan and finding listings (filters, sorts, cursor paging) over a large seeded store
+  chat        concurrent POST /api/chat
+  export      stream every seeded finding as NDJSON and CSV, against walking /api/findings by cursor
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+SCENARIOS = ["scan_start", "lists", "chat", "export"]
+# Metrics where a bigger number is better; everything else (latency, memory) should shrink
+HIGHER_IS_BETTER = {"throughput", "scansPerSecond", "recordsPerSecond"}
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def summarize(latencies: List[float], errors: int, seconds: float) -> Dict[str, float]:
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "throughput": round(len(latencies) / seconds, 2) if seconds else 0.0,
+        "p50Ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p90Ms": round(percentile(latencies, 0.9) * 1000, 2),
+        "p99Ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "maxMs": round(max(latencies, default=0.0) * 1000, 2),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """Resident memory of a process (Linux /proc only)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+class MemorySampler:
+    """Peak backend RSS while a scenario runs"""
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _sample(self):
+        while True:
+            current = rss_mb(self.pid)
+            if current is not None:
+                self.peak = max(self.peak or 0.0, current)
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._sample())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+async def hammer(
+    client: httpx.AsyncClient, make_request: Callable[[int], tuple], total: int, concurrency: int,
+    ok_status=(200,),
+) -> Dict[str, float]:
+    """Send `total` requests from `concurrency` workers; make_request(i) -> (method, url, json)"""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, url, body = make_request(i)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, json=body)
+                ok = response.status_code in ok_status
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def scenario_scan_start(client: httpx.AsyncClient, args) -> Dict[str, dict]:
+    tools = args.tools.split(",")
+    # Distinct targets: the scheduler never runs two scans of one target at once
+    run = uuid.uuid4().hex[:6]
+    submitted: List[str] = []
+
+    def start(i: int):
+        return "POST", "/api/scans/start", {"target": f"host-{run}-{i}.bench", "tools": tools}
+
+    started = time.perf_counter()
+    submit = await hammer(client, start, args.scans, args.concurrency)
+    pending = True
+    while pending and time.perf_counter() - started < args.scan_timeout:
+        await asyncio.sleep(0.5)
+        response = await client.get("/api/scans", params={"limit": args.scans + 10, "fields": "id,target,status"})
+        mine = [s for s in response.json()["scans"] if s["target"].startswith(f"host-{run}-")]
+        submitted = [s["id"] for s in mine]
+        pending = any(s["status"] in ("Queued", "In Progress") for s in mine)
+    elapsed = time.perf_counter() - started
+    finished = {
+        "scans": len(submitted),
+        "timedOut": pending,
+        "seconds": round(elapsed, 3),
+        "scansPerSecond": round(len(submitted) / elapsed, 3) if elapsed else 0.0,
+    }
+    return {"submit": submit, "complete": finished}
+
+
+async def scenario_lists(client: httpx.AsyncClient, args) -> Dict[str, dict]:
+    queries = {
+        "scans_page": ("/api/scans", {"limit": 50}),
+        "scans_by_risk": ("/api/scans", {"limit": 50, "sort": "-riskScore"}),
+        "findings_page": ("/api/findings", {"limit": 100}),
+        "findings_critical": ("/api/findings", {"limit": 100, "severity": "Critical", "sort": "-severity"}),
+        "findings_fields": ("/api/findings", {"limit": 500, "fields": "id,severity,title"}),
+    }
+    results = {}
+    for name, (path, params) in queries.items():
+        results[name] = await hammer(
+            client, lambda i: ("GET", httpx.URL(path, params=params), None), args.requests, args.concurrency
+        )
+
+    # Walk the whole scan listing by cursor, as an export or dashboard would
+    latencies, cursor, pages = [], None, 0
+    started = time.perf_counter()
+    while pages < args.max_pages:
+        params = {"limit": 200, **({"cursor": cursor} if cursor else {})}
+        page_started = time.perf_counter()
+        data = (await client.get("/api/scans", params=params)).json()
+        latencies.append(time.perf_counter() - page_started)
+        pages += 1
+        cursor = data.get("nextCursor")
+        if not cursor:
+            break
+    results["scans_cursor_walk"] = {**summarize(latencies, 0, time.perf_counter() - started), "pages": pages}
+    return results
+
+
+async def scenario_chat(client: httpx.AsyncClient, args) -> Dict[str, dict]:
+    prompts = ["Which services should I patch first?", "Summarize the riskiest hosts.", "Is telnet exposed anywhere?"]
+    return {"chat": await hammer(
+        client, lambda i: ("POST", "/api/chat", {"prompt": prompts[i % len(prompts)]}), args.requests, args.concurrency
+    )}
+
+
+async def timed_download(client: httpx.AsyncClient, url: str, params: dict) -> Dict[str, float]:
+    """Read a streamed response to the end, counting lines as records"""
+    records, size = 0, 0
+    started = time.perf_counter()
+    first = None
+    async with client.stream("GET", url, params=params) as response:
+        async for chunk in response.aiter_bytes():
+            if first is None:
+                first = time.perf_counter() - started
+            size += len(chunk)
+            records += chunk.count(b"\n")
+    elapsed = time.perf_counter() - started
+    if params.get("format") == "csv":
+        records -= 1  # header row
+    return {
+        "records": records,
+        "bytes": size,
+        "seconds": round(elapsed, 3),
+        "firstByteMs": round((first or elapsed) * 1000, 2),
+        "recordsPerSecond": round(records / elapsed) if elapsed else 0,
+    }
+
+
+async def scenario_export(client: httpx.AsyncClient, args) -> Dict[str, dict]:
+    results = {
+        "ndjson": await timed_download(client, "/api/findings/export", {"format": "ndjson"}),
+        "csv": await timed_download(client, "/api/findings/export", {"format": "csv"}),
+    }
+
+    # What a SIEM export had to do before: page through the JSON listing
+    records, size, cursor = 0, 0, None
+    started = time.perf_counter()
+    first = None
+    while True:
+        response = await client.get("/api/findings", params={"limit": 1000, **({"cursor": cursor} if cursor else {})})
+        if first is None:
+            first = time.perf_counter() - started
+        size += len(response.content)
+        data = response.json()
+        records += len(data["findings"])
+        cursor = data.get("nextCursor")
+        if not cursor:
+            break
+    elapsed = time.perf_counter() - started
+    results["list_walk"] = {
+        "records": records,
+        "bytes": size,
+        "seconds": round(elapsed, 3),
+        "firstByteMs": round(first * 1000, 2),
+        "recordsPerSecond": round(records / elapsed) if elapsed else 0,
+    }
+    return results
+
+
+SCENARIO_RUNNERS = {
+    "scan_start": scenario_scan_start,
+    "lists": scenario_lists,
+    "chat": scenario_chat,
+    "export": scenario_export,
+}
+
+
+def seed_store(path: str, scans: int, findings_per_scan: int):
+    """Fill a fresh SQLite store directly, far faster than going through the API"""
+    sys.path.insert(0, BACKEND_DIR)
+    from models import Finding, FindingStatus, Scan, ScanStatus, Severity, Tool
+    from storage import SQLiteRepository
+
+    rng = random.Random(0)
+    now = datetime.now()
+    repo = SQLiteRepository(path)
+
+    async def fill():
+        batch = 1000
+        for offset in range(0, scans, batch):
+            scan_batch, finding_batch = [], []
+            for i in range(offset, min(scans, offset + batch)):
+                scan_id = str(uuid.UUID(int=rng.getrandbits(128)))
+                target = f"seed-{i % 5000}.bench"
+                scan_batch.append(Scan(
+                    id=scan_id, target=target, tools=[Tool.NMAP, Tool.NUCLEI],
+                    startedAt=(now - timedelta(minutes=i)).isoformat(),
+                    status=rng.choice([ScanStatus.COMPLETED, ScanStatus.CLEAN, ScanStatus.FAILED]),
+                    issues=rng.randrange(20), critical=rng.randrange(4), durationMinutes=rng.randrange(30),
+                    riskScore=rng.randrange(101), summary="Seeded for benchmarking", aiSummary="",
+                ))
+                for j in range(findings_per_scan):
+                    finding_batch.append(Finding(
+                        id=str(uuid.UUID(int=rng.getrandbits(128))), scanId=scan_id, host=target,
+                        port=rng.choice([22, 80, 443, 8443]), service="http",
+                        severity=rng.choice(list(Severity)), tool=rng.choice([Tool.NMAP, Tool.NUCLEI]),
+                        status=FindingStatus.OPEN, title=f"Seeded finding {j}",
+                        description="Generated for benchmarking", recommendation="None",
+                    ))
+            await repo.save_scans(scan_batch)
+            await repo.save_findings(finding_batch)
+        await repo.close()
+
+    asyncio.run(fill())
+
+
+def start_servers(args, workdir: str) -> List[subprocess.Popen]:
+    llm_port, api_port = free_port(), free_port()
+    env = {
+        **os.environ,
+        "FAKE_LLM_LATENCY": str(args.llm_latency),
+        "FAKE_LLM_TOKEN_DELAY": str(args.llm_token_delay),
+    }
+    fake_llm = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "fake_llm.py"), "--port", str(llm_port)], env=env
+    )
+    env.update({
+        "PATH": os.path.join(BENCH_DIR, "stubs") + os.pathsep + os.environ.get("PATH", ""),
+        "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{llm_port}",
+        "ANTHROPIC_API_KEY": "bench",
+        "STORAGE_BACKEND": "sqlite",
+        "DATABASE_PATH": os.path.join(workdir, "bench.db"),
+        "ANALYSIS_CACHE_DIR": os.path.join(workdir, "analysis"),
+        "TOOL_CACHE_DIR": os.path.join(workdir, "tools"),
+        "RETRIEVAL_DIR": os.path.join(workdir, "retrieval"),
+        "ARCHIVE_DIR": os.path.join(workdir, "archive"),
+        "JOB_QUEUE_PATH": os.path.join(workdir, "jobs.db"),
+        "BATCH_DB_PATH": os.path.join(workdir, "batches.db"),
+        "SCAN_QUEUE_SIZE": str(max(1000, args.scans * 2)),
+        "LLM_REQUESTS_PER_MINUTE": "1000000",
+        "LLM_INPUT_TOKENS_PER_MINUTE": "1000000000",
+        "STUB_LATENCY": str(args.tool_latency),
+        "STUB_SIZE": str(args.tool_size),
+    })
+    if not args.tool_cache:
+        env.update({f"TOOL_CACHE_TTL_{tool}": "0" for tool in ("NMAP", "NIKTO", "NUCLEI")})
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL if args.quiet else None,
+    )
+    args.base_url = f"http://127.0.0.1:{api_port}"
+    return [fake_llm, backend]
+
+
+async def wait_healthy(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Backend at {base_url} did not come up within {timeout:.0f}s")
+
+
+async def run_scenarios(args, backend_pid: Optional[int]) -> Dict[str, dict]:
+    await wait_healthy(args.base_url)
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=120, limits=limits) as client:
+        for name in args.scenarios:
+            print(f"Running {name}...")
+            sampler = MemorySampler(backend_pid) if backend_pid else None
+            if sampler:
+                with sampler:
+                    result = await SCENARIO_RUNNERS[name](client, args)
+            else:
+                result = await SCENARIO_RUNNERS[name](client, args)
+            result["memory"] = {
+                "peakRssMb": sampler.peak if sampler else None,
+                "endRssMb": rss_mb(backend_pid) if backend_pid else None,
+            }
+            results[name] = result
+            print(json.dumps(result, indent=2))
+    return results
+
+
+def git_revision() -> Dict[str, object]:
+    def git(*cmd):
+        return subprocess.run(["git", *cmd], cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip()
+
+    try:
+        return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain"))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+
+def compare(before_path: str, after_path: str, threshold: float) -> int:
+    """Print every shared metric side by side; exit status 1 if any regressed past threshold %"""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{'metric':<52}{'before':>12}{'after':>12}{'change':>10}")
+    regressions = 0
+    for scenario, groups in after["scenarios"].items():
+        for group, values in groups.items():
+            old_values = before["scenarios"].get(scenario, {}).get(group, {})
+            for metric, value in values.items():
+                old = old_values.get(metric)
+                if not isinstance(value, (int, float)) or isinstance(value, bool) or not old:
+                    continue
+                change = (value - old) / old * 100
+                worse = -change if metric in HIGHER_IS_BETTER else change
+                flag = ""
+                if metric not in ("requests", "errors", "pages", "scans", "records", "bytes") and worse > threshold:
+                    flag = "  <-- regression"
+                    regressions += 1
+                print(f"{scenario + '.' + group + '.' + metric:<52}{old:>12g}{value:>12g}{change:>+9.1f}%{flag}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend load benchmark")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated: {', '.join(SCENARIOS)}")
+    parser.add_argument("--out", help="write results JSON here (default: bench/results/<commit>.json)")
+    parser.add_argument("--base-url", help="benchmark an already running backend instead of starting one")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="requests per list/chat query")
+    parser.add_argument("--scans", type=int, default=50, help="scans submitted by scan_start")
+    parser.add_argument("--scan-timeout", type=float, default=300)
+    parser.add_argument("--tools", default="Nmap,Nuclei,Nikto")
+    parser.add_argument("--tool-latency", type=float, default=0.5, help="seconds each stub tool run takes")
+    parser.add_argument("--tool-size", type=int, default=10, help="ports/matches/items each stub tool prints")
+    parser.add_argument("--tool-cache", action="store_true", help="leave the tool output cache on")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-token-delay", type=float, default=0.02)
+    parser.add_argument("--dataset-scans", type=int, default=20000, help="scans seeded for lists and export")
+    parser.add_argument("--dataset-findings", type=int, default=5, help="findings seeded per scan")
+    parser.add_argument("--max-pages", type=int, default=1000)
+    parser.add_argument("--quiet", action="store_true", help="hide the backend's own output")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    parser.add_argument("--threshold", type=float, default=10.0, help="%% change counted as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(compare(*args.compare, args.threshold))
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    revision = git_revision()
+    started_at = datetime.now().isoformat()
+    with tempfile.TemporaryDirectory(prefix="recon-bench-") as workdir:
+        processes = []
+        backend_pid = None
+        try:
+            if not args.base_url:
+                if {"lists", "export"} & set(args.scenarios) and args.dataset_scans:
+                    print(f"Seeding {args.dataset_scans} scans x {args.dataset_findings} findings...")
+                    seed_store(os.path.join(workdir, "bench.db"), args.dataset_scans, args.dataset_findings)
+                processes = start_servers(args, workdir)
+                backend_pid = processes[-1].pid
+            results = asyncio.run(run_scenarios(args, backend_pid))
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                try:
+                    process.wait(10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    report = {
+        **revision,
+        "startedAt": started_at,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare", "out", "base_url")},
+        "scenarios": results,
+    }
+    out = args.out or os.path.join(BENCH_DIR, "results", f"{(revision['commit'] or 'local')[:12]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Listing serialization: FastAPI's default response path versus encode_page.
+
+Runs in-process with no server. For each page size it times how long
+turning a page of Finding models into response bytes takes:
+
+  default      return {"findings": items, ...} from the endpoint; FastAPI runs
+               jsonable_encoder over every field, then json.dumps
+  encode_page  pydantic-core encodes the whole page to bytes in one call
+  ndjson       the export path, one model_dump_json() per record
+
+  python bench/serialize.py --sizes 100,1000,10000 --out bench/results/serialize.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from export import encode_page  # noqa: E402
+from models import Finding, FindingStatus, Severity, Tool  # noqa: E402
+
+FINDING_LIST = TypeAdapter(List[Finding])
+
+
+def make_findings(count: int) -> List[Finding]:
+    rng = random.Random(0)
+    now = datetime.now()
+    return [
+        Finding(
+            id=str(uuid.UUID(int=rng.getrandbits(128))), scanId=str(uuid.UUID(int=rng.getrandbits(128))),
+            host=f"seed-{i % 500}.bench", port=rng.choice([22, 80, 443, 8443]), service="http",
+            severity=rng.choice(list(Severity)), tool=rng.choice([Tool.NMAP, Tool.NUCLEI]),
+            status=FindingStatus.OPEN, title=f"Seeded finding {i}",
+            description="Generated for benchmarking " * 4, recommendation="Upgrade the affected service",
+            createdAt=(now - timedelta(seconds=i)).isoformat(),
+        )
+        for i in range(count)
+    ]
+
+
+def default_path(items: List[Finding]) -> bytes:
+    # What FastAPI does with a dict returned from an endpoint (JSONResponse.render)
+    content = jsonable_encoder({"findings": items, "nextCursor": None, "revision": 1})
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def encode_page_path(items: List[Finding]) -> bytes:
+    return encode_page("findings", FINDING_LIST, items, nextCursor=None, revision=1)
+
+
+def ndjson_path(items: List[Finding]) -> bytes:
+    return b"".join(item.model_dump_json().encode() + b"\n" for item in items)
+
+
+ENCODERS: Dict[str, Callable[[List[Finding]], bytes]] = {
+    "default": default_path,
+    "encode_page": encode_page_path,
+    "ndjson": ndjson_path,
+}
+
+
+def measure(encode: Callable[[List[Finding]], bytes], items: List[Finding], repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = encode(items)
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    return {
+        "bestMs": round(best * 1000, 3),
+        "medianMs": round(sorted(timings)[len(timings) // 2] * 1000, 3),
+        "recordsPerSecond": round(len(items) / best) if best else 0,
+        "bytes": len(body),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Listing serialization benchmark")
+    parser.add_argument("--sizes", default="100,1000,10000", help="comma-separated page sizes")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--out", help="also write the results here as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for size in [int(s) for s in args.sizes.split(",")]:
+        items = make_findings(size)
+        # Same document either way, so the comparison is like for like
+        assert json.loads(default_path(items)) == json.loads(encode_page_path(items))
+        results[str(size)] = {name: measure(encode, items, args.repeat) for name, encode in ENCODERS.items()}
+        baseline = results[str(size)]["default"]["bestMs"]
+        for name, result in results[str(size)].items():
+            speedup = baseline / result["bestMs"] if result["bestMs"] else 0
+            print(f"{size:>7} findings  {name:<12} {result['bestMs']:>9.2f}ms  {speedup:>5.1f}x  {result['bytes']:>10} bytes")
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump({"startedAt": datetime.now().isoformat(), "sizes": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
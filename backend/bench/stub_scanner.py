@@ -0,0 +1,64 @@
+"""Stand-in for nmap, nikto and nuclei that prints synthetic output.
+
+The executables in bench/stubs/ call this with their own name, so putting
+that directory first on PATH makes the backend scan without touching the
+network. Behaviour is controlled per tool with environment variables
+(<TOOL> is NMAP, NIKTO or NUCLEI; the unprefixed STUB_LATENCY applies to all):
+
+  STUB_<TOOL>_LATENCY   seconds the run takes, spread over the output (default 0.5)
+  STUB_<TOOL>_SIZE      open ports / matches / items to print (default 10)
+  STUB_<TOOL>_FIXTURE   replay this file instead of generating output
+  STUB_SEED             vary the generated output (default 0)
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import nikto_lines, nmap_xml, nuclei_jsonl  # noqa: E402
+
+
+def setting(tool: str, name: str, default: str) -> str:
+    return os.environ.get(f"STUB_{tool.upper()}_{name}", os.environ.get(f"STUB_{name}", default))
+
+
+def option(args, flag: str, default: str = "") -> str:
+    return args[args.index(flag) + 1] if flag in args and args.index(flag) + 1 < len(args) else default
+
+
+def generate(tool: str, args, size: int, seed: int):
+    if tool == "nmap":
+        hosts = args[args.index("-") + 1:] if "-" in args else args[-1:]
+        documents = [list(nmap_xml(host, size, seed)) for host in hosts]
+        # One document with a <host> block per scanned host
+        return documents[0][:2] + [line for doc in documents for line in doc[2:-1]] + documents[0][-1:]
+    if tool == "nuclei":
+        return nuclei_jsonl(option(args, "-u", "http://localhost"), size, seed)
+    if tool == "nikto":
+        return nikto_lines(option(args, "-h", "localhost"), size, int(option(args, "-p", "80")), seed)
+    raise SystemExit(f"stub_scanner: unknown tool {tool}")
+
+
+def main(argv):
+    tool, args = argv[0], argv[1:]
+    latency = float(setting(tool, "LATENCY", "0.5"))
+    fixture = setting(tool, "FIXTURE", "")
+    if fixture:
+        with open(fixture) as f:
+            lines = f.read().splitlines()
+    else:
+        lines = list(generate(tool, args, int(setting(tool, "SIZE", "10")), int(os.environ.get("STUB_SEED", "0"))))
+
+    # Trickle the output out over the run like a real scanner, in ~20 bursts
+    bursts = max(1, min(20, len(lines)))
+    per_burst = -(-len(lines) // bursts)
+    for i in range(0, len(lines), per_burst):
+        time.sleep(latency / bursts)
+        sys.stdout.write("\n".join(lines[i:i + per_burst]) + "\n")
+        sys.stdout.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
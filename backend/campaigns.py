@@ -0,0 +1,216 @@
+import asyncio
+import fnmatch
+import ipaddress
+import itertools
+import multiprocessing
+import os
+import re
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from executor import gather_limited
+from models import Finding, Severity, Tool
+from parsers import ServiceRecord, digest
+from pipeline import HttpEndpoint, depends_on_discovery, http_endpoints, run_on_endpoint, skipped_output
+from scanners import TOOL_RUNNERS, ToolOutput, run_nmap_hosts
+
+# Worker processes shared by all campaigns
+CAMPAIGN_PROCESSES = int(os.environ.get("CAMPAIGN_PROCESSES", str(min(4, os.cpu_count() or 1))))
+# Hosts handed to one worker at a time (nmap covers the whole shard in one run)
+CAMPAIGN_SHARD_SIZE = int(os.environ.get("CAMPAIGN_SHARD_SIZE", "16"))
+# Per-host tools (nikto, nuclei, ...) run at once inside one shard, within its share of the tool limits
+CAMPAIGN_HOST_CONCURRENCY = int(os.environ.get("CAMPAIGN_HOST_CONCURRENCY", "4"))
+# Refuse target specs that expand past this many hosts
+CAMPAIGN_MAX_HOSTS = int(os.environ.get("CAMPAIGN_MAX_HOSTS", "4096"))
+
+# Contribution of each finding to a host's 0-100 risk score
+SEVERITY_WEIGHT: Dict[Severity, int] = {
+    Severity.CRITICAL: 40,
+    Severity.HIGH: 20,
+    Severity.MEDIUM: 8,
+    Severity.LOW: 2,
+    Severity.INFO: 0,
+}
+
+NUMERIC_RANGE = re.compile(r"\[(\d+)-(\d+)\]")
+# One <host> element of nmap XML (not <hostnames> or <hostscript>)
+NMAP_HOST_BLOCK = re.compile(r"<host[\s>].*?</host>", re.S)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+class InvalidTargets(ValueError):
+    pass
+
+
+def _expand_ranges(spec: str) -> List[str]:
+    """web-[01-03].corp -> web-01.corp, web-02.corp, web-03.corp"""
+    parts = NUMERIC_RANGE.split(spec)
+    literals, ranges = parts[::3], list(zip(parts[1::3], parts[2::3]))
+    choices = []
+    for start, end in ranges:
+        width = len(start) if start.startswith("0") else 0
+        choices.append([str(n).zfill(width) for n in range(int(start), int(end) + 1)])
+    hosts = []
+    for combo in itertools.product(*choices):
+        hosts.append("".join(lit + num for lit, num in zip(literals, combo)) + literals[-1])
+        if len(hosts) > CAMPAIGN_MAX_HOSTS:
+            break
+    return hosts
+
+
+def expand_targets(specs: List[str], known_hosts: Iterable[str] = ()) -> List[str]:
+    """Hosts named by a list of hosts, CIDR ranges, numeric ranges and globs.
+
+    Globs (* and ?) can't be enumerated from DNS, so they are matched
+    against targets that have been scanned before.
+    """
+    hosts: Dict[str, None] = {}
+    for spec in specs:
+        spec = spec.strip()
+        if not spec:
+            continue
+        if "/" in spec:
+            try:
+                network = ipaddress.ip_network(spec, strict=False)
+            except ValueError:
+                raise InvalidTargets(f"Invalid CIDR range {spec!r}")
+            if network.num_addresses > CAMPAIGN_MAX_HOSTS + 2:
+                raise InvalidTargets(f"{spec} has more than {CAMPAIGN_MAX_HOSTS} hosts")
+            expanded = [str(ip) for ip in network.hosts()] or [str(network.network_address)]
+        elif NUMERIC_RANGE.search(spec):
+            expanded = _expand_ranges(spec)
+        elif "*" in spec or "?" in spec:
+            expanded = [host for host in known_hosts if fnmatch.fnmatch(host.lower(), spec.lower())]
+        else:
+            expanded = [spec]
+        for host in expanded:
+            hosts[host] = None
+        if len(hosts) > CAMPAIGN_MAX_HOSTS:
+            raise InvalidTargets(f"Targets expand to more than {CAMPAIGN_MAX_HOSTS} hosts")
+    if not hosts:
+        raise InvalidTargets("Targets did not match any hosts")
+    return list(hosts)
+
+
+def shard(hosts: List[str], size: int = CAMPAIGN_SHARD_SIZE) -> List[List[str]]:
+    size = max(1, size)
+    return [hosts[i:i + size] for i in range(0, len(hosts), size)]
+
+
+def score_findings(findings: List[Finding]) -> Tuple[int, int, int]:
+    """(issues, critical, riskScore) for one host from its parsed findings"""
+    issues = sum(1 for f in findings if f.severity != Severity.INFO)
+    critical = sum(1 for f in findings if f.severity in (Severity.CRITICAL, Severity.HIGH))
+    risk = min(100, sum(SEVERITY_WEIGHT[f.severity] for f in findings))
+    return issues, critical, risk
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: forking a process that holds an event loop and DB threads is not safe
+        _pool = ProcessPoolExecutor(CAMPAIGN_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_process_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def shard_tool_limits(tool_limits: Dict[Tool, int], parallel_shards: int) -> Dict[Tool, int]:
+    """Each shard's share of the scheduler's per-tool limits, so shards running side by side stay within them"""
+    return {tool: max(1, limit // max(1, parallel_shards)) for tool, limit in tool_limits.items()}
+
+
+def scan_shard(hosts: List[str], tools: List[Tool], tool_limits: Dict[Tool, int]) -> Dict[str, List[ToolOutput]]:
+    """Pool entry point: run every tool against one shard of hosts"""
+    return asyncio.run(_scan_shard(hosts, tools, tool_limits))
+
+
+def _split_by_host(records: List[ServiceRecord], hosts: List[str]) -> Dict[str, List[ServiceRecord]]:
+    lookup = {host.lower(): host for host in hosts}
+    by_host: Dict[str, List[ServiceRecord]] = {host: [] for host in hosts}
+    for record in records:
+        host = lookup.get(record.hostname.lower()) or lookup.get(record.address)
+        if host is not None:
+            by_host[host].append(record)
+    return by_host
+
+
+def _split_nmap_xml(raw: str, hosts: List[str]) -> Dict[str, str]:
+    """Each host's share of one multi-host `nmap -oX -` document: its <host> element inside the shared header and trailer"""
+    lookup = {host.lower(): host for host in hosts}
+    blocks = list(NMAP_HOST_BLOCK.finditer(raw))
+    if not blocks:
+        return {}
+    header, trailer = raw[:blocks[0].start()], raw[blocks[-1].end():]
+    by_host: Dict[str, List[str]] = {}
+    for block in blocks:
+        try:
+            elem = ET.fromstring(block.group())
+        except ET.ParseError:
+            continue
+        names = [addr.get("addr", "") for addr in elem.findall("address")]
+        names += [hostname.get("name", "") for hostname in elem.findall("hostnames/hostname")]
+        host = next((lookup[name.lower()] for name in names if name.lower() in lookup), None)
+        if host is not None:
+            by_host.setdefault(host, []).append(block.group())
+    return {host: header + "\n".join(parts) + trailer for host, parts in by_host.items()}
+
+
+def _failed(tool: Tool, error: Exception) -> ToolOutput:
+    return ToolOutput(tool, f"=== {tool.name} ===\nError running {tool.value}: {error}", ok=False)
+
+
+async def _scan_shard(hosts: List[str], tools: List[Tool], tool_limits: Dict[Tool, int]) -> Dict[str, List[ToolOutput]]:
+    results: Dict[str, List[ToolOutput]] = {host: [] for host in hosts}
+    endpoints: Dict[str, Optional[List[HttpEndpoint]]] = {host: None for host in hosts}
+    # This process cannot reach the scheduler's semaphores, so it keeps to its share of them
+    slots = {tool: asyncio.Semaphore(tool_limits.get(tool, 1)) for tool in tools}
+
+    if Tool.NMAP in tools:
+        try:
+            async with slots[Tool.NMAP]:
+                output = await run_nmap_hosts(hosts)
+            raw = _split_nmap_xml(output.raw, hosts)
+            for host, records in _split_by_host(output.records, hosts).items():
+                results[host].append(
+                    ToolOutput(Tool.NMAP, f"=== NMAP ===\n{digest(Tool.NMAP, records)}", raw.get(host, ""), records)
+                )
+                endpoints[host] = http_endpoints(records, host)
+        except Exception as e:
+            for host in hosts:
+                results[host].append(_failed(Tool.NMAP, e))
+
+    async def run_one(host: str, tool: Tool, endpoint: Optional[HttpEndpoint] = None) -> Tuple[str, ToolOutput]:
+        try:
+            async with slots[tool]:
+                if endpoint is None:
+                    output = await TOOL_RUNNERS[tool](host)
+                else:
+                    output = await run_on_endpoint(tool, endpoint)
+            return host, output
+        except Exception as e:
+            return host, _failed(tool, e)
+
+    per_host = []
+    for host in hosts:
+        for tool in tools:
+            if tool == Tool.NMAP:
+                continue
+            if not depends_on_discovery(tool, tools):
+                per_host.append(run_one(host, tool))
+            elif endpoints[host] is None:
+                results[host].append(_failed(tool, RuntimeError("nmap discovery failed")))
+            elif not endpoints[host]:
+                results[host].append(skipped_output(tool, "nmap found no HTTP(S) services"))
+            else:
+                per_host.extend(run_one(host, tool, endpoint) for endpoint in endpoints[host])
+    for host, output in await gather_limited(per_host, CAMPAIGN_HOST_CONCURRENCY):
+        results[host].append(output)
+    return results
@@ -0,0 +1,54 @@
+import os
+from collections import OrderedDict, deque
+from typing import Deque, List, Tuple
+
+from llm import estimate_tokens
+
+# Exchanges remembered per chat session
+CHAT_HISTORY_TURNS = int(os.environ.get("CHAT_HISTORY_TURNS", "10"))
+# Most tokens of earlier exchanges replayed into a prompt; the oldest are dropped first
+CHAT_HISTORY_TOKENS = int(os.environ.get("CHAT_HISTORY_TOKENS", "2000"))
+# Sessions kept in memory; the least recently used are forgotten
+CHAT_SESSIONS = int(os.environ.get("CHAT_SESSIONS", "1000"))
+
+
+class ChatSessions:
+    """Recent question/answer pairs per chat session, kept in this process.
+
+    window() returns the newest exchanges that fit CHAT_HISTORY_TOKENS as
+    alternating user/assistant messages, so a long conversation costs the
+    same per request as a short one.
+    """
+
+    def __init__(self, max_sessions: int = CHAT_SESSIONS, turns: int = CHAT_HISTORY_TURNS):
+        self.max_sessions = max_sessions
+        self.turns = turns
+        self._sessions: "OrderedDict[str, Deque[Tuple[str, str]]]" = OrderedDict()
+
+    def window(self, session_id: str, budget: int = CHAT_HISTORY_TOKENS) -> List[dict]:
+        exchanges = self._sessions.get(session_id)
+        if not exchanges:
+            return []
+        self._sessions.move_to_end(session_id)
+        kept: List[Tuple[str, str]] = []
+        used = 0
+        for prompt, reply in reversed(exchanges):
+            tokens = estimate_tokens(prompt) + estimate_tokens(reply)
+            if used + tokens > budget:
+                break
+            kept.append((prompt, reply))
+            used += tokens
+        messages = []
+        for prompt, reply in reversed(kept):
+            messages.append({"role": "user", "content": prompt})
+            messages.append({"role": "assistant", "content": reply})
+        return messages
+
+    def record(self, session_id: str, prompt: str, reply: str):
+        exchanges = self._sessions.get(session_id)
+        if exchanges is None:
+            exchanges = self._sessions[session_id] = deque(maxlen=self.turns)
+        self._sessions.move_to_end(session_id)
+        exchanges.append((prompt, reply))
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
@@ -0,0 +1,76 @@
+import os
+import re
+from collections import OrderedDict
+from typing import Dict, List
+
+from llm import estimate_tokens
+
+# Prompt size above which a scan is analysed in chunks and merged (map-reduce)
+ANALYSIS_TOKEN_BUDGET = int(os.environ.get("ANALYSIS_TOKEN_BUDGET", "12000"))
+# Size of each chunk sent in the map stage
+ANALYSIS_CHUNK_TOKENS = int(os.environ.get("ANALYSIS_CHUNK_TOKENS", "6000"))
+# Lines sharing a shape are folded into one once there are at least this many
+ANALYSIS_FOLD_MIN = int(os.environ.get("ANALYSIS_FOLD_MIN", "3"))
+
+# Parts of a line that vary between otherwise identical findings
+SHAPE_FRAGMENTS = [
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"), "<ip>"),
+    (re.compile(r"\b[0-9a-f]{8,}\b", re.IGNORECASE), "<hex>"),
+    (re.compile(r"\d+"), "<n>"),
+]
+
+
+def line_shape(line: str) -> str:
+    """A line with its addresses, hashes and numbers blanked out"""
+    for pattern, replacement in SHAPE_FRAGMENTS:
+        line = pattern.sub(replacement, line)
+    return " ".join(line.split()).lower()
+
+
+def condense_section(section: str) -> str:
+    """Drop repeated lines and fold near-identical ones, keeping first-seen order"""
+    header, _, body = section.partition("\n")
+    groups: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+    for line in body.split("\n"):
+        line = line.rstrip()
+        if not line.strip():
+            continue
+        variants = groups.setdefault(line_shape(line), OrderedDict())
+        variants[line] = variants.get(line, 0) + 1
+
+    lines = [header]
+    for variants in groups.values():
+        if len(variants) >= ANALYSIS_FOLD_MIN:
+            first = next(iter(variants))
+            lines.append(f"{first} [+{sum(variants.values()) - 1} similar lines]")
+            continue
+        for line, count in variants.items():
+            lines.append(f"{line} [x{count}]" if count > 1 else line)
+    return "\n".join(lines)
+
+
+def condense(sections: List[str]) -> List[str]:
+    return [condense_section(section) for section in sections]
+
+
+def chunk_section(section: str, max_tokens: int = ANALYSIS_CHUNK_TOKENS) -> List[str]:
+    """Split a section on line boundaries; every chunk keeps the tool header"""
+    header, _, body = section.partition("\n")
+    max_chars = max_tokens * 4
+    chunks: List[str] = []
+    current: List[str] = []
+    size = len(header)
+    for line in body.split("\n"):
+        line = line[:max_chars]
+        if current and size + len(line) + 1 > max_chars:
+            chunks.append("\n".join([header] + current))
+            current, size = [], len(header)
+        current.append(line)
+        size += len(line) + 1
+    if current or not chunks:
+        chunks.append("\n".join([header] + current))
+    return chunks
+
+
+def over_budget(text: str, budget: int = ANALYSIS_TOKEN_BUDGET) -> bool:
+    return estimate_tokens(text) > budget
@@ -0,0 +1,102 @@
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Set
+
+from models import Finding, FindingChange, FindingStatus, Tool
+
+
+@dataclass
+class FindingDiff:
+    new: List[Finding] = field(default_factory=list)
+    changed: List[Finding] = field(default_factory=list)
+    unchanged: List[Finding] = field(default_factory=list)
+    resolved: List[Finding] = field(default_factory=list)
+    unverified: List[Finding] = field(default_factory=list)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.new or self.changed or self.resolved)
+
+    @property
+    def findings(self) -> List[Finding]:
+        return self.new + self.changed + self.unchanged + self.resolved + self.unverified
+
+
+def _fingerprint(finding: Finding) -> tuple:
+    # Title and description carry the service banner / matched URL, so a
+    # version bump on the same port shows up as a change
+    return (finding.severity, finding.title, finding.description)
+
+
+def diff_findings(
+    scan_id: str,
+    previous: List[Finding],
+    current: List[Finding],
+    compared_tools: Set[Tool],
+) -> FindingDiff:
+    """Compare a rescan's findings with the baseline scan's, matched by dedupKey.
+
+    Only tools that produced parsed results this time are compared, so a
+    tool that failed to run does not make its earlier findings look
+    resolved; those findings are carried over as unverified instead.
+    Triage status carries over to findings that are still there.
+    """
+    before: Dict[str, Finding] = {
+        f.dedupKey: f for f in previous
+        if f.dedupKey and f.tool in compared_tools and f.change != FindingChange.RESOLVED
+    }
+    diff = FindingDiff()
+    seen = set()
+
+    for finding in current:
+        prior = before.get(finding.dedupKey) if finding.tool in compared_tools else None
+        if prior is None:
+            diff.new.append(finding.model_copy(update={"change": FindingChange.NEW}))
+            continue
+        seen.add(finding.dedupKey)
+        status = prior.status if prior.status != FindingStatus.RESOLVED else FindingStatus.OPEN
+        if _fingerprint(prior) == _fingerprint(finding):
+            diff.unchanged.append(finding.model_copy(update={"status": status, "change": FindingChange.UNCHANGED}))
+        else:
+            diff.changed.append(finding.model_copy(update={"status": status, "change": FindingChange.CHANGED}))
+
+    for key, prior in before.items():
+        if key not in seen:
+            diff.resolved.append(_carried(prior, scan_id, FindingStatus.RESOLVED, FindingChange.RESOLVED))
+
+    reported = {finding.tool for finding in current}
+    for prior in previous:
+        if (prior.tool not in compared_tools and prior.tool not in reported
+                and prior.change != FindingChange.RESOLVED):
+            diff.unverified.append(_carried(prior, scan_id, prior.status, FindingChange.UNVERIFIED))
+    return diff
+
+
+def _carried(prior: Finding, scan_id: str, status: FindingStatus, change: FindingChange) -> Finding:
+    """A baseline finding copied into the rescan"""
+    return prior.model_copy(update={
+        "id": str(uuid.uuid4()),
+        "scanId": scan_id,
+        "status": status,
+        "change": change,
+        "createdAt": datetime.now().isoformat(),
+    })
+
+
+def _finding_line(finding: Finding) -> str:
+    where = f"{finding.host}:{finding.port}" if finding.port else finding.host
+    return f"[{finding.tool.value}] {finding.severity.value} {where} {finding.title}"
+
+
+def delta_text(diff: FindingDiff) -> str:
+    """What changed since the baseline, for the analysis prompt"""
+    parts = []
+    for label, findings in (("NEW", diff.new), ("CHANGED", diff.changed), ("RESOLVED", diff.resolved)):
+        if findings:
+            parts.append(f"=== {label} ===\n" + "\n".join(_finding_line(f) for f in findings))
+    parts.append(f"=== UNCHANGED ===\n{len(diff.unchanged)} findings are the same as in the previous scan")
+    if diff.unverified:
+        parts.append(f"=== NOT RE-VERIFIED ===\n{len(diff.unverified)} findings from tools that did not report "
+                     "this time are carried over from the previous scan")
+    return "\n\n".join(parts)
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Deque, Dict, List, Optional
+
+# Events kept per scan so a dashboard that connects late can catch up
+EVENT_HISTORY = 500
+# Finished scans whose event history is still kept around for replay
+CLOSED_CHANNELS = 200
+# Events buffered per subscriber before the slowest ones start dropping
+SUBSCRIBER_BUFFER = 1000
+
+# A deferred analysis ends the live part of a scan; "completed" follows once its batch is back
+TERMINAL_EVENTS = {"completed", "failed", "cancelled", "analysis_deferred"}
+
+
+class ScanChannel:
+    def __init__(self):
+        self.history: Deque[dict] = deque(maxlen=EVENT_HISTORY)
+        self.subscribers: List[asyncio.Queue] = []
+        self.closed = False
+        self.seq = 0
+
+
+class ScanEventBroadcaster:
+    """Fan-out of per-scan lifecycle events to any number of listeners.
+
+    publish() never blocks the scan: each subscriber has its own bounded
+    queue and a subscriber that falls too far behind loses its oldest
+    events rather than slowing everyone else down.
+    """
+
+    def __init__(self):
+        self._channels: "OrderedDict[str, ScanChannel]" = OrderedDict()
+
+    def _channel(self, scan_id: str) -> ScanChannel:
+        channel = self._channels.get(scan_id)
+        if channel is None:
+            channel = self._channels[scan_id] = ScanChannel()
+        return channel
+
+    def publish(self, scan_id: str, event_type: str, **data):
+        channel = self._channel(scan_id)
+        channel.seq += 1
+        event = {"id": channel.seq, "type": event_type, "scanId": scan_id, "ts": time.time(), **data}
+        channel.history.append(event)
+        for queue in channel.subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+        if event_type in TERMINAL_EVENTS:
+            channel.closed = True
+            self._prune()
+
+    def has_channel(self, scan_id: str) -> bool:
+        """Whether the scan's events are live or still kept for replay"""
+        return scan_id in self._channels
+
+    async def subscribe(self, scan_id: str, after: int = 0) -> AsyncIterator[dict]:
+        """Replay history newer than `after`, then follow live events until the scan ends"""
+        channel = self._channel(scan_id)
+        # Subscribe before replaying so nothing published mid-replay is lost
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+        channel.subscribers.append(queue)
+        last_id = after
+        try:
+            for event in list(channel.history):
+                if event["id"] > last_id:
+                    last_id = event["id"]
+                    yield event
+            if channel.closed:
+                return
+
+            while True:
+                event = await queue.get()
+                if event["id"] <= last_id:
+                    continue
+                last_id = event["id"]
+                yield event
+                if event["type"] in TERMINAL_EVENTS:
+                    return
+        finally:
+            channel.subscribers.remove(queue)
+
+    def _prune(self):
+        closed = [scan_id for scan_id, c in self._channels.items() if c.closed and not c.subscribers]
+        for scan_id in closed[:max(0, len(closed) - CLOSED_CHANNELS)]:
+            del self._channels[scan_id]
+
+
+def format_sse(event: Optional[dict]) -> str:
+    """Server-Sent Events framing; None produces a keep-alive comment"""
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def sse_event(event_type: str, data: dict) -> str:
+    """One-off SSE frame that is not part of a scan's event history"""
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional
+
+from limited_exec import USAGE_MARKER
+
+# Default number of tools a single scan may run at the same time
+SCAN_TOOL_CONCURRENCY = int(os.environ.get("SCAN_TOOL_CONCURRENCY", "4"))
+# Longest single output line we buffer (nuclei JSONL records can be large)
+STREAM_LINE_LIMIT = 1024 * 1024
+# How long a cancelled tool gets to exit on SIGTERM before its process group is SIGKILLed
+TOOL_KILL_GRACE_SECONDS = float(os.environ.get("TOOL_KILL_GRACE_SECONDS", "1"))
+
+LIMITED_EXEC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "limited_exec.py")
+# rlimits, process groups and rusage are POSIX-only; elsewhere tools run directly
+SUPPORTS_LIMITS = os.name == "posix"
+
+
+@dataclass
+class ToolLimits:
+    wall_seconds: float
+    cpu_seconds: Optional[int] = None
+    memory_mb: Optional[int] = None
+
+
+def limits_from_env(name: str, wall_seconds: float) -> ToolLimits:
+    """Defaults for one tool, overridable with e.g. TOOL_NUCLEI_WALL_SECONDS,
+    TOOL_NUCLEI_CPU_SECONDS and TOOL_NUCLEI_MEMORY_MB"""
+    def setting(suffix: str) -> Optional[str]:
+        return os.environ.get(f"TOOL_{name}_{suffix}") or None
+
+    cpu = setting("CPU_SECONDS")
+    memory = setting("MEMORY_MB")
+    return ToolLimits(
+        wall_seconds=float(setting("WALL_SECONDS") or wall_seconds),
+        cpu_seconds=int(cpu) if cpu else None,
+        memory_mb=int(memory) if memory else None,
+    )
+
+
+@dataclass
+class ResourceUsage:
+    cpu_seconds: float
+    peak_rss_kb: int
+    wall_seconds: float
+
+
+@dataclass
+class CommandResult:
+    args: List[str]
+    returncode: Optional[int]
+    stdout: str
+    stderr: str
+    usage: Optional[ResourceUsage] = None
+
+
+async def run_command(
+    args: List[str],
+    timeout: float,
+    on_line: Optional[Callable[[str], None]] = None,
+    cpu_seconds: Optional[int] = None,
+    memory_mb: Optional[int] = None,
+) -> CommandResult:
+    """Run a command without blocking the event loop.
+
+    Mirrors subprocess.run(capture_output=True, text=True, timeout=...):
+    a missing binary raises FileNotFoundError and an overrun raises
+    subprocess.TimeoutExpired after the child has been killed. If
+    `on_line` is given it is called with each stdout line as it arrives.
+
+    On POSIX the command runs in its own process group under the given
+    CPU and memory rlimits, and the result carries its resource usage.
+    Timeouts and cancellation terminate the whole group.
+    """
+    if SUPPORTS_LIMITS:
+        if shutil.which(args[0]) is None:
+            raise FileNotFoundError(2, "No such file or directory", args[0])
+        argv = [sys.executable, LIMITED_EXEC, str(cpu_seconds or "-"), str(memory_mb or "-"), "--", *args]
+    else:
+        argv = list(args)
+    proc = await asyncio.create_subprocess_exec(
+        *argv,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=STREAM_LINE_LIMIT,
+        start_new_session=SUPPORTS_LIMITS,
+    )
+    io = asyncio.gather(
+        _read_stream(proc.stdout, on_line),
+        _read_stream(proc.stderr, None),
+        proc.wait(),
+    )
+    # When the readers are cancelled below nobody awaits the gather again; mark its error as seen
+    io.add_done_callback(lambda f: f.cancelled() or f.exception())
+    try:
+        stdout, stderr, _ = await asyncio.wait_for(io, timeout)
+    except asyncio.TimeoutError:
+        await _kill(proc)
+        raise subprocess.TimeoutExpired(args, timeout)
+    except asyncio.CancelledError:
+        await _kill(proc)
+        raise
+
+    _sweep(proc)  # anything the tool left running in its group
+    stderr, usage = _split_usage(stderr)
+    return CommandResult(
+        args=args,
+        returncode=proc.returncode,
+        stdout=stdout,
+        stderr=stderr,
+        usage=usage,
+    )
+
+
+def _split_usage(stderr: str):
+    """Strip limited_exec's usage report off the end of stderr"""
+    index = stderr.rfind(USAGE_MARKER)
+    if index == -1:
+        return stderr, None
+    try:
+        report = json.loads(stderr[index + len(USAGE_MARKER):])
+    except ValueError:
+        return stderr, None
+    usage = ResourceUsage(
+        cpu_seconds=report["cpuSeconds"],
+        peak_rss_kb=report["peakRssKb"],
+        wall_seconds=report["wallSeconds"],
+    )
+    return stderr[:index], usage
+
+
+async def _read_stream(
+    stream: asyncio.StreamReader,
+    on_line: Optional[Callable[[str], None]],
+) -> str:
+    """Drain a pipe, handing each decoded line to `on_line` as soon as it is read"""
+    if on_line is None:
+        return (await stream.read()).decode(errors="replace")
+
+    chunks = []
+    while True:
+        raw = await stream.readline()
+        if not raw:
+            break
+        line = raw.decode(errors="replace")
+        chunks.append(line)
+        on_line(line.rstrip("\n"))
+    return "".join(chunks)
+
+
+def _signal(proc: asyncio.subprocess.Process, force: bool):
+    try:
+        if SUPPORTS_LIMITS:
+            os.killpg(proc.pid, signal.SIGKILL if force else signal.SIGTERM)
+        elif force:
+            proc.kill()
+        else:
+            proc.terminate()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _sweep(proc: asyncio.subprocess.Process):
+    if SUPPORTS_LIMITS:
+        _signal(proc, force=True)
+
+
+async def _kill(proc: asyncio.subprocess.Process):
+    """SIGTERM the process group, then SIGKILL it if it has not exited within the grace period"""
+    if proc.returncode is None:
+        _signal(proc, force=False)
+        try:
+            await asyncio.wait_for(proc.wait(), TOOL_KILL_GRACE_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+    if proc.returncode is None or SUPPORTS_LIMITS:
+        _signal(proc, force=True)
+    await proc.wait()
+
+
+async def gather_limited(coros: List[Awaitable], limit: int) -> list:
+    """Run awaitables concurrently, at most `limit` at a time.
+
+    Results come back in input order. If one raises, the others are
+    cancelled (killing their subprocesses) and the error propagates.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def bounded(coro):
+        async with semaphore:
+            return await coro
+
+    tasks = [asyncio.ensure_future(bounded(c)) for c in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Ones still waiting for a slot never started; close them so they are not left unawaited
+        for coro in coros:
+            if asyncio.iscoroutine(coro):
+                coro.close()
+        raise
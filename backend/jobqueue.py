@@ -0,0 +1,258 @@
+import json
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from models import ScanPriority
+from scheduler import PRIORITY_RANK, SCAN_QUEUE_SIZE, QueueFull, _normalize_target
+from storage import DATABASE_PATH, ConnectionPool, _migrate, _transaction
+
+# "inline" runs scans inside the API process; "queue" hands them to worker.py processes
+SCAN_EXECUTOR = os.environ.get("SCAN_EXECUTOR", "inline")
+JOB_QUEUE_PATH = os.environ.get(
+    "JOB_QUEUE_PATH", os.path.join(os.path.dirname(os.path.abspath(DATABASE_PATH)), "jobs.db")
+)
+# A leased job whose worker stops heartbeating for this long goes back on the queue
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("JOB_HEARTBEAT_SECONDS", "15"))
+# Leases a job may lose to crashed workers before it is failed instead of retried
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# How often workers write buffered scan events and the API picks them up
+JOB_EVENT_POLL_SECONDS = float(os.environ.get("JOB_EVENT_POLL_SECONDS", "0.25"))
+# Finished jobs and their relayed events are deleted after this long
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", "3600"))
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+JOB_STATES = (QUEUED, LEASED, DONE, FAILED, CANCELLED)
+
+# Why a worker no longer holds a job (see JobQueue.heartbeat)
+LEASE_LOST = "lost"
+
+JOB_MIGRATIONS = [
+    """
+    CREATE TABLE jobs (
+        id TEXT PRIMARY KEY,
+        target TEXT NOT NULL,
+        priority INTEGER NOT NULL,
+        payload TEXT NOT NULL,
+        state TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        worker TEXT,
+        leaseExpires REAL,
+        enqueuedAt REAL NOT NULL,
+        updatedAt REAL NOT NULL,
+        error TEXT
+    );
+    CREATE INDEX idx_jobs_ready ON jobs (state, priority);
+    CREATE INDEX idx_jobs_target ON jobs (target, state);
+    CREATE INDEX idx_jobs_updated_at ON jobs (updatedAt);
+    CREATE TABLE job_events (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        jobId TEXT NOT NULL,
+        data TEXT NOT NULL,
+        createdAt REAL NOT NULL
+    );
+    CREATE INDEX idx_job_events_job ON job_events (jobId);
+    """,
+]
+
+
+@dataclass
+class Job:
+    id: str  # the scan id
+    target: str
+    priority: ScanPriority
+    payload: dict
+    attempts: int = 0
+    worker: Optional[str] = None
+
+
+class JobQueue:
+    """Durable scan queue in its own SQLite file, shared by the API and any number of workers.
+
+    A worker leases the highest priority job whose target is not already
+    leased and renews the lease with heartbeat(). A job whose lease runs out
+    (its worker crashed or hung) is put back on the queue by the next reap()
+    and retried, up to JOB_MAX_ATTEMPTS leases.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, max_queue: int = SCAN_QUEUE_SIZE):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_queue = max_queue
+        self.pool = ConnectionPool(path, 2)
+        self.pool.run_sync(_migrate, JOB_MIGRATIONS)
+
+    async def enqueue(self, scan_id: str, target: str, priority: ScanPriority, payload: dict):
+        """Add a job, raising QueueFull when max_queue jobs are already waiting"""
+        await self.pool.run(_transaction, _enqueue, scan_id, target, priority, payload, self.max_queue)
+
+    async def lease(self, worker: str) -> Optional[Job]:
+        return await self.pool.run(_transaction, _lease, worker, time.time())
+
+    async def heartbeat(self, job_id: str, worker: str) -> Optional[str]:
+        """Extend the lease; returns None while it is held, else CANCELLED or LEASE_LOST"""
+        return await self.pool.run(_transaction, _heartbeat, job_id, worker, time.time())
+
+    async def finish(self, job_id: str, worker: str, state: str = DONE, error: Optional[str] = None) -> bool:
+        return await self.pool.run(_set_state, job_id, worker, state, error, False)
+
+    async def release(self, job_id: str, worker: str) -> bool:
+        """Hand a job back unfinished (the worker is shutting down); the lease does not count as an attempt"""
+        return await self.pool.run(_set_state, job_id, worker, QUEUED, None, True)
+
+    async def cancel(self, job_id: str) -> Optional[str]:
+        """Cancel a waiting or running job; returns the state it was in, or None if it had already ended"""
+        return await self.pool.run(_transaction, _cancel, job_id, time.time())
+
+    async def reap(self) -> List[Job]:
+        """Requeue jobs with expired leases and drop old finished ones; returns jobs that ran out of attempts"""
+        return await self.pool.run(_transaction, _reap, time.time())
+
+    async def is_active(self, job_id: str) -> bool:
+        rows = await self.pool.run(
+            _query, "SELECT 1 FROM jobs WHERE id = ? AND state IN (?, ?)", (job_id, QUEUED, LEASED)
+        )
+        return bool(rows)
+
+    async def positions(self) -> Dict[str, int]:
+        """1-based queue position of every waiting job"""
+        rows = await self.pool.run(
+            _query, "SELECT id FROM jobs WHERE state = ? ORDER BY priority, rowid", (QUEUED,)
+        )
+        return {row[0]: i + 1 for i, row in enumerate(rows)}
+
+    async def counts(self) -> Dict[str, int]:
+        rows = await self.pool.run(_query, "SELECT state, COUNT(*) FROM jobs GROUP BY state", ())
+        return {state: 0 for state in JOB_STATES} | dict(rows)
+
+    async def add_events(self, events: List[dict]):
+        """Record scan events published in a worker so the API can relay them to SSE clients"""
+        now = time.time()
+        rows = [(event["scanId"], json.dumps(event), now) for event in events]
+        await self.pool.run(_transaction, _insert_events, rows)
+
+    async def events_after(self, seq: int, limit: int = 1000) -> List[Tuple[int, dict]]:
+        rows = await self.pool.run(
+            _query, "SELECT seq, data FROM job_events WHERE seq > ? ORDER BY seq LIMIT ?", (seq, limit)
+        )
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    async def last_event(self) -> int:
+        rows = await self.pool.run(_query, "SELECT COALESCE(MAX(seq), 0) FROM job_events", ())
+        return rows[0][0]
+
+    async def close(self):
+        self.pool.close()
+
+
+def _query(conn: sqlite3.Connection, sql: str, params: tuple) -> list:
+    return conn.execute(sql, params).fetchall()
+
+
+JOB_FIELDS = "id, target, priority, payload, attempts, worker"
+PRIORITY_BY_RANK = {rank: priority for priority, rank in PRIORITY_RANK.items()}
+
+
+def _job(row) -> Job:
+    job_id, target, priority, payload, attempts, worker = row
+    return Job(job_id, target, PRIORITY_BY_RANK[priority], json.loads(payload), attempts, worker)
+
+
+def _enqueue(conn: sqlite3.Connection, scan_id: str, target: str, priority: ScanPriority, payload: dict,
+             max_queue: int):
+    waiting = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (QUEUED,)).fetchone()[0]
+    if waiting >= max_queue:
+        raise QueueFull(f"Scan queue is full ({max_queue} pending)")
+    now = time.time()
+    conn.execute(
+        "INSERT INTO jobs (id, target, priority, payload, state, enqueuedAt, updatedAt) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (scan_id, _normalize_target(target), PRIORITY_RANK[priority], json.dumps(payload), QUEUED, now, now),
+    )
+
+
+def _lease(conn: sqlite3.Connection, worker: str, now: float) -> Optional[Job]:
+    # Same rule as the in-process scheduler: one running scan per target
+    row = conn.execute(
+        f"""SELECT {JOB_FIELDS} FROM jobs WHERE state = ?
+            AND target NOT IN (SELECT target FROM jobs WHERE state = ?)
+            ORDER BY priority, rowid LIMIT 1""",
+        (QUEUED, LEASED),
+    ).fetchone()
+    if row is None:
+        return None
+    job = _job(row)
+    job.attempts += 1
+    job.worker = worker
+    conn.execute(
+        "UPDATE jobs SET state = ?, worker = ?, attempts = ?, leaseExpires = ?, updatedAt = ? WHERE id = ?",
+        (LEASED, worker, job.attempts, now + JOB_LEASE_SECONDS, now, job.id),
+    )
+    return job
+
+
+def _heartbeat(conn: sqlite3.Connection, job_id: str, worker: str, now: float) -> Optional[str]:
+    renewed = conn.execute(
+        "UPDATE jobs SET leaseExpires = ?, updatedAt = ? WHERE id = ? AND worker = ? AND state = ?",
+        (now + JOB_LEASE_SECONDS, now, job_id, worker, LEASED),
+    ).rowcount
+    if renewed:
+        return None
+    row = conn.execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return CANCELLED if row and row[0] == CANCELLED else LEASE_LOST
+
+
+def _set_state(conn: sqlite3.Connection, job_id: str, worker: str, state: str, error: Optional[str],
+               refund: bool) -> bool:
+    return bool(conn.execute(
+        f"""UPDATE jobs SET state = ?, error = ?, worker = NULL, leaseExpires = NULL, updatedAt = ?
+            {", attempts = attempts - 1" if refund else ""}
+            WHERE id = ? AND worker = ? AND state = ?""",
+        (state, error, time.time(), job_id, worker, LEASED),
+    ).rowcount)
+
+
+def _cancel(conn: sqlite3.Connection, job_id: str, now: float) -> Optional[str]:
+    row = conn.execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None or row[0] not in (QUEUED, LEASED):
+        return None
+    # A leased job keeps its worker so the worker's next heartbeat sees the cancellation
+    conn.execute("UPDATE jobs SET state = ?, updatedAt = ? WHERE id = ?", (CANCELLED, now, job_id))
+    return row[0]
+
+
+def _reap(conn: sqlite3.Connection, now: float) -> List[Job]:
+    expired = [
+        _job(row) for row in conn.execute(
+            f"SELECT {JOB_FIELDS} FROM jobs WHERE state = ? AND leaseExpires < ?", (LEASED, now)
+        ).fetchall()
+    ]
+    dead = []
+    for job in expired:
+        error = f"worker {job.worker} stopped heartbeating"
+        state = QUEUED if job.attempts < JOB_MAX_ATTEMPTS else FAILED
+        conn.execute(
+            "UPDATE jobs SET state = ?, worker = NULL, leaseExpires = NULL, error = ?, updatedAt = ? WHERE id = ?",
+            (state, error, now, job.id),
+        )
+        print(f"Job {job.id}: {error} (attempt {job.attempts}/{JOB_MAX_ATTEMPTS}), "
+              + ("requeued" if state == QUEUED else "giving up"))
+        if state == FAILED:
+            dead.append(job)
+
+    cutoff = now - JOB_RETENTION_SECONDS
+    conn.execute(
+        "DELETE FROM jobs WHERE state IN (?, ?, ?) AND updatedAt < ?", (DONE, FAILED, CANCELLED, cutoff)
+    )
+    conn.execute("DELETE FROM job_events WHERE createdAt < ?", (cutoff,))
+    return dead
+
+
+def _insert_events(conn: sqlite3.Connection, rows: List[tuple]):
+    conn.executemany("INSERT INTO job_events (jobId, data, createdAt) VALUES (?, ?, ?)", rows)
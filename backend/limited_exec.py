@@ -0,0 +1,60 @@
+"""Run one scanner tool under resource limits and report what it used.
+
+    python limited_exec.py <cpu_seconds|-> <memory_mb|-> -- tool args...
+
+The tool's stdout and stderr pass straight through. When it exits, a
+single USAGE_MARKER line with its rusage is appended to stderr and this
+process exits with the tool's own status. The server starts it as the
+leader of a new process group, so signalling the group reaches the tool
+and anything the tool spawned.
+"""
+import json
+import os
+import resource
+import signal
+import subprocess
+import sys
+import time
+
+USAGE_MARKER = "__TOOL_USAGE__ "
+
+
+def _apply_limits(cpu_seconds, memory_mb):
+    def apply():
+        if cpu_seconds:
+            # Soft limit sends SIGXCPU, the hard limit a few seconds later is SIGKILL
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 5))
+        if memory_mb:
+            limit = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    return apply
+
+
+def main(argv):
+    cpu, memory, _, *args = argv
+    cpu_seconds = int(cpu) if cpu != "-" else None
+    memory_mb = int(memory) if memory != "-" else None
+
+    started = time.monotonic()
+    proc = subprocess.Popen(args, preexec_fn=_apply_limits(cpu_seconds, memory_mb))
+    # SIGTERM goes to the whole group: let the tool act on it, then still report its usage.
+    # (Set after Popen, since an ignored signal would be inherited by the tool.)
+    signal.signal(signal.SIGTERM, lambda *_: None)
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    # ru_maxrss is kilobytes on Linux but bytes on macOS
+    peak_rss_kb = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    report = {
+        "cpuSeconds": usage.ru_utime + usage.ru_stime,
+        "peakRssKb": peak_rss_kb,
+        "wallSeconds": time.monotonic() - started,
+    }
+    sys.stderr.write(USAGE_MARKER + json.dumps(report) + "\n")
+    sys.stderr.flush()
+    code = proc.returncode
+    return code if code >= 0 else 128 - code
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from enum import Enum
+from typing import Dict, List, Optional
+
+import anthropic
+import httpx
+
+from metrics import LLM_REQUEST, LLM_RETRIES, LLM_THROTTLE, LLM_TOKENS
+
+LLM_MODEL = "claude-sonnet-4-20250514"
+
+# Match these to the API tier the key belongs to
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get("LLM_REQUESTS_PER_MINUTE", "50"))
+LLM_INPUT_TOKENS_PER_MINUTE = int(os.environ.get("LLM_INPUT_TOKENS_PER_MINUTE", "40000"))
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "5"))
+
+# Share of the rate budget that background analyses may never touch,
+# so chat keeps moving while a batch of scans is being analysed
+LLM_INTERACTIVE_RESERVE = float(os.environ.get("LLM_INTERACTIVE_RESERVE", "0.2"))
+
+RETRYABLE_STATUS = {429, 529}
+
+
+class Lane(str, Enum):
+    INTERACTIVE = "interactive"  # chat: latency sensitive
+    BACKGROUND = "background"    # scan analysis: throughput only
+
+
+class TokenBucket:
+    """Continuous-refill token bucket.
+
+    `reserve` lets low-priority callers stop short of an empty bucket so
+    that higher-priority callers always find some capacity left.
+    """
+
+    def __init__(self, capacity: float, per_seconds: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0, reserve: float = 0.0):
+        # A single request larger than the whole bucket would never fit
+        amount = min(amount, self.capacity - reserve)
+        while True:
+            async with self._lock:
+                self._refill()
+                if self.tokens - amount >= reserve:
+                    self.tokens -= amount
+                    return
+                wait = (amount + reserve - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough prompt size: ~4 characters per token for English and tool output"""
+    return len(text) // 4 + 1
+
+
+def _prompt_tokens(messages) -> int:
+    total = 0
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str):
+            total += estimate_tokens(content)
+        else:
+            total += sum(estimate_tokens(block.get("text", "")) for block in content)
+    return total
+
+
+class LLMGateway:
+    """Shared async entry point for every Anthropic call the backend makes.
+
+    One pooled HTTP client, a cap on in-flight requests per lane, request
+    and input-token buckets sized to the API tier, and jittered
+    exponential backoff on 429/529. Swap it out with set_gateway() or
+    point it at a fake server with base_url / ANTHROPIC_BASE_URL.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        concurrency: int = LLM_CONCURRENCY,
+        requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+        input_tokens_per_minute: int = LLM_INPUT_TOKENS_PER_MINUTE,
+        max_retries: int = LLM_MAX_RETRIES,
+        interactive_reserve: float = LLM_INTERACTIVE_RESERVE,
+        http_client: Optional[httpx.AsyncClient] = None,
+    ):
+        self.http_client = http_client or httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=concurrency,
+                max_keepalive_connections=concurrency,
+            ),
+            timeout=httpx.Timeout(120.0, connect=10.0),
+        )
+        self.client = anthropic.AsyncAnthropic(
+            api_key=api_key or os.environ.get("ANTHROPIC_API_KEY"),
+            base_url=base_url or os.environ.get("ANTHROPIC_BASE_URL"),
+            http_client=self.http_client,
+            max_retries=0,  # retries are handled here so they respect the buckets
+        )
+        self.max_retries = max_retries
+        self.interactive_reserve = interactive_reserve
+
+        # Background work gets the pool minus one slot, so a chat request
+        # never queues behind a wall of scan analyses
+        background_slots = max(1, concurrency - 1)
+        self._lanes: Dict[Lane, asyncio.Semaphore] = {
+            Lane.INTERACTIVE: asyncio.Semaphore(concurrency),
+            Lane.BACKGROUND: asyncio.Semaphore(background_slots),
+        }
+        self._requests = TokenBucket(requests_per_minute)
+        self._input_tokens = TokenBucket(input_tokens_per_minute)
+
+    async def create(self, lane: Lane = Lane.BACKGROUND, **kwargs):
+        """messages.create with pooling, rate limiting and retries"""
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            async with self._slot(lane, kwargs.get("messages", [])):
+                response = await self._with_backoff(lambda: self.client.messages.create(**kwargs))
+            outcome = "ok"
+            _count_tokens(lane, getattr(response, "usage", None))
+            return response
+        finally:
+            LLM_REQUEST.observe(time.perf_counter() - started, lane=lane.value, call="create", outcome=outcome)
+
+    @asynccontextmanager
+    async def stream(self, lane: Lane = Lane.INTERACTIVE, **kwargs):
+        """messages.stream under the same limits; yields the open AsyncMessageStream.
+
+        Only opening the stream is retried, since tokens already forwarded
+        to a client cannot be taken back. Leaving the block early (e.g. the
+        browser went away) closes the upstream HTTP response.
+        """
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            async with self._slot(lane, kwargs.get("messages", [])):
+                async def open_stream():
+                    return await self.client.messages.stream(**kwargs).__aenter__()
+
+                stream = await self._with_backoff(open_stream)
+                try:
+                    yield stream
+                    outcome = "ok"
+                finally:
+                    await stream.close()
+                    snapshot = getattr(stream, "current_message_snapshot", None)
+                    _count_tokens(lane, getattr(snapshot, "usage", None))
+        finally:
+            LLM_REQUEST.observe(time.perf_counter() - started, lane=lane.value, call="stream", outcome=outcome)
+
+    async def create_batch(self, requests: List[dict]) -> dict:
+        """Submit messages.create requests ({"custom_id", "params"}) as one Message Batch.
+
+        Batches have their own rate limits, so they skip the buckets. The
+        pinned SDK predates batch support, so these go through its raw
+        request methods, which still add auth and raise APIStatusError.
+        """
+        response = await self._batch_call(
+            "create",
+            lambda: self.client.post("/v1/messages/batches", body={"requests": requests}, cast_to=httpx.Response),
+        )
+        return response.json()
+
+    async def get_batch(self, batch_id: str) -> dict:
+        response = await self._batch_call(
+            "poll", lambda: self.client.get(f"/v1/messages/batches/{batch_id}", cast_to=httpx.Response)
+        )
+        return response.json()
+
+    async def batch_results(self, batch: dict) -> List[dict]:
+        """Result lines ({"custom_id", "result"}) of an ended batch"""
+        url = batch.get("results_url") or f"/v1/messages/batches/{batch['id']}/results"
+        response = await self._batch_call("results", lambda: self.client.get(url, cast_to=httpx.Response))
+        results = [json.loads(line) for line in response.text.splitlines() if line.strip()]
+        for result in results:
+            usage = (result["result"].get("message") or {}).get("usage") or {}
+            LLM_TOKENS.inc(usage.get("input_tokens", 0), lane="batch", direction="input")
+            LLM_TOKENS.inc(usage.get("output_tokens", 0), lane="batch", direction="output")
+        return results
+
+    async def _batch_call(self, call: str, request):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await self._with_backoff(request)
+            outcome = "ok"
+            return result
+        finally:
+            LLM_REQUEST.observe(time.perf_counter() - started, lane="batch", call=call, outcome=outcome)
+
+    @asynccontextmanager
+    async def _slot(self, lane: Lane, messages):
+        with LLM_THROTTLE.time(lane=lane.value):
+            await self._lanes[lane].acquire()
+            try:
+                await self._throttle(lane, _prompt_tokens(messages))
+            except BaseException:
+                self._lanes[lane].release()
+                raise
+        try:
+            yield
+        finally:
+            self._lanes[lane].release()
+
+    async def _throttle(self, lane: Lane, prompt_tokens: int):
+        reserve = self.interactive_reserve if lane == Lane.BACKGROUND else 0.0
+        await self._requests.acquire(1, reserve * self._requests.capacity)
+        await self._input_tokens.acquire(prompt_tokens, reserve * self._input_tokens.capacity)
+
+    async def _with_backoff(self, call):
+        attempt = 0
+        while True:
+            try:
+                return await call()
+            except anthropic.APIStatusError as e:
+                if e.status_code not in RETRYABLE_STATUS or attempt >= self.max_retries:
+                    raise
+                delay = _retry_after(e) or random.uniform(0, min(60.0, 2.0 ** attempt))
+                print(f"LLM returned {e.status_code}, retrying in {delay:.1f}s (attempt {attempt + 1})")
+                LLM_RETRIES.inc(status=e.status_code)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+
+def _retry_after(error: anthropic.APIStatusError) -> Optional[float]:
+    value = error.response.headers.get("retry-after") if error.response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def _count_tokens(lane: Lane, usage):
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, "input_tokens", 0) or 0, lane=lane.value, direction="input")
+    LLM_TOKENS.inc(getattr(usage, "output_tokens", 0) or 0, lane=lane.value, direction="output")
+
+
+_gateway: Optional[LLMGateway] = None
+
+
+def get_gateway() -> LLMGateway:
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway()
+    return _gateway
+
+
+def set_gateway(gateway: Optional[LLMGateway]):
+    """Install a different gateway (e.g. one pointed at a fake server in tests)"""
+    global _gateway
+    _gateway = gateway
@@ -1,21 +1,71 @@
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import subprocess
-import anthropic
+from pydantic import TypeAdapter
 import os
 from dotenv import load_dotenv
 import uuid
 from datetime import datetime, timedelta
 import asyncio
-from typing import Dict, List
+import hashlib
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
 from models import (
-    Scan, Finding, ChatMessage, StartScanRequest, ChatRequest,
+    Scan, Finding, Campaign, ChatMessage, StartScanRequest, StartCampaignRequest, ChatRequest,
     ScanStatus, Tool, Severity, FindingStatus
 )
+from scheduler import QueueFull
+from jobqueue import JobQueue, QUEUED, SCAN_EXECUTOR, JOB_EVENT_POLL_SECONDS
+from llm import get_gateway, Lane, LLM_MODEL
+from campaigns import expand_targets, shard, shutdown_process_pool, InvalidTargets, CAMPAIGN_SHARD_SIZE
+from tool_cache import get_tool_cache
+import metrics
+from metrics import Gauge, MetricsMiddleware
+from events import format_sse, sse_event
+from stats import DashboardStats
+from retrieval import ChatIndex, Document, format_context
+from chat_history import ChatSessions
+from archive import ARCHIVE_COMPACT_INTERVAL, ARCHIVE_MAX_LINES
+from export import EXPORT_FORMATS, csv_chunks, encode_page, iter_pages, ndjson_chunks
+from scan_runner import (
+    repo, active_scans, scheduler, analysis_cache, scan_events, output_archive, batch_analyzer,
+    run_scan, run_campaign, campaign_scans, finish_deferred_analysis, fail_deferred_analysis
+)
+from storage import (
+    ListQuery, InvalidQuery, RevisionExpired, parse_sort, SCAN_SORTS, FINDING_SORTS, SCANS, FINDINGS
+)
 
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Seed the store and start background loops; on the way out stop them and close every store"""
+    scans, findings = init_mock_data()
+    if await repo.seed_if_empty(scans, findings):
+        print(f"Seeded empty store with {len(scans)} mock scans")
+    background = [
+        asyncio.create_task(compact_archive_periodically()),
+        asyncio.create_task(batch_analyzer.run(finish_deferred_analysis, fail_deferred_analysis)),
+    ]
+    if job_queue is not None:
+        background.append(asyncio.create_task(relay_worker_events()))
+    try:
+        yield
+    finally:
+        for task in background:
+            task.cancel()
+        if job_queue is not None:
+            await job_queue.close()
+        await scheduler.shutdown()
+        await get_gateway().aclose()
+        shutdown_process_pool()
+        await output_archive.close()
+        await batch_analyzer.close()
+        await repo.close()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,19 +74,27 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
-
-# In-memory storage (replace with DB in production)
-scans_db: Dict[str, Scan] = {}
-findings_db: Dict[str, Finding] = {}
-active_scans: Dict[str, bool] = {}  # Track cancellations
-
-# Initialize with some mock data
-def init_mock_data():
+app.add_middleware(MetricsMiddleware)
+
+# With SCAN_EXECUTOR=queue, scans go to worker.py processes through this queue instead of the scheduler
+job_queue: Optional[JobQueue] = JobQueue() if SCAN_EXECUTOR == "queue" else None
+dashboard_stats = DashboardStats(repo)
+chat_index = ChatIndex(repo)
+chat_sessions = ChatSessions()
+
+Gauge("scans_running", "Scans currently holding a worker", function=lambda: scheduler.running)
+Gauge("scans_queued", "Scans waiting for a worker", function=lambda: scheduler.depth)
+Gauge("tool_runs_in_flight", "Distinct tool runs executing right now", function=lambda: get_tool_cache().report()["inFlight"])
+SCAN_JOBS = Gauge("scan_jobs", "Jobs in the shared scan queue by state (SCAN_EXECUTOR=queue)", ["state"])
+
+# Seed data loaded into a brand new store
+def init_mock_data() -> Tuple[List[Scan], List[Finding]]:
+    scans = []
+    findings = []
+    
     # Mock scan 1
     scan1_id = str(uuid.uuid4())
-    scans_db[scan1_id] = Scan(
+    scans.append(Scan(
         id=scan1_id,
         target="prod-api.internal",
         tools=[Tool.NMAP, Tool.NUCLEI],
@@ -48,10 +106,10 @@ def init_mock_data():
         riskScore=78,
         summary="AI flagged 2 critical paths: outdated OpenSSH on port 22 and exposed admin dashboard on 8443.",
         aiSummary="Found critical SSH vulnerability (CVE-2023-xxxx) and exposed admin panel. Immediate patching required."
-    )
+    ))
     
     # Mock findings for scan1
-    findings_db[str(uuid.uuid4())] = Finding(
+    findings.append(Finding(
         id=str(uuid.uuid4()),
         scanId=scan1_id,
         host="prod-api.internal",
@@ -63,9 +121,9 @@ def init_mock_data():
         title="Outdated OpenSSH Version",
         description="OpenSSH 7.4 detected with known vulnerabilities",
         recommendation="Update to OpenSSH 9.0 or later: apt-get update && apt-get install openssh-server"
-    )
+    ))
     
-    findings_db[str(uuid.uuid4())] = Finding(
+    findings.append(Finding(
         id=str(uuid.uuid4()),
         scanId=scan1_id,
         host="prod-api.internal",
@@ -77,11 +135,11 @@ def init_mock_data():
         title="Exposed Admin Dashboard",
         description="Admin panel accessible without VPN at /admin with default credentials",
         recommendation="Restrict access to VPN-only networks and enforce strong authentication"
-    )
+    ))
     
     # Mock scan 2
     scan2_id = str(uuid.uuid4())
-    scans_db[scan2_id] = Scan(
+    scans.append(Scan(
         id=scan2_id,
         target="payments.edge",
         tools=[Tool.NIKTO, Tool.OPENVAS],
@@ -93,11 +151,11 @@ def init_mock_data():
         riskScore=71,
         summary="Directory listing enabled on /reports; outdated TLS ciphers.",
         aiSummary="Payments service has weak TLS configuration and directory traversal vulnerability. Focus on hardening SSH and closing admin access."
-    )
+    ))
     
     # Mock scan 3 - Clean
     scan3_id = str(uuid.uuid4())
-    scans_db[scan3_id] = Scan(
+    scans.append(Scan(
         id=scan3_id,
         target="staging.api",
         tools=[Tool.NMAP, Tool.NIKTO, Tool.NUCLEI],
@@ -109,23 +167,256 @@ def init_mock_data():
         riskScore=12,
         summary="No exploitable issues found across probed services.",
         aiSummary="Staging environment is well-configured with no critical vulnerabilities detected."
+    ))
+    
+    return scans, findings
+
+async def compact_archive_periodically():
+    """Expire old archived output and reclaim space from deleted scans"""
+    while True:
+        await asyncio.sleep(ARCHIVE_COMPACT_INTERVAL)
+        try:
+            await output_archive.compact()
+        except Exception as e:
+            print(f"Archive compaction failed: {e!r}")
+
+async def relay_worker_events():
+    """Queue mode: republish the events workers record in the queue to this process's SSE subscribers"""
+    seq = await job_queue.last_event()
+    while True:
+        try:
+            batch = await job_queue.events_after(seq)
+        except Exception as e:
+            print(f"Could not read worker events: {e!r}")
+            batch = []
+        for seq, event in batch:
+            scan_events.publish(event.pop("scanId"), event.pop("type"), **event)
+        if not batch:
+            await asyncio.sleep(JOB_EVENT_POLL_SECONDS)
+
+async def queue_positions() -> Dict[str, int]:
+    if job_queue is not None:
+        return await job_queue.positions()
+    return scheduler.positions()
+
+async def scan_is_active(scan_id: str) -> bool:
+    if job_queue is not None:
+        return await job_queue.is_active(scan_id)
+    return bool(active_scans.get(scan_id))
+
+def with_queue_positions(scans: List[Scan], positions: Dict[str, int]) -> List[Scan]:
+    """Overlay live queue positions on queued scans"""
+    if not positions:
+        return scans
+    return [
+        scan.model_copy(update={"queuePosition": positions[scan.id], "queueDepth": len(positions)})
+        if scan.id in positions else scan
+        for scan in scans
+    ]
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def build_list_query(filters: dict, sort: Optional[str], sorts: set, default_sort: str,
+                     since: Optional[str], until: Optional[str], limit: int, cursor: Optional[str]) -> ListQuery:
+    try:
+        sort_field, descending = parse_sort(sort, sorts, default_sort)
+    except InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ListQuery(
+        filters={name: value for name, value in filters.items() if value is not None},
+        since=since,
+        until=until,
+        sort=sort_field,
+        descending=descending,
+        limit=limit,
+        cursor=cursor
     )
 
-init_mock_data()
+SCAN_LIST = TypeAdapter(List[Scan])
+FINDING_LIST = TypeAdapter(List[Finding])
+
+def json_response(body: bytes, headers: Optional[dict] = None) -> Response:
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def list_etag(collection: str, revision: int, request: Request, extra: str = "") -> str:
+    """Weak validator for one listing: the collection's revision plus the exact query"""
+    digest = hashlib.sha1(f"{request.url.query}|{extra}".encode()).hexdigest()[:16]
+    return f'W/"{collection}-{revision}-{digest}"'
+
+def not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [tag.strip() for tag in header.split(",")]
+
+async def list_changes(collection: str, since_revision: int, limit: int, combined_with: dict):
+    """Delta mode: only what was written or deleted after since_revision, oldest first"""
+    extra = [name for name, value in combined_with.items() if value is not None]
+    if extra:
+        raise HTTPException(
+            status_code=400, detail=f"sinceRevision cannot be combined with {', '.join(sorted(extra))}"
+        )
+    try:
+        return await repo.changes(collection, since_revision, limit)
+    except RevisionExpired as e:
+        # Too far behind to know every deletion: the client has to reload in full
+        raise HTTPException(status_code=410, detail=str(e))
 
 @app.get("/api/scans")
-async def get_scans():
-    """Fetch all scans"""
-    return {"scans": list(scans_db.values())}
+async def get_scans(
+    request: Request,
+    status: Optional[str] = None,
+    tool: Optional[str] = None,
+    target: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    sort: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    sinceRevision: Optional[int] = Query(None, ge=0)
+):
+    """Fetch one page of scans, newest first by default.
+
+    With ?sinceRevision= only scans written or deleted after that revision
+    are returned. Full listings carry an ETag and answer If-None-Match with 304.
+    """
+    if sinceRevision is not None:
+        changes = await list_changes(SCANS, sinceRevision, limit, {
+            "status": status, "tool": tool, "target": target, "since": since, "until": until,
+            "sort": sort, "cursor": cursor,
+        })
+        return json_response(encode_page(
+            "scans", SCAN_LIST, with_queue_positions(changes.items, await queue_positions()), fields,
+            deleted=changes.deleted, revision=changes.revision, hasMore=changes.has_more
+        ))
+
+    # Read before the page so a write landing in between shows up as a change next time
+    revision = await repo.revision(SCANS)
+    # Queue positions move without any write, so they are part of the validator too
+    positions = await queue_positions()
+    etag = list_etag(SCANS, revision, request, json.dumps(positions, sort_keys=True))
+    if not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    query = build_list_query(
+        {"status": status, "tool": tool, "target": target},
+        sort, SCAN_SORTS, "startedAt", since, until, limit, cursor
+    )
+    try:
+        page = await repo.page_scans(query)
+    except InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return json_response(
+        encode_page(
+            "scans", SCAN_LIST, with_queue_positions(page.items, positions), fields,
+            nextCursor=page.next_cursor, revision=revision
+        ),
+        {"ETag": etag, "Cache-Control": "no-cache"}
+    )
 
 @app.get("/api/findings")
-async def get_findings():
-    """Fetch all findings"""
-    return {"findings": list(findings_db.values())}
+async def get_findings(
+    request: Request,
+    status: Optional[str] = None,
+    severity: Optional[str] = None,
+    tool: Optional[str] = None,
+    host: Optional[str] = None,
+    scanId: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    sort: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    sinceRevision: Optional[int] = Query(None, ge=0)
+):
+    """Fetch one page of findings, newest first by default (see get_scans for revisions)"""
+    if sinceRevision is not None:
+        changes = await list_changes(FINDINGS, sinceRevision, limit, {
+            "status": status, "severity": severity, "tool": tool, "host": host, "scanId": scanId,
+            "since": since, "until": until, "sort": sort, "cursor": cursor,
+        })
+        return json_response(encode_page(
+            "findings", FINDING_LIST, changes.items, fields,
+            deleted=changes.deleted, revision=changes.revision, hasMore=changes.has_more
+        ))
+
+    revision = await repo.revision(FINDINGS)
+    etag = list_etag(FINDINGS, revision, request)
+    if not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    query = build_list_query(
+        {"status": status, "severity": severity, "tool": tool, "host": host, "scanId": scanId},
+        sort, FINDING_SORTS, "createdAt", since, until, limit, cursor
+    )
+    try:
+        page = await repo.page_findings(query)
+    except InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return json_response(
+        encode_page("findings", FINDING_LIST, page.items, fields, nextCursor=page.next_cursor, revision=revision),
+        {"ETag": etag, "Cache-Control": "no-cache"}
+    )
+
+def export_response(name: str, model, fetch, query: ListQuery, format: str, revision: int) -> StreamingResponse:
+    """Stream every matching record a batch at a time, so memory stays flat however many there are"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format {format!r}; use one of {sorted(EXPORT_FORMATS)}")
+    pages = iter_pages(fetch, query)
+    chunks = ndjson_chunks(pages) if format == "ndjson" else csv_chunks(model, pages)
+    filename = f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{format}"
+    return StreamingResponse(chunks, media_type=EXPORT_FORMATS[format], headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        # Follow up with ?sinceRevision= to pick up whatever changed after the export started
+        "X-Revision": str(revision),
+    })
+
+@app.get("/api/scans/export")
+async def export_scans(
+    format: str = "ndjson",
+    status: Optional[str] = None,
+    tool: Optional[str] = None,
+    target: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    sort: Optional[str] = None
+):
+    """Every matching scan as NDJSON or CSV (?format=csv), streamed"""
+    revision = await repo.revision(SCANS)
+    query = build_list_query(
+        {"status": status, "tool": tool, "target": target}, sort, SCAN_SORTS, "startedAt", since, until, 1, None
+    )
+    return export_response("scans", Scan, repo.page_scans, query, format, revision)
+
+@app.get("/api/findings/export")
+async def export_findings(
+    format: str = "ndjson",
+    status: Optional[str] = None,
+    severity: Optional[str] = None,
+    tool: Optional[str] = None,
+    host: Optional[str] = None,
+    scanId: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    sort: Optional[str] = None
+):
+    """Every matching finding as NDJSON or CSV (?format=csv), streamed; for SIEM exports"""
+    revision = await repo.revision(FINDINGS)
+    query = build_list_query(
+        {"status": status, "severity": severity, "tool": tool, "host": host, "scanId": scanId},
+        sort, FINDING_SORTS, "createdAt", since, until, 1, None
+    )
+    return export_response("findings", Finding, repo.page_findings, query, format, revision)
+
+def queue_full_error(detail: str) -> HTTPException:
+    return HTTPException(status_code=429, detail=detail, headers={"Retry-After": "30"})
 
 @app.post("/api/scans/start")
-async def start_scan(request: StartScanRequest, background_tasks: BackgroundTasks):
-    """Start a new scan"""
+async def start_scan(request: StartScanRequest):
+    """Queue a new scan"""
     scan_id = str(uuid.uuid4())
     
     # Create initial scan object
@@ -134,370 +425,361 @@ async def start_scan(request: StartScanRequest, background_tasks: BackgroundTask
         target=request.target,
         tools=request.tools,
         startedAt=datetime.now().isoformat(),
-        status=ScanStatus.IN_PROGRESS,
+        status=ScanStatus.QUEUED,
         issues=0,
         critical=0,
         durationMinutes=None,
         riskScore=0,
-        summary="Scan in progress...",
-        aiSummary="Running security analysis..."
+        summary="Waiting for a scan worker...",
+        aiSummary="Running security analysis...",
+        priority=request.priority,
+        deferredAnalysis=request.deferredAnalysis
     )
     
-    scans_db[scan_id] = scan
-    active_scans[scan_id] = True
+    if job_queue is None and scheduler.is_full:
+        raise queue_full_error(f"Scan queue is full ({scheduler.max_queue} pending)")
+    
+    # Stored before it is queued so the worker always finds the record
+    await repo.save_scan(scan)
     
-    # Run scan in background
-    background_tasks.add_task(run_scan, scan_id, request.target, request.tools)
+    if job_queue is not None:
+        try:
+            await job_queue.enqueue(scan_id, request.target, request.priority, request.model_dump(mode="json"))
+        except QueueFull as e:
+            await repo.update_scan(scan_id, status=ScanStatus.FAILED, summary="Scan queue was full")
+            raise queue_full_error(str(e))
+        return await queued_response(scan)
+    
+    active_scans[scan_id] = True
+    try:
+        scheduler.submit(
+            scan_id,
+            request.target,
+            lambda: run_scan(
+                scan_id, request.target, request.tools, request.maxParallelTools, request.differential,
+                request.forceRefresh, request.deferredAnalysis
+            ),
+            priority=request.priority
+        )
+    except QueueFull as e:
+        # Lost the race for the last slot while the record was being written
+        active_scans.pop(scan_id, None)
+        await repo.update_scan(scan_id, status=ScanStatus.FAILED, summary="Scan queue was full")
+        raise queue_full_error(str(e))
     
+    return await queued_response(scan)
+
+async def queued_response(scan: Scan) -> dict:
+    scan = with_queue_positions([scan], await queue_positions())[0]
+    scan_events.publish(scan.id, "queued", target=scan.target, tools=scan.tools, queuePosition=scan.queuePosition)
     return {"scan": scan}
 
-async def run_scan(scan_id: str, target: str, tools: List[Tool]):
-    """Background task to actually run the scan"""
-    print(f"\n=== STARTING SCAN {scan_id} ===")
-    print(f"Target: {target}")
-    print(f"Tools: {tools}")
+@app.post("/api/campaigns/start")
+async def start_campaign(request: StartCampaignRequest):
+    """Queue a batch scan over a list of hosts, CIDR ranges and globs"""
+    known_hosts = await repo.list_targets()
+    try:
+        hosts = expand_targets(request.targets, known_hosts)
+    except InvalidTargets as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if job_queue is None and scheduler.is_full:
+        raise queue_full_error(f"Scan queue is full ({scheduler.max_queue} pending)")
+    
+    campaign_id = str(uuid.uuid4())
+    started_at = datetime.now().isoformat()
+    shards = shard(hosts, request.shardSize or CAMPAIGN_SHARD_SIZE)
+    campaign = Campaign(
+        id=campaign_id,
+        name=request.name or ", ".join(request.targets)[:80],
+        targets=request.targets,
+        tools=request.tools,
+        startedAt=started_at,
+        status=ScanStatus.QUEUED,
+        hostCount=len(hosts),
+        shardCount=len(shards),
+        summary="Waiting for a scan worker...",
+        priority=request.priority
+    )
+    children = [[
+        Scan(
+            id=str(uuid.uuid4()),
+            target=host,
+            tools=request.tools,
+            startedAt=started_at,
+            status=ScanStatus.QUEUED,
+            issues=0,
+            critical=0,
+            riskScore=0,
+            summary="Waiting for its campaign shard...",
+            aiSummary="Analyzed as part of the campaign rollup",
+            priority=request.priority,
+            campaignId=campaign_id
+        )
+        for host in hosts_in_shard
+    ] for hosts_in_shard in shards]
     
-    start_time = datetime.now()
+    await repo.save_campaign(campaign)
+    await repo.save_scans([scan for group in children for scan in group])
     
     try:
-        all_output = []
-        
-        # Run each tool
-        for tool in tools:
-            print(f"\n--- Running {tool} on {target} ---")
-            
-            if not active_scans.get(scan_id, False):
-                print(f"Scan {scan_id} was cancelled")
-                scans_db[scan_id].status = ScanStatus.FAILED
-                scans_db[scan_id].summary = "Scan cancelled by user"
-                scans_db[scan_id].aiSummary = "Scan was cancelled before completion"
-                return
-            
-            if tool == Tool.NMAP:
-                print(f"Running nmap -sV -F {target}...")
-                result = subprocess.run(
-                    ['nmap', '-sV', '-F', target],
-                    capture_output=True,
-                    text=True,
-                    timeout=45
-                )
-                print(f"Nmap completed. Output length: {len(result.stdout)} chars")
-                all_output.append(f"=== NMAP ===\n{result.stdout}")
-            
-            elif tool == Tool.NIKTO:
-                print(f"Running nikto on {target}...")
-                result = subprocess.run(
-                    ['nikto', '-h', target, '-Tuning', '1,2,3'],
-                    capture_output=True,
-                    text=True,
-                    timeout=45
-                )
-                print(f"Nikto completed. Output length: {len(result.stdout)} chars")
-                all_output.append(f"=== NIKTO ===\n{result.stdout}")
-            
-            elif tool == Tool.NUCLEI:
-                print(f"Running nuclei on {target}...")
-                try:
-                    target_url = target if target.startswith('http') else f'http://{target}'
-
-                    result = subprocess.run(
-                        [
-                            'nuclei',
-                            '-u', target_url,
-                            '-t', 'cves/',
-                            '-t', 'exposures/',
-                            '-silent',
-                            '-nc',
-                            '-timeout', '30'
-                        ],
-                        capture_output=True,
-                        text=True,
-                        timeout=90
-                    )
-
-                    print(f"Nuclei completed. Output length: {len(result.stdout)} chars")
-
-                    if result.stdout.strip():
-                        all_output.append(f"=== NUCLEI ===\n{result.stdout}")
-                    else:
-                        all_output.append(f"=== NUCLEI ===\nNo vulnerabilities detected by Nuclei")
-
-                except FileNotFoundError:
-                    print("Nuclei not installed, providing installation message...")
-                    all_output.append("""=== NUCLEI ===
-Nuclei is not installed on this system.
-
-To install:
-  macOS:   brew install nuclei
-  Linux:   GO111MODULE=on go install -v github.com/projectdiscovery/nuclei/v2/cmd/nuclei@latest
-
-After installation, run: nuclei -update-templates
-
-Skipping Nuclei scan for now.""")
-
-                except subprocess.TimeoutExpired:
-                    print("Nuclei timeout after 90 seconds")
-                    all_output.append("=== NUCLEI ===\nScan timeout after 90 seconds (target may be slow or unreachable)")
-
-                except Exception as e:
-                    print(f"Nuclei error: {e}")
-                    all_output.append(f"=== NUCLEI ===\nError running Nuclei: {str(e)}")
-            
-            elif tool == Tool.OPENVAS:
-                print(f"OpenVAS simulation for {target}...")
-                import random
-
-                high_issues = random.randint(1, 4)
-                medium_issues = random.randint(3, 8)
-                low_issues = random.randint(5, 15)
-                info_issues = random.randint(8, 20)
-
-                await asyncio.sleep(2)
-
-                mock_output = f"""OpenVAS Comprehensive Security Scan Report
-Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-Target: {target}
-Scanner Version: OpenVAS 22.4 (simulated)
-
-╔════════════════════════════════════════════════════════════════╗
-║                      EXECUTIVE SUMMARY                          ║
-╚════════════════════════════════════════════════════════════════╝
-
-Total Vulnerabilities Found: {high_issues + medium_issues + low_issues + info_issues}
-
-Severity Breakdown:
-  ▸ High:   {high_issues} findings
-  ▸ Medium: {medium_issues} findings  
-  ▸ Low:    {low_issues} findings
-  ▸ Info:   {info_issues} findings
-
-╔════════════════════════════════════════════════════════════════╗
-║                    HIGH SEVERITY FINDINGS                       ║
-╚════════════════════════════════════════════════════════════════╝
-
-[H-001] SSL/TLS Certificate Validation Issues
-  ├─ Description: Certificate expired, self-signed, or using weak signature
-  ├─ Risk: Man-in-the-middle attacks, identity spoofing
-  ├─ CVSS: 7.5 (High)
-  └─ Fix: Renew certificate with trusted CA, enforce TLS 1.2+
-
-[H-002] Missing HTTP Security Headers
-  ├─ Description: Critical security headers not implemented
-  ├─ Missing: X-Frame-Options, X-Content-Type-Options, CSP, HSTS
-  ├─ Risk: Clickjacking, XSS, MIME-sniffing attacks
-  ├─ CVSS: 6.5 (Medium-High)
-  └─ Fix: Implement all security headers per OWASP guidelines
-
-[H-003] Outdated Software Components
-  ├─ Description: Server running end-of-life software versions
-  ├─ Affected: Web server, SSH daemon, SSL libraries
-  ├─ Risk: Known CVEs with public exploits available
-  ├─ CVSS: 8.1 (High)
-  └─ Fix: Update to latest stable versions immediately
-
-╔════════════════════════════════════════════════════════════════╗
-║                   MEDIUM SEVERITY FINDINGS                      ║
-╚════════════════════════════════════════════════════════════════╝
-
-[M-001] Directory Listing Enabled
-  └─ Fix: Disable directory indexes in web server config
-
-[M-002] Server Information Disclosure
-  └─ Fix: Remove version banners from HTTP headers
-
-[M-003] Weak Password Policy Detected
-  └─ Fix: Enforce strong password requirements (12+ chars, complexity)
-
-[M-004] Missing Security Patches
-  └─ Fix: Apply latest security updates for OS and applications
-
-[M-005] Default Credentials in Use
-  └─ Fix: Change all default usernames and passwords
-
-╔════════════════════════════════════════════════════════════════╗
-║                      RECOMMENDATIONS                            ║
-╚════════════════════════════════════════════════════════════════╝
-
-IMMEDIATE ACTIONS (24-48 hours):
-  1. Update SSL/TLS certificates
-  2. Patch critical CVEs in outdated software
-  3. Change default credentials
-  4. Implement missing security headers
-
-SHORT-TERM (1-2 weeks):
-  1. Update all software to current stable versions
-  2. Disable unnecessary services and ports
-  3. Implement WAF rules
-  4. Review and update password policies
-
-LONG-TERM (1-3 months):
-  1. Implement continuous vulnerability scanning
-  2. Deploy SIEM for monitoring
-  3. Conduct penetration testing
-  4. Security awareness training for staff
-
-╔════════════════════════════════════════════════════════════════╗
-║                        COMPLIANCE NOTES                         ║
-╚════════════════════════════════════════════════════════════════╝
-
-PCI-DSS: Requirement 6.6 (web app security) - FAIL
-HIPAA: §164.312(e)(1) (transmission security) - FAIL  
-SOC2: CC6.1 (logical access controls) - PARTIAL
-ISO 27001: A.14.2.5 (secure system principles) - FAIL
-
-════════════════════════════════════════════════════════════════
-
-NOTE: This is a simulated OpenVAS scan for demonstration purposes.
-Real OpenVAS scans require dedicated infrastructure (Docker + 2GB).
-For production use, deploy OpenVAS via: docker pull greenbone/openvas
-
-Scan simulated in 2 seconds (real scans typically take 15-30 minutes)
-"""
-
-                all_output.append(f"=== OPENVAS ===\n{mock_output}")
-                print(f"OpenVAS simulation completed with {high_issues + medium_issues + low_issues} findings")
-        
-        combined_output = "\n\n".join(all_output)
-        print(f"\n--- Sending to Claude for analysis ---")
-        print(f"Total output length: {len(combined_output)} chars")
-        
-        tools_used = ", ".join([str(t.value) for t in tools])
-
-        # Get AI analysis
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=2000,
-            messages=[{
-                "role": "user",
-                "content": f"""Analyze this security scan for {target} using multiple security tools:
-
-Tools used: {tools_used}
-
-{combined_output}
-
-Provide:
-1. Issue count (estimate total vulnerabilities found across all tools)
-2. Critical issue count (high-severity findings)
-3. Risk score (0-100, where 100 is most dangerous)
-4. Brief summary (1-2 sentences for table display)
-5. Detailed AI summary (2-3 sentences explaining key findings and recommended actions)
-
-Note: If OpenVAS results are marked as "simulated", still analyze them as if real.
-
-Format as:
-ISSUES: <number>
-CRITICAL: <number>
-RISK_SCORE: <number>
-SUMMARY: <text>
-AI_SUMMARY: <text>"""
-            }]
-        )
-        
-        response_text = message.content[0].text
-        print(f"\n--- Claude response ---")
-        print(response_text)
-        
-        # Parse AI response
-        issues = 0
-        critical = 0
-        risk_score = 50
-        summary = "Analysis complete"
-        ai_summary = "Security scan completed"
-        
-        for line in response_text.split('\n'):
-            if line.startswith('ISSUES:'):
-                issues = int(line.split(':')[1].strip())
-            elif line.startswith('CRITICAL:'):
-                critical = int(line.split(':')[1].strip())
-            elif line.startswith('RISK_SCORE:'):
-                risk_score = int(line.split(':')[1].strip())
-            elif line.startswith('SUMMARY:'):
-                summary = line.split(':', 1)[1].strip()
-            elif line.startswith('AI_SUMMARY:'):
-                ai_summary = line.split(':', 1)[1].strip()
-        
-        # Update scan
-        duration = (datetime.now() - start_time).seconds // 60
-        print(f"\n--- Updating scan results ---")
-        print(f"Issues: {issues}, Critical: {critical}, Risk: {risk_score}%")
-        
-        scans_db[scan_id].status = ScanStatus.COMPLETED if issues > 0 else ScanStatus.CLEAN
-        scans_db[scan_id].issues = issues
-        scans_db[scan_id].critical = critical
-        scans_db[scan_id].durationMinutes = duration
-        scans_db[scan_id].riskScore = risk_score
-        scans_db[scan_id].summary = summary
-        scans_db[scan_id].aiSummary = ai_summary
-        
-        print(f"=== SCAN {scan_id} COMPLETED ===\n")
-        
-        # Create sample finding if issues found
-        if issues > 0:
-            finding_id = str(uuid.uuid4())
-            findings_db[finding_id] = Finding(
-                id=finding_id,
-                scanId=scan_id,
-                host=target,
-                port=80,
-                service="HTTP",
-                severity=Severity.CRITICAL if critical > 0 else Severity.HIGH,
-                tool=tools[0],
-                status=FindingStatus.OPEN,
-                title=f"Security issue detected on {target}",
-                description=summary,
-                recommendation="Review scan details and apply recommended patches"
+        # The whole campaign takes one scan worker; its shards fan out to that worker's process pool
+        if job_queue is not None:
+            await job_queue.enqueue(campaign_id, f"campaign:{campaign_id}", request.priority, {
+                "campaign": True,
+                "shards": [[scan.id for scan in scans] for scans in children],
+                "maxParallelShards": request.maxParallelShards,
+            })
+        else:
+            active_scans[campaign_id] = True
+            scheduler.submit(
+                campaign_id,
+                f"campaign:{campaign_id}",
+                lambda: run_campaign(campaign, children, request.maxParallelShards),
+                priority=request.priority
             )
+    except QueueFull as e:
+        active_scans.pop(campaign_id, None)
+        await repo.update_campaign(campaign_id, status=ScanStatus.FAILED, summary="Scan queue was full")
+        raise queue_full_error(str(e))
     
-    except Exception as e:
-        print(f"\n!!! SCAN {scan_id} FAILED !!!")
-        print(f"Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        
-        scans_db[scan_id].status = ScanStatus.FAILED
-        scans_db[scan_id].summary = f"Scan failed: {str(e)}"
-        scans_db[scan_id].aiSummary = f"Error during scan: {str(e)}"
+    return {"campaign": campaign}
+
+@app.get("/api/campaigns")
+async def get_campaigns():
+    return {"campaigns": await repo.list_campaigns()}
+
+@app.get("/api/campaigns/{campaign_id}")
+async def get_campaign(campaign_id: str):
+    """Campaign rollup with its hosts ranked by risk"""
+    campaign = await repo.get_campaign(campaign_id)
+    if campaign is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return {"campaign": campaign, "hosts": await campaign_scans(campaign_id)}
+
+@app.post("/api/campaigns/{campaign_id}/cancel")
+async def cancel_campaign(campaign_id: str):
+    """Cancel a campaign; shards already running in the pool are allowed to finish"""
+    if campaign_id in active_scans:
+        active_scans[campaign_id] = False
     
-    finally:
-        active_scans[scan_id] = False
+    if job_queue is not None:
+        # A worker running the campaign stops starting shards at its next heartbeat
+        never_started = await job_queue.cancel(campaign_id) == QUEUED
+    else:
+        never_started = scheduler.cancel(campaign_id)
+    if never_started:
+        # Never started, so none of its child scans will be touched again
+        await repo.save_scans([
+            scan.model_copy(update={"status": ScanStatus.FAILED, "summary": "Scan cancelled by user"})
+            for scan in await campaign_scans(campaign_id)
+        ])
+    
+    campaign = await repo.update_campaign(
+        campaign_id,
+        status=ScanStatus.FAILED,
+        summary="Campaign cancelled by user",
+        aiSummary="Campaign was cancelled before completion"
+    )
+    if campaign is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return {"success": True}
+
+@app.get("/api/stats")
+async def get_stats(target: Optional[str] = None):
+    """Dashboard aggregates: scan and severity counts, average risk, per-tool rolling windows"""
+    return await dashboard_stats.report(target)
+
+@app.post("/api/stats/verify")
+async def verify_stats(repair: bool = False):
+    """Rebuild the aggregates from storage and report (or with ?repair=true, fix) any drift"""
+    return await dashboard_stats.verify(repair)
+
+@app.get("/api/analysis/batches")
+async def get_analysis_batches():
+    """Deferred analyses waiting for a batch, and the most recent batches"""
+    return await batch_analyzer.report()
+
+@app.post("/api/analysis/batches/submit")
+async def submit_analysis_batch():
+    """Send whatever deferred analyses are waiting now instead of at the end of the batch window"""
+    return {"batchId": await batch_analyzer.submit(force=True)}
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Analysis and tool output cache hit/miss counters"""
+    return {"analysis": analysis_cache.report(), "tools": get_tool_cache().report()}
 
 @app.post("/api/scans/{scan_id}/cancel")
 async def cancel_scan(scan_id: str):
-    """Cancel an in-progress scan"""
+    """Cancel a queued or in-progress scan"""
     if scan_id in active_scans:
         active_scans[scan_id] = False
     
-    if scan_id in scans_db:
-        scans_db[scan_id].status = ScanStatus.FAILED
-        scans_db[scan_id].summary = "Scan cancelled by user"
-        scans_db[scan_id].aiSummary = "Scan was cancelled before completion"
+    # Still queued: just drop it. Running: cancel the task so its tools are killed right away
+    if job_queue is not None:
+        # A worker running the scan notices at its next heartbeat and kills the tools
+        await job_queue.cancel(scan_id)
+    elif not scheduler.cancel(scan_id):
+        scheduler.abort(scan_id)
+    await batch_analyzer.forget(scan_id)
+    
+    scan = await repo.update_scan(
+        scan_id,
+        status=ScanStatus.FAILED,
+        summary="Scan cancelled by user",
+        aiSummary="Scan was cancelled before completion"
+    )
+    if scan is not None:
+        scan_events.publish(scan_id, "cancelled")
     
     return {"success": True}
 
-@app.post("/api/chat")
-async def chat(request: ChatRequest):
-    """AI Assistant chat endpoint"""
-    try:
-        # Get scan context if provided
-        context = ""
-        if request.scanId and request.scanId in scans_db:
-            scan = scans_db[request.scanId]
-            context = f"\nContext - Current Scan: {scan.target}, Status: {scan.status}, Issues: {scan.issues}, Risk: {scan.riskScore}%, Summary: {scan.aiSummary}"
-        
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1000,
-            messages=[{
-                "role": "user",
-                "content": f"""You are a cybersecurity AI assistant helping analyze security scans.{context}
+@app.delete("/api/scans/{scan_id}")
+async def delete_scan(scan_id: str):
+    """Delete a finished scan and its findings; delta listings report them as deleted"""
+    if await scan_is_active(scan_id):
+        raise HTTPException(status_code=409, detail="Scan is still queued or running; cancel it first")
+    if not await repo.delete_scan(scan_id):
+        raise HTTPException(status_code=404, detail="Scan not found")
+    await output_archive.forget_scan(scan_id)
+    await batch_analyzer.forget(scan_id)
+    return {"success": True}
+
+@app.get("/api/scans/{scan_id}/output")
+async def list_scan_output(scan_id: str):
+    """Raw tool output archived for a scan: one stream per tool run, with line and byte counts"""
+    return {"streams": await output_archive.streams(scan_id)}
+
+@app.get("/api/scans/{scan_id}/output/{tool}")
+async def read_scan_output(
+    scan_id: str,
+    tool: str,
+    endpoint: Optional[str] = None,
+    start: int = Query(0, alias="from", ge=0),
+    end: Optional[int] = Query(None, alias="to", ge=0),
+):
+    """Lines [from, to) of a tool's raw output, at most ARCHIVE_MAX_LINES per request"""
+    streams = [s for s in await output_archive.streams(scan_id) if s["tool"].lower() == tool.lower()]
+    if endpoint is None and len(streams) > 1:
+        endpoints = ", ".join(s["endpoint"] or "(host)" for s in streams)
+        raise HTTPException(status_code=400, detail=f"{tool} ran against several endpoints, pick one: {endpoints}")
+    if endpoint is None and streams:
+        endpoint = streams[0]["endpoint"]
+    name = streams[0]["tool"] if streams else tool
+    stop = end if end is not None else start + ARCHIVE_MAX_LINES
+    result = await output_archive.read(scan_id, name, endpoint, start, stop)
+    if result is None:
+        raise HTTPException(status_code=404, detail="No archived output for that tool")
+    return {"tool": name, "endpoint": endpoint, **result}
+
+@app.post("/api/archive/compact")
+async def compact_archive():
+    """Expire old archived output and rewrite segments that are mostly deleted output"""
+    return await output_archive.compact()
+
+# Seconds between keep-alive comments on idle event streams
+SSE_KEEPALIVE_SECONDS = 15
+
+def final_event(scan: Scan) -> dict:
+    """Stand-in terminal event for a finished scan whose event history is no longer kept"""
+    event = {"id": 0, "scanId": scan.id, "ts": time.time()}
+    if scan.status in (ScanStatus.COMPLETED, ScanStatus.CLEAN):
+        return {**event, "type": "completed", "scan": scan.model_dump()}
+    if scan.summary == "Scan cancelled by user":
+        return {**event, "type": "cancelled"}
+    return {**event, "type": "failed", "error": scan.aiSummary}
+
+@app.get("/api/scans/{scan_id}/events")
+async def scan_events_stream(scan_id: str, request: Request):
+    """Server-Sent Events feed of a scan's lifecycle and tool output"""
+    scan = await repo.get_scan(scan_id)
+    if scan is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    
+    last_event_id = request.headers.get("last-event-id", "0")
+    after = int(last_event_id) if last_event_id.isdigit() else 0
+    
+    if scan.status not in (ScanStatus.QUEUED, ScanStatus.IN_PROGRESS) and not scan_events.has_channel(scan_id):
+        # Finished long ago (or before a restart): its history is gone, so just say how it ended
+        return StreamingResponse(
+            iter([format_sse(final_event(scan))]),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    async def stream():
+        events = scan_events.subscribe(scan_id, after=after).__aiter__()
+        next_event = None
+        try:
+            while True:
+                if next_event is None:
+                    next_event = asyncio.ensure_future(events.__anext__())
+                done, _ = await asyncio.wait({next_event}, timeout=SSE_KEEPALIVE_SECONDS)
+                if await request.is_disconnected():
+                    break
+                if not done:
+                    yield format_sse(None)
+                    continue
+                try:
+                    event = next_event.result()
+                except StopAsyncIteration:
+                    break
+                next_event = None
+                yield format_sse(event)
+        finally:
+            if next_event is not None:
+                next_event.cancel()
+                await asyncio.gather(next_event, return_exceptions=True)
+            await events.aclose()
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def build_chat_messages(request: ChatRequest) -> Tuple[List[dict], List[Document]]:
+    """Prompt for the assistant: scan context, retrieved findings and tool output, then the session's recent turns"""
+    context = ""
+    scan = await repo.get_scan(request.scanId) if request.scanId else None
+    if scan is not None:
+        context = f"\nContext - Current Scan: {scan.target}, Status: {scan.status}, Issues: {scan.issues}, Risk: {scan.riskScore}%, Summary: {scan.aiSummary}"
+    
+    history = chat_sessions.window(request.sessionId) if request.sessionId else []
+    # A follow-up ("and on staging?") is searched together with the question before it
+    query = f"{request.prompt} {history[-2]['content']}" if history else request.prompt
+    docs = await chat_index.search(query, request.scanId)
+    if docs:
+        context += f"\n\nRelevant findings and tool output from stored scans:\n{format_context(docs)}"
+    
+    return history + [{
+        "role": "user",
+        "content": f"""You are a cybersecurity AI assistant helping analyze security scans.{context}
 
 User question: {request.prompt}
 
 Provide a helpful, concise response focused on security recommendations."""
-            }]
+    }], docs
+
+def chat_sources(docs: List[Document]) -> List[dict]:
+    return [{"id": doc.id, "scanId": doc.scan_id, "kind": doc.kind} for doc in docs]
+
+@app.post("/api/chat")
+async def chat(request: ChatRequest):
+    """AI Assistant chat endpoint; pass the returned sessionId back to continue the conversation"""
+    session_id = request.sessionId or str(uuid.uuid4())
+    docs: List[Document] = []
+    try:
+        messages, docs = await build_chat_messages(request)
+        message = await get_gateway().create(
+            lane=Lane.INTERACTIVE,
+            model=LLM_MODEL,
+            max_tokens=1000,
+            messages=messages
         )
         
         response_text = message.content[0].text
+        chat_sessions.record(session_id, request.prompt, response_text)
         
         return {
             "message": ChatMessage(
@@ -505,7 +787,9 @@ Provide a helpful, concise response focused on security recommendations."""
                 sender="ai",
                 text=response_text,
                 time="Just now"
-            )
+            ),
+            "sessionId": session_id,
+            "sources": chat_sources(docs)
         }
     
     except Exception as e:
@@ -515,9 +799,55 @@ Provide a helpful, concise response focused on security recommendations."""
                 sender="ai",
                 text=f"Sorry, I encountered an error: {str(e)}",
                 time="Just now"
-            )
+            ),
+            "sessionId": session_id,
+            "sources": chat_sources(docs)
         }
 
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """AI Assistant chat, streamed token by token over Server-Sent Events
+
+    Emits `token` events as text arrives and a final `message` event with
+    the complete ChatMessage plus the sessionId and the sources retrieved
+    into the prompt. If the browser disconnects the upstream request is
+    closed straight away.
+    """
+    message_id = str(uuid.uuid4())
+    session_id = request.sessionId or str(uuid.uuid4())
+    
+    async def stream():
+        parts = []
+        docs: List[Document] = []
+        try:
+            messages, docs = await build_chat_messages(request)
+            async with get_gateway().stream(
+                lane=Lane.INTERACTIVE,
+                model=LLM_MODEL,
+                max_tokens=1000,
+                messages=messages
+            ) as upstream:
+                async for text in upstream.text_stream:
+                    if await http_request.is_disconnected():
+                        print(f"Chat client went away, cancelling upstream request {message_id}")
+                        return
+                    parts.append(text)
+                    yield sse_event("token", {"id": message_id, "text": text})
+            response_text = "".join(parts)
+            chat_sessions.record(session_id, request.prompt, response_text)
+        except Exception as e:
+            response_text = f"Sorry, I encountered an error: {str(e)}"
+            yield sse_event("error", {"id": message_id, "error": str(e)})
+        
+        final = ChatMessage(id=message_id, sender="ai", text=response_text, time="Just now")
+        yield sse_event("message", {**final.model_dump(), "sessionId": session_id, "sources": chat_sources(docs)})
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/")
 async def root():
     return {"status": "Recon Copilot API running", "version": "2.0"}
@@ -527,6 +857,15 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus scrape endpoint: queue, tool, LLM, persistence and HTTP timings"""
+    if job_queue is not None:
+        for state, count in (await job_queue.counts()).items():
+            SCAN_JOBS.set(count, state=state)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 # scanme.nmap.org     # Best option - public test server
 # localhost           # Will scan your machine
 # 127.0.0.1          # Same as localhost
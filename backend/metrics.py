@@ -0,0 +1,271 @@
+import asyncio
+import bisect
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Print one line per timed span as well (noisy; for chasing a slow scan by hand)
+METRICS_LOG_SPANS = os.environ.get("METRICS_LOG_SPANS", "").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(9))  # 256 B .. 16 MiB
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class Metric:
+    """One Prometheus metric family; samples are keyed by their label values.
+
+    Everything runs on the event loop thread, so updates are plain dict
+    operations with no locking.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _label_text(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{self._label_text(key)} {_number(value)}" for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    """A value that is set directly, or read from `function` at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(
+        self, name: str, help: str, labels: Sequence[str] = (), function: Optional[Callable[[], float]] = None
+    ):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.function = function
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def samples(self) -> List[str]:
+        if self.function is not None:
+            return [f"{self.name} {_number(self.function())}"]
+        return [f"{self.name}{self._label_text(key)} {_number(value)}" for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket (+Inf last), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the block took, whether or not it raised"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe(elapsed, **labels)
+            if METRICS_LOG_SPANS:
+                fields = " ".join(f"{k}={v}" for k, v in labels.items())
+                print(f"span {self.name} {fields} seconds={elapsed:.3f}")
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="%s"' % ("+Inf" if bound == float("inf") else _number(bound))
+                lines.append(f"{self.name}_bucket{self._label_text(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._label_text(key)} {cumulative}")
+        return lines
+
+
+REGISTRY: List[Metric] = []
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+async def serve(port: int, host: str = "0.0.0.0") -> asyncio.AbstractServer:
+    """Answer GET /metrics with render() on its own port, for processes that have no API (worker.py)"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = (await reader.readline()).split()
+            while (await reader.readline()).strip():
+                pass  # headers
+            if request[:1] == [b"GET"] and request[1:2] and request[1].split(b"?")[0] == b"/metrics":
+                status, body = b"200 OK", render().encode()
+            else:
+                status, body = b"404 Not Found", b"Not found\n"
+            writer.write(
+                b"HTTP/1.1 " + status + b"\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                + b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# --- Scan pipeline -----------------------------------------------------------
+
+SCAN_QUEUE_WAIT = Histogram(
+    "scan_queue_wait_seconds", "Time a scan waited in the queue before a worker picked it up", ["priority"]
+)
+TOOL_SLOT_WAIT = Histogram(
+    "tool_slot_wait_seconds", "Time a scan waited for one of the tool's concurrency slots", ["tool"]
+)
+TOOL_RUN = Histogram(
+    "tool_run_seconds", "Wall time of a tool run; source=reused for cached or shared output", ["tool", "source"]
+)
+TOOL_OUTPUT_BYTES = Histogram(
+    "tool_output_bytes", "Size of a tool run's stdout", ["tool"], buckets=SIZE_BUCKETS
+)
+TOOL_PARSE = Histogram(
+    "tool_parse_seconds", "Time spent in a tool's streaming parser over one run", ["tool"]
+)
+TOOL_RECORDS = Histogram(
+    "tool_records", "Records parsed from one tool run", ["tool"], buckets=COUNT_BUCKETS
+)
+TOOL_FAILURES = Counter("tool_failures_total", "Tool runs that errored, timed out or were killed", ["tool"])
+ANALYSIS = Histogram(
+    "scan_analysis_seconds", "LLM analysis of a scan's output, including cache lookups", ["source"]
+)
+FINDINGS_PERSIST = Histogram("findings_persist_seconds", "Time to write a scan's findings to the store")
+FINDINGS_PERSISTED = Counter("findings_persisted_total", "Findings written to the store")
+SCAN_DURATION = Histogram("scan_duration_seconds", "Scan run time from start to finish", ["status"])
+
+# --- LLM ------------------------------------------------------------------------
+
+LLM_REQUEST = Histogram(
+    "llm_request_seconds", "Latency of an LLM call including lane and rate-limit waits",
+    ["lane", "call", "outcome"],
+)
+LLM_THROTTLE = Histogram("llm_throttle_seconds", "Time an LLM call waited for a lane slot and rate budget", ["lane"])
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by the API", ["lane", "direction"])
+LLM_RETRIES = Counter("llm_retries_total", "LLM calls retried after a 429/529", ["status"])
+
+# --- HTTP -----------------------------------------------------------------------
+
+HTTP_REQUEST = Histogram(
+    "http_request_duration_seconds", "Time until the response headers are sent, per route",
+    ["method", "route", "status"],
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every request up to its response headers.
+
+    Streaming responses (SSE, chat) are measured to their first byte, so a
+    long-lived event stream doesn't skew the route's latency.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[object, str] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_timed(message):
+            nonlocal status, started
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                self._observe(scope, status, started)
+                started = None
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            if started is not None:  # failed before any response was started
+                self._observe(scope, status, started)
+
+    def _observe(self, scope, status: int, started: float):
+        HTTP_REQUEST.observe(
+            time.perf_counter() - started, method=scope["method"], route=self._route(scope), status=status
+        )
+
+    def _route(self, scope) -> str:
+        # The router leaves the matched endpoint in the scope; label by its path
+        # template so /api/scans/{scan_id} is one series, not one per scan
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._routes.get(endpoint)
+        if path is None:
+            app = scope.get("app")
+            for route in getattr(app, "routes", ()):
+                if getattr(route, "endpoint", None) is endpoint:
+                    path = self._routes[endpoint] = route.path
+                    break
+            else:
+                return "unmatched"
+        return path
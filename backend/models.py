@@ -1,9 +1,10 @@
 from datetime import datetime
-from typing import List, Optional
-from pydantic import BaseModel
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
 from enum import Enum
 
 class ScanStatus(str, Enum):
+    QUEUED = "Queued"
     IN_PROGRESS = "In Progress"
     COMPLETED = "Completed"
     CLEAN = "Clean"
@@ -15,6 +16,11 @@ class Tool(str, Enum):
     NIKTO = "Nikto"
     OPENVAS = "OpenVAS"
 
+class ScanPriority(str, Enum):
+    HIGH = "High"
+    NORMAL = "Normal"
+    LOW = "Low"
+
 class Severity(str, Enum):
     CRITICAL = "Critical"
     HIGH = "High"
@@ -27,6 +33,31 @@ class FindingStatus(str, Enum):
     IN_PROGRESS = "In Progress"
     RESOLVED = "Resolved"
 
+class FindingChange(str, Enum):
+    NEW = "New"
+    CHANGED = "Changed"
+    UNCHANGED = "Unchanged"
+    RESOLVED = "Resolved"
+    UNVERIFIED = "Unverified"  # carried over from the baseline; its tool did not report this time
+
+class StageStatus(str, Enum):
+    PLANNED = "Planned"
+    RUNNING = "Running"
+    DONE = "Done"
+    SKIPPED = "Skipped"
+    FAILED = "Failed"
+
+class PlanStage(BaseModel):
+    tool: Tool
+    endpoint: Optional[str] = None  # URL, for web tools run once per discovered HTTP(S) service
+    dependsOn: Optional[Tool] = None  # stage that must finish first (nmap's service discovery)
+    status: StageStatus = StageStatus.PLANNED
+    reason: Optional[str] = None  # why a stage was skipped or failed
+    cpuSeconds: Optional[float] = None  # measured once the tool exits
+    peakRssMb: Optional[float] = None
+    wallSeconds: Optional[float] = None
+    cached: bool = False  # output reused instead of running the tool again
+
 class Scan(BaseModel):
     id: str
     target: str
@@ -40,6 +71,36 @@ class Scan(BaseModel):
     riskScore: int  # 0-100
     summary: str
     aiSummary: str
+    priority: ScanPriority = ScanPriority.NORMAL
+    queuePosition: Optional[int] = None  # 1-based, set while status is Queued
+    queueDepth: Optional[int] = None  # total scans waiting when last refreshed
+    baselineScanId: Optional[str] = None  # previous scan a differential rescan was compared to
+    newFindings: Optional[int] = None
+    resolvedFindings: Optional[int] = None
+    campaignId: Optional[str] = None  # set on scans created by a batch campaign
+    plan: List[PlanStage] = Field(default_factory=list)  # tool stages, filled in as the scan runs
+    cpuSeconds: Optional[float] = None  # total across the scan's tools
+    peakRssMb: Optional[float] = None  # largest single tool
+    deferredAnalysis: bool = False  # analysis waits for a Message Batch once the tools finish
+
+class Campaign(BaseModel):
+    id: str
+    name: str
+    targets: List[str]  # as submitted: hosts, CIDR ranges and globs
+    tools: List[Tool]
+    startedAt: str  # ISO timestamp
+    status: ScanStatus
+    hostCount: int
+    shardCount: int
+    shardsDone: int = 0
+    issues: int = 0
+    critical: int = 0
+    riskScore: int = 0  # 0-100
+    severityCounts: Dict[str, int] = Field(default_factory=dict)
+    durationMinutes: Optional[int] = None
+    summary: str = ""
+    aiSummary: str = ""
+    priority: ScanPriority = ScanPriority.NORMAL
 
 class Finding(BaseModel):
     id: str
@@ -53,6 +114,9 @@ class Finding(BaseModel):
     title: str
     description: str
     recommendation: str
+    createdAt: str = Field(default_factory=lambda: datetime.now().isoformat())
+    dedupKey: Optional[str] = None  # same issue on the same host/port gets the same key
+    change: Optional[FindingChange] = None  # set on differential rescans only
 
 class ChatMessage(BaseModel):
     id: str
@@ -63,7 +127,21 @@ class ChatMessage(BaseModel):
 class StartScanRequest(BaseModel):
     target: str
     tools: List[Tool]
+    maxParallelTools: Optional[int] = None  # defaults to SCAN_TOOL_CONCURRENCY
+    priority: ScanPriority = ScanPriority.NORMAL
+    differential: bool = False  # compare against the last completed scan of this target
+    forceRefresh: bool = False  # run every tool even if a fresh cached result exists
+    deferredAnalysis: bool = False  # analyze in the next Message Batch: cheaper and off the shared rate limit, but slower
+
+class StartCampaignRequest(BaseModel):
+    targets: List[str]  # e.g. "10.0.0.0/24", "web-[1-8].corp.local", "*.corp.local" (matches known targets)
+    tools: List[Tool]
+    name: Optional[str] = None
+    shardSize: Optional[int] = None  # hosts per worker task, defaults to CAMPAIGN_SHARD_SIZE
+    maxParallelShards: Optional[int] = None  # defaults to CAMPAIGN_PROCESSES
+    priority: ScanPriority = ScanPriority.NORMAL
 
 class ChatRequest(BaseModel):
     prompt: str
-    scanId: Optional[str] = None
\ No newline at end of file
+    scanId: Optional[str] = None
+    sessionId: Optional[str] = None  # continue an earlier conversation (returned by the first reply)
@@ -0,0 +1,343 @@
+import hashlib
+import json
+import re
+import uuid
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from models import Finding, FindingStatus, Severity, Tool
+
+
+@dataclass
+class ServiceRecord:
+    """One port from nmap's XML report"""
+    host: str
+    port: int
+    protocol: str
+    state: str
+    service: str = ""
+    product: str = ""
+    version: str = ""
+    extrainfo: str = ""
+    tunnel: str = ""  # "ssl" when nmap saw TLS in front of the service
+    hostname: str = ""
+    address: str = ""
+
+    @property
+    def banner(self) -> str:
+        return " ".join(part for part in (self.product, self.version, self.extrainfo) if part)
+
+
+@dataclass
+class TemplateMatch:
+    """One nuclei JSONL result"""
+    host: str
+    template_id: str
+    name: str
+    severity: str
+    matched_at: str
+    port: Optional[int] = None
+    description: str = ""
+    remediation: str = ""
+    references: List[str] = field(default_factory=list)
+
+
+@dataclass
+class NiktoItem:
+    """One '+ ' item line from nikto"""
+    host: str
+    port: Optional[int]
+    message: str
+    url: str = ""
+    item_id: str = ""
+
+
+class NmapXmlParser:
+    """Incremental parser for `nmap -oX -`; emits records as each <host> closes"""
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("end",))
+
+    def feed(self, line: str) -> List[ServiceRecord]:
+        self._parser.feed(line + "\n")
+        return self._drain()
+
+    def close(self) -> List[ServiceRecord]:
+        try:
+            self._parser.close()
+        except ET.ParseError:
+            pass  # truncated output (timeout/cancel): keep whatever hosts completed
+        return self._drain()
+
+    def _drain(self) -> List[ServiceRecord]:
+        records = []
+        try:
+            for _, elem in self._parser.read_events():
+                if elem.tag == "host":
+                    records.extend(_nmap_host(elem))
+                    elem.clear()
+        except ET.ParseError:
+            pass
+        return records
+
+
+def _nmap_host(elem) -> List[ServiceRecord]:
+    address = ""
+    for addr in elem.findall("address"):
+        if addr.get("addrtype") in ("ipv4", "ipv6"):
+            address = addr.get("addr", "")
+            break
+    hostname_elem = elem.find("hostnames/hostname")
+    hostname = hostname_elem.get("name", "") if hostname_elem is not None else ""
+
+    records = []
+    for port in elem.findall("ports/port"):
+        state = port.find("state")
+        service = port.find("service")
+        svc = service.attrib if service is not None else {}
+        records.append(ServiceRecord(
+            host=hostname or address,
+            hostname=hostname,
+            address=address,
+            port=int(port.get("portid", 0)),
+            protocol=port.get("protocol", "tcp"),
+            state=state.get("state", "") if state is not None else "",
+            service=svc.get("name", ""),
+            product=svc.get("product", ""),
+            version=svc.get("version", ""),
+            extrainfo=svc.get("extrainfo", ""),
+            tunnel=svc.get("tunnel", ""),
+        ))
+    return records
+
+
+def _text(value) -> str:
+    return value if isinstance(value, str) else ""
+
+
+def _references(value) -> List[str]:
+    """Nuclei templates give `reference` as a list, a single URL, or null"""
+    if isinstance(value, str):
+        return [value] if value.strip() else []
+    if isinstance(value, list):
+        return [item for item in value if isinstance(item, str) and item.strip()]
+    return []
+
+
+class NucleiJsonlParser:
+    """Parser for `nuclei -jsonl`: one JSON object per line"""
+
+    def feed(self, line: str) -> List[TemplateMatch]:
+        line = line.strip()
+        if not line.startswith("{"):
+            return []
+        try:
+            result = json.loads(line)
+        except ValueError:
+            return []
+        if not isinstance(result, dict):
+            return []
+        # Templates may emit null or the wrong type for any of these; one odd template must not lose the run
+        info = result.get("info")
+        if not isinstance(info, dict):
+            info = {}
+        port = result.get("port")
+        return [TemplateMatch(
+            host=_text(result.get("host")),
+            template_id=_text(result.get("template-id")),
+            name=_text(info.get("name")) or _text(result.get("template-id")),
+            severity=_text(info.get("severity")) or "unknown",
+            matched_at=_text(result.get("matched-at")),
+            port=int(port) if str(port).isdigit() else None,
+            description=_text(info.get("description")).strip(),
+            remediation=_text(info.get("remediation")).strip(),
+            references=_references(info.get("reference")),
+        )]
+
+    def close(self) -> List[TemplateMatch]:
+        return []
+
+
+NIKTO_META = re.compile(
+    r"^(Target (IP|Hostname|Port)|Start Time|End Time|SSL Info|\d+ requests?:|\d+ host\(s\) tested)"
+)
+NIKTO_ITEM = re.compile(r"^(?:(?P<id>(OSVDB|CVE)-[\w-]+): )?(?:(?P<url>/\S*?): )?(?P<msg>.+)$")
+
+
+class NiktoLineParser:
+    """Parser for nikto's console report.
+
+    Nikto only writes its JSON/XML formats to a file once the run ends,
+    whereas every finding is printed as a '+ ' line the moment it is
+    found, so the line format is what can be parsed incrementally.
+    """
+
+    def __init__(self, target: str):
+        self.host = target
+        self.port: Optional[int] = None
+
+    def feed(self, line: str) -> List[NiktoItem]:
+        if not line.startswith("+ "):
+            return []
+        body = line[2:].strip()
+        if body.startswith("Target Port:"):
+            value = body.split(":", 1)[1].strip()
+            self.port = int(value) if value.isdigit() else None
+            return []
+        if NIKTO_META.match(body):
+            return []
+        match = NIKTO_ITEM.match(body)
+        if not match:
+            return []
+        return [NiktoItem(
+            host=self.host,
+            port=self.port,
+            item_id=match.group("id") or "",
+            url=match.group("url") or "",
+            message=match.group("msg").strip(),
+        )]
+
+    def close(self) -> List[NiktoItem]:
+        return []
+
+
+# Tools whose output is parsed into records (OpenVAS output stays free text)
+PARSED_TOOLS = {Tool.NMAP, Tool.NIKTO, Tool.NUCLEI}
+
+
+def parser_for(tool: Tool, target: str):
+    if tool == Tool.NMAP:
+        return NmapXmlParser()
+    if tool == Tool.NUCLEI:
+        return NucleiJsonlParser()
+    if tool == Tool.NIKTO:
+        return NiktoLineParser(target)
+    return None
+
+
+# Services that are a finding in their own right when reachable
+EXPOSED_SERVICE_SEVERITY: Dict[str, Severity] = {
+    "telnet": Severity.HIGH,
+    "ftp": Severity.MEDIUM,
+    "mysql": Severity.MEDIUM,
+    "postgresql": Severity.MEDIUM,
+    "ms-sql-s": Severity.MEDIUM,
+    "mongodb": Severity.MEDIUM,
+    "redis": Severity.MEDIUM,
+    "memcached": Severity.MEDIUM,
+    "vnc": Severity.MEDIUM,
+    "ms-wbt-server": Severity.MEDIUM,
+    "microsoft-ds": Severity.MEDIUM,
+}
+
+NUCLEI_SEVERITY: Dict[str, Severity] = {
+    "critical": Severity.CRITICAL,
+    "high": Severity.HIGH,
+    "medium": Severity.MEDIUM,
+    "low": Severity.LOW,
+}
+
+
+def dedup_key(tool: Tool, host: str, port: Optional[int], identifier: str) -> str:
+    """Stable identity of a finding across scans of the same host"""
+    raw = f"{tool.value}|{host.lower()}|{port or ''}|{identifier}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def to_finding(scan_id: str, tool: Tool, record) -> Optional[Finding]:
+    if isinstance(record, ServiceRecord):
+        if record.state != "open":
+            return None
+        name = record.service or "unknown"
+        label = f"{name} over TLS" if record.tunnel == "ssl" else name
+        severity = EXPOSED_SERVICE_SEVERITY.get(name, Severity.INFO)
+        return Finding(
+            id=str(uuid.uuid4()),
+            scanId=scan_id,
+            host=record.host,
+            port=record.port,
+            service=label.upper() if len(label) <= 5 else label,
+            severity=severity,
+            tool=tool,
+            status=FindingStatus.OPEN,
+            title=f"Open {record.protocol}/{record.port}: {record.banner or name}",
+            description=f"{name} is reachable on {record.host}:{record.port}/{record.protocol}"
+                        + (f" ({record.banner})" if record.banner else ""),
+            recommendation="Confirm this service needs to be exposed; restrict it with firewall rules if not"
+                           if severity != Severity.INFO else "No action needed if this exposure is expected",
+            dedupKey=dedup_key(tool, record.host, record.port, f"{record.protocol}/{name}"),
+        )
+
+    if isinstance(record, TemplateMatch):
+        return Finding(
+            id=str(uuid.uuid4()),
+            scanId=scan_id,
+            host=record.host,
+            port=record.port,
+            service=None,
+            severity=NUCLEI_SEVERITY.get(record.severity.lower(), Severity.INFO),
+            tool=tool,
+            status=FindingStatus.OPEN,
+            title=record.name,
+            description=record.description or f"{record.template_id} matched at {record.matched_at}",
+            recommendation=record.remediation or "Review the matched template and apply the vendor fix",
+            dedupKey=dedup_key(tool, record.host, record.port, f"{record.template_id}|{record.matched_at}"),
+        )
+
+    if isinstance(record, NiktoItem):
+        if record.item_id:
+            severity = Severity.MEDIUM
+        elif "header" in record.message.lower():
+            severity = Severity.LOW
+        else:
+            severity = Severity.INFO if record.message.startswith("Server:") else Severity.LOW
+        return Finding(
+            id=str(uuid.uuid4()),
+            scanId=scan_id,
+            host=record.host,
+            port=record.port,
+            service="HTTP",
+            severity=severity,
+            tool=tool,
+            status=FindingStatus.OPEN,
+            title=(f"{record.url}: " if record.url else "") + record.message[:120],
+            description=record.message,
+            recommendation="Review the flagged path or header and harden the web server configuration",
+            dedupKey=dedup_key(tool, record.host, record.port, record.item_id or f"{record.url}|{record.message}"),
+        )
+
+    return None
+
+
+def build_findings(scan_id: str, tool_records: Dict[Tool, list]) -> List[Finding]:
+    """Findings for every parsed record, one per dedup key"""
+    findings: Dict[str, Finding] = {}
+    for tool, records in tool_records.items():
+        for record in records:
+            finding = to_finding(scan_id, tool, record)
+            if finding is not None:
+                findings.setdefault(finding.dedupKey, finding)
+    return list(findings.values())
+
+
+def digest(tool: Tool, records: list) -> str:
+    """Compact, banner-free text summary of a tool's parsed records for the prompt"""
+    if tool == Tool.NMAP:
+        lines = []
+        for r in records:
+            if r.state != "open":
+                continue
+            tls = " (tls)" if r.tunnel == "ssl" else ""
+            lines.append(f"{r.host} {r.port}/{r.protocol} {r.service or 'unknown'}{tls} {r.banner}".rstrip())
+        return "\n".join(lines) or "No open ports found"
+    if tool == Tool.NUCLEI:
+        lines = [f"[{r.severity}] {r.template_id} {r.name} @ {r.matched_at}" for r in records]
+        return "\n".join(lines) or "No vulnerabilities detected by Nuclei"
+    if tool == Tool.NIKTO:
+        lines = [
+            " ".join(part for part in (r.item_id, f"{r.url}:" if r.url else "", r.message) if part)
+            for r in records
+        ]
+        return "\n".join(lines) or "No items reported by Nikto"
+    return ""
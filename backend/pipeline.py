@@ -0,0 +1,95 @@
+import dataclasses
+from dataclasses import dataclass
+from typing import List, Optional
+
+from models import PlanStage, StageStatus, Tool
+from parsers import ServiceRecord
+from scanners import LineCallback, ToolOutput, run_nikto, run_nuclei
+
+# Tools that only make sense against a web server
+WEB_TOOLS = (Tool.NUCLEI, Tool.NIKTO)
+
+HTTP_SERVICES = {"http", "https", "http-alt", "https-alt", "http-proxy", "http-mgmt", "ssl/http", "ssl/https"}
+TLS_SERVICES = {"https", "https-alt", "ssl/http", "ssl/https"}
+# nmap often reports a bare "ssl" service on these when it can't see past the handshake
+TLS_WEB_PORTS = {443, 8443, 9443}
+
+
+@dataclass(frozen=True)
+class HttpEndpoint:
+    host: str
+    port: int
+    tls: bool
+
+    @property
+    def url(self) -> str:
+        scheme = "https" if self.tls else "http"
+        default = 443 if self.tls else 80
+        return f"{scheme}://{self.host}" + ("" if self.port == default else f":{self.port}")
+
+
+def http_endpoints(records: List[ServiceRecord], host: str) -> List[HttpEndpoint]:
+    """HTTP(S) services nmap found open, addressed by the scanned host name"""
+    endpoints = {}
+    for record in records:
+        if record.state != "open":
+            continue
+        name = record.service.lower()
+        is_http = name in HTTP_SERVICES or name.startswith("http")
+        if not is_http and not (name == "ssl" and record.port in TLS_WEB_PORTS):
+            continue
+        tls = record.tunnel == "ssl" or name in TLS_SERVICES or name == "ssl"
+        endpoints.setdefault(record.port, HttpEndpoint(host, record.port, tls))
+    return [endpoints[port] for port in sorted(endpoints)]
+
+
+def depends_on_discovery(tool: Tool, tools: List[Tool]) -> bool:
+    return tool in WEB_TOOLS and Tool.NMAP in tools
+
+
+def initial_plan(tools: List[Tool]) -> List[PlanStage]:
+    """One stage per tool; web tools wait for nmap's service list when nmap is selected"""
+    return [
+        PlanStage(tool=tool, dependsOn=Tool.NMAP if depends_on_discovery(tool, tools) else None)
+        for tool in tools
+    ]
+
+
+def expand_plan(plan: List[PlanStage], endpoints: List[HttpEndpoint]) -> List[PlanStage]:
+    """Replace each waiting web stage with one stage per endpoint, or mark it skipped"""
+    expanded = []
+    for stage in plan:
+        if stage.dependsOn != Tool.NMAP or stage.endpoint is not None:
+            expanded.append(stage)
+        elif not endpoints:
+            expanded.append(stage.model_copy(update={
+                "status": StageStatus.SKIPPED, "reason": "nmap found no HTTP(S) services",
+            }))
+        else:
+            expanded.extend(
+                stage.model_copy(update={"endpoint": endpoint.url}) for endpoint in endpoints
+            )
+    return expanded
+
+
+def find_stage(plan: List[PlanStage], tool: Tool, endpoint: Optional[HttpEndpoint] = None) -> PlanStage:
+    url = endpoint.url if endpoint else None
+    return next(stage for stage in plan if stage.tool == tool and stage.endpoint == url)
+
+
+def skipped_output(tool: Tool, reason: str) -> ToolOutput:
+    # ok=True: "nothing to scan" is a real result, so earlier web findings count as resolved
+    return ToolOutput(tool, f"=== {tool.name} ===\nSkipped: {reason}")
+
+
+async def run_on_endpoint(
+    tool: Tool, endpoint: HttpEndpoint, on_line: LineCallback = None, refresh: bool = False
+) -> ToolOutput:
+    if tool == Tool.NIKTO:
+        output = await run_nikto(endpoint.host, on_line, port=endpoint.port, tls=endpoint.tls, refresh=refresh)
+    elif tool == Tool.NUCLEI:
+        output = await run_nuclei(endpoint.url, on_line, refresh=refresh)
+    else:
+        raise ValueError(f"{tool.value} does not run per endpoint")
+    body = output.section.partition("\n")[2]
+    return dataclasses.replace(output, section=f"=== {tool.name} {endpoint.url} ===\n{body}", endpoint=endpoint.url)
@@ -0,0 +1,232 @@
+import asyncio
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from condense import chunk_section
+from llm import estimate_tokens
+from models import Finding, Scan, ScanStatus
+from storage import FINDINGS, SCANS, RevisionExpired, ScanRepository
+
+RETRIEVAL_DIR = os.environ.get(
+    "RETRIEVAL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "retrieval")
+)
+# Size of each indexed piece of tool output
+RETRIEVAL_CHUNK_TOKENS = int(os.environ.get("RETRIEVAL_CHUNK_TOKENS", "300"))
+# Most documents, and most tokens of them, put into one chat prompt
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", "8"))
+RETRIEVAL_CONTEXT_TOKENS = int(os.environ.get("RETRIEVAL_CONTEXT_TOKENS", "1500"))
+# Score multiplier for documents from the scan the user is looking at
+RETRIEVAL_SCAN_BOOST = float(os.environ.get("RETRIEVAL_SCAN_BOOST", "1.5"))
+# Changes read from the store per round trip while catching up
+RETRIEVAL_BATCH = 1000
+
+FINISHED_STATUSES = {ScanStatus.COMPLETED, ScanStatus.CLEAN, ScanStatus.FAILED}
+
+TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from", "has", "have", "how",
+    "i", "in", "is", "it", "of", "on", "or", "that", "the", "this", "to", "was", "we", "what", "which",
+    "who", "with", "any", "our", "my", "me", "can", "there", "their", "them", "these", "those",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+@dataclass
+class Document:
+    id: str
+    scan_id: str
+    kind: str  # "finding" or "output"
+    text: str
+
+
+class BM25Index:
+    """In-memory inverted index ranked with Okapi BM25.
+
+    Documents can be added, replaced and removed one at a time, so the
+    index is kept current without ever being rebuilt.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs: Dict[str, Document] = {}
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)  # term -> doc id -> term frequency
+        self.lengths: Dict[str, int] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, doc: Document):
+        self.remove(doc.id)
+        terms = Counter(tokenize(doc.text))
+        for term, count in terms.items():
+            self.postings[term][doc.id] = count
+        self.docs[doc.id] = doc
+        self.lengths[doc.id] = sum(terms.values())
+        self.total_length += self.lengths[doc.id]
+
+    def remove(self, doc_id: str):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for term in set(tokenize(doc.text)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[term]
+        self.total_length -= self.lengths.pop(doc_id)
+
+    def search(self, query: str, limit: int, boost_scan: Optional[str] = None) -> List[Tuple[float, Document]]:
+        if not self.docs:
+            return []
+        count = len(self.docs)
+        average = self.total_length / count or 1
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, frequency in posting.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / average)
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        if boost_scan is not None:
+            for doc_id in scores:
+                if self.docs[doc_id].scan_id == boost_scan:
+                    scores[doc_id] *= RETRIEVAL_SCAN_BOOST
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(score, self.docs[doc_id]) for doc_id, score in best]
+
+
+def finding_document(finding: Finding) -> Document:
+    where = f"{finding.host}:{finding.port}" if finding.port else finding.host
+    service = f" ({finding.service})" if finding.service else ""
+    text = (
+        f"[{finding.severity.value} finding, {finding.tool.value}, {finding.status.value}] {where}{service} "
+        f"{finding.title}. {finding.description} Fix: {finding.recommendation}"
+    )
+    return Document(f"finding:{finding.id}", finding.scanId, "finding", text)
+
+
+def save_scan_output(scan_id: str, target: str, sections: List[str]):
+    """Keep a finished scan's tool output for the chat index.
+
+    Written by whichever process ran the scan; an API process indexes it
+    once it sees the scan finish in the change feed.
+    """
+    chunks = [
+        f"[tool output from {target}] {chunk}"
+        for section in sections for chunk in chunk_section(section, RETRIEVAL_CHUNK_TOKENS)
+    ]
+    os.makedirs(RETRIEVAL_DIR, exist_ok=True)
+    path = _output_path(scan_id)
+    with open(path + ".tmp", "w") as f:
+        json.dump(chunks, f)
+    os.replace(path + ".tmp", path)
+
+
+def _output_path(scan_id: str) -> str:
+    return os.path.join(RETRIEVAL_DIR, f"{scan_id}.json")
+
+
+def _load_output(scan_id: str) -> Optional[List[str]]:
+    try:
+        with open(_output_path(scan_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class ChatIndex:
+    """BM25 index over every finding and every finished scan's tool output.
+
+    Like DashboardStats it follows the store's revision feed, so each
+    search first applies only what changed since the previous one, and
+    scans run by other worker processes are searchable too.
+    """
+
+    def __init__(self, repo: ScanRepository):
+        self.repo = repo
+        self.index = BM25Index()
+        self.revisions: Dict[str, Optional[int]] = {SCANS: None, FINDINGS: None}
+        self.outputs: Dict[str, List[str]] = {}  # scan id -> ids of its indexed output chunks
+        self._lock = asyncio.Lock()
+
+    async def search(self, query: str, scan_id: Optional[str] = None) -> List[Document]:
+        """Best matches for `query`, at most RETRIEVAL_TOP_K and RETRIEVAL_CONTEXT_TOKENS in total"""
+        async with self._lock:
+            await self._catch_up()
+            results = self.index.search(query, RETRIEVAL_TOP_K * 3, boost_scan=scan_id)
+        chosen, used = [], 0
+        for _, doc in results:
+            tokens = estimate_tokens(doc.text)
+            if used + tokens > RETRIEVAL_CONTEXT_TOKENS:
+                continue
+            chosen.append(doc)
+            used += tokens
+            if len(chosen) == RETRIEVAL_TOP_K:
+                break
+        return chosen
+
+    async def _catch_up(self):
+        for collection in (SCANS, FINDINGS):
+            try:
+                await self._follow(collection, self.revisions[collection] or 0)
+            except RevisionExpired:
+                print(f"Chat index fell behind {collection} tombstones, rebuilding from storage")
+                self.index = BM25Index()
+                self.outputs = {}
+                self.revisions = {SCANS: None, FINDINGS: None}
+                await self._catch_up()
+                return
+
+    async def _follow(self, collection: str, since: int):
+        while True:
+            changes = await self.repo.changes(collection, since, RETRIEVAL_BATCH)
+            if collection == SCANS:
+                for scan in changes.items:
+                    self._put_scan(scan)
+                for scan_id in changes.deleted:
+                    self._forget_output(scan_id)
+                    try:
+                        os.remove(_output_path(scan_id))
+                    except OSError:
+                        pass
+            else:
+                for finding in changes.items:
+                    self.index.add(finding_document(finding))
+                for finding_id in changes.deleted:
+                    self.index.remove(f"finding:{finding_id}")
+            since = self.revisions[collection] = changes.revision
+            if not changes.has_more:
+                return
+
+    def _put_scan(self, scan: Scan):
+        if scan.status not in FINISHED_STATUSES:
+            return
+        # A scan that is rerun (e.g. requeued after its worker died) replaces its earlier output
+        self._forget_output(scan.id)
+        chunks = _load_output(scan.id) or []
+        ids = [f"output:{scan.id}:{i}" for i in range(len(chunks))]
+        for doc_id, chunk in zip(ids, chunks):
+            self.index.add(Document(doc_id, scan.id, "output", chunk))
+        self.outputs[scan.id] = ids
+
+    def _forget_output(self, scan_id: str):
+        for doc_id in self.outputs.pop(scan_id, []):
+            self.index.remove(doc_id)
+
+
+def format_context(docs: List[Document]) -> str:
+    return "\n\n".join(doc.text for doc in docs)
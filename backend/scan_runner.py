@@ -0,0 +1,680 @@
+"""Running scans and campaigns: tools, analysis and the stores they write to.
+
+Shared by the API process (main.py), which runs scans on its scheduler,
+and by worker.py, which runs them off the shared job queue, so a worker
+builds only what a scan needs and none of the API's own state.
+"""
+import asyncio
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from analysis_cache import AnalysisCache, analysis_key
+from archive import OutputArchive
+from batches import BatchAnalyzer
+from campaigns import (
+    score_findings, scan_shard, shard_tool_limits, get_process_pool, CAMPAIGN_PROCESSES
+)
+from condense import condense, chunk_section, over_budget
+from differential import diff_findings, delta_text
+from events import ScanEventBroadcaster
+from executor import gather_limited, SCAN_TOOL_CONCURRENCY
+from llm import get_gateway, Lane, LLM_MODEL, LLM_CONCURRENCY, estimate_tokens
+from metrics import ANALYSIS, FINDINGS_PERSIST, FINDINGS_PERSISTED, SCAN_DURATION
+from models import Scan, Finding, Campaign, ScanStatus, StageStatus, Tool, Severity, FindingStatus
+from parsers import build_findings, PARSED_TOOLS
+from pipeline import (
+    HttpEndpoint, initial_plan, expand_plan, find_stage, http_endpoints, depends_on_discovery,
+    run_on_endpoint, skipped_output
+)
+from retrieval import save_scan_output
+from scanners import TOOL_RUNNERS, ToolOutput, records_by_tool
+from scheduler import ScanScheduler
+from storage import ScanRepository, ListQuery, create_repository
+
+# Child scans read per page when loading a campaign
+CAMPAIGN_PAGE_SIZE = 1000
+
+# Scans and findings live behind the repository (SQLite unless STORAGE_BACKEND=memory)
+repo: ScanRepository = create_repository()
+active_scans: Dict[str, bool] = {}  # Track cancellations
+
+scheduler = ScanScheduler()
+analysis_cache = AnalysisCache()
+# worker.py swaps this for a publisher that writes events to the job queue
+scan_events = ScanEventBroadcaster()
+# Raw tool stdout, compressed outside the scan records (see GET /api/scans/{id}/output)
+output_archive = OutputArchive()
+# Analyses of scans started with deferredAnalysis, sent together through the Message Batches API
+batch_analyzer = BatchAnalyzer()
+
+# Bump whenever the analysis prompt changes so cached answers are not reused
+ANALYSIS_PROMPT_VERSION = "2"
+
+ANALYSIS_FORMAT = """Format as:
+ISSUES: <number>
+CRITICAL: <number>
+RISK_SCORE: <number>
+SUMMARY: <text>
+AI_SUMMARY: <text>"""
+
+async def request_analysis(prompt: str) -> str:
+    """One analysis call on the background lane; returns the reply text"""
+    message = await get_gateway().create(
+        lane=Lane.BACKGROUND,
+        model=LLM_MODEL,
+        max_tokens=2000,
+        messages=[{"role": "user", "content": prompt}]
+    )
+    return message.content[0].text
+
+def analysis_prompt(target: str, tools_used: str, combined_output: str, part: str = "") -> str:
+    """Ask Claude to score the combined tool output (or one part of it)"""
+    return f"""Analyze this security scan for {target} using multiple security tools:
+
+Tools used: {tools_used}
+{part}
+{combined_output}
+
+Provide:
+1. Issue count (estimate total vulnerabilities found across all tools)
+2. Critical issue count (high-severity findings)
+3. Risk score (0-100, where 100 is most dangerous)
+4. Brief summary (1-2 sentences for table display)
+5. Detailed AI summary (2-3 sentences explaining key findings and recommended actions)
+
+Note: If OpenVAS results are marked as "simulated", still analyze them as if real.
+
+{ANALYSIS_FORMAT}"""
+
+def merge_prompt(target: str, tools_used: str, partials: List[str]) -> str:
+    """Combine per-chunk analyses into one answer in the same format"""
+    parts = "\n\n".join(f"--- Part {i + 1} ---\n{text}" for i, text in enumerate(partials))
+    return f"""The security scan output for {target} was too large for one pass, so each part below was analyzed separately.
+
+Tools used: {tools_used}
+
+{parts}
+
+Merge these into one overall analysis. Add up issue counts, but do not count the same vulnerability twice if several parts report it. The risk score should reflect the most serious findings, not an average.
+
+{ANALYSIS_FORMAT}"""
+
+def output_prompts(target: str, tools_used: str, sections: List[str]) -> List[str]:
+    """Condense the tool sections into one analysis prompt, or one per chunk when they exceed the token budget.
+
+    Several prompts need their replies combined with merge_prompt afterwards.
+    """
+    condensed = condense(sections)
+    combined_output = "\n\n".join(condensed)
+    if not over_budget(combined_output):
+        return [analysis_prompt(target, tools_used, combined_output)]
+
+    chunks = [chunk for section in condensed for chunk in chunk_section(section)]
+    print(f"Output is ~{estimate_tokens(combined_output)} tokens, analyzing in {len(chunks)} chunks")
+    return [
+        analysis_prompt(
+            target, tools_used, chunk,
+            part=f"\nThis is part {i + 1} of {len(chunks)} of the output; analyze only what is shown here.\n"
+        )
+        for i, chunk in enumerate(chunks)
+    ]
+
+async def run_analysis(target: str, tools_used: str, prompts: List[str]) -> str:
+    """Analyze synchronously: one call, or one per chunk plus a merge"""
+    if len(prompts) == 1:
+        return await request_analysis(prompts[0])
+    partials = await gather_limited([request_analysis(prompt) for prompt in prompts], LLM_CONCURRENCY)
+    return await request_analysis(merge_prompt(target, tools_used, partials))
+
+class ScanCancelled(Exception):
+    pass
+
+async def previous_scan(target: str, scan_id: str) -> Optional[Scan]:
+    """Most recent completed scan of the same target, other than this one"""
+    query = ListQuery(filters={"target": target}, sort="startedAt", descending=True, limit=20)
+    while True:
+        page = await repo.page_scans(query)
+        for scan in page.items:
+            if scan.id != scan_id and scan.status in (ScanStatus.COMPLETED, ScanStatus.CLEAN):
+                return scan
+        if not page.next_cursor:
+            return None
+        query.cursor = page.next_cursor
+
+def format_analysis(scan: Scan) -> str:
+    """A stored scan's results in the analysis reply format"""
+    return (f"ISSUES: {scan.issues}\nCRITICAL: {scan.critical}\nRISK_SCORE: {scan.riskScore}\n"
+            f"SUMMARY: {scan.summary}\nAI_SUMMARY: {scan.aiSummary}")
+
+def delta_prompt(target: str, tools_used: str, baseline: Scan, delta: str) -> str:
+    """Update the baseline scan's analysis with only what changed since then"""
+    return f"""This is a rescan of {target}. Below is the analysis of the previous scan ({baseline.startedAt}) and what has changed since.
+
+Tools used: {tools_used}
+
+Previous analysis:
+{format_analysis(baseline)}
+
+Changes since the previous scan:
+{delta}
+
+Give the updated analysis of the target's current state: keep what still applies from the previous analysis, add the new and changed findings, and drop resolved ones. Mention notable new or resolved findings in the summaries.
+
+{ANALYSIS_FORMAT}"""
+
+def parse_analysis(response_text: str) -> Tuple[int, int, int, str, str]:
+    """(issues, critical, riskScore, summary, aiSummary) from an analysis reply"""
+    issues = 0
+    critical = 0
+    risk_score = 50
+    summary = "Analysis complete"
+    ai_summary = "Security scan completed"
+    
+    for line in response_text.split('\n'):
+        if line.startswith('ISSUES:'):
+            issues = int(line.split(':')[1].strip())
+        elif line.startswith('CRITICAL:'):
+            critical = int(line.split(':')[1].strip())
+        elif line.startswith('RISK_SCORE:'):
+            risk_score = int(line.split(':')[1].strip())
+        elif line.startswith('SUMMARY:'):
+            summary = line.split(':', 1)[1].strip()
+        elif line.startswith('AI_SUMMARY:'):
+            ai_summary = line.split(':', 1)[1].strip()
+    return issues, critical, risk_score, summary, ai_summary
+
+async def record_analysis(scan_id: str, target: str, tools: List[Tool], response_text: str,
+                          findings: List[Finding], summary_finding: bool = True, **fields) -> Optional[Scan]:
+    """Store an analysis reply on its scan, along with the scan's findings"""
+    issues, critical, risk_score, summary, ai_summary = parse_analysis(response_text)
+    print(f"\n--- Updating scan results ---")
+    print(f"Issues: {issues}, Critical: {critical}, Risk: {risk_score}%")
+    
+    scan = await repo.update_scan(
+        scan_id,
+        status=ScanStatus.COMPLETED if issues > 0 else ScanStatus.CLEAN,
+        issues=issues,
+        critical=critical,
+        riskScore=risk_score,
+        summary=summary,
+        aiSummary=ai_summary,
+        **fields
+    )
+    
+    if not findings and summary_finding and issues > 0:
+        # Nothing parseable (e.g. OpenVAS only): record the analysis as a single finding
+        finding_id = str(uuid.uuid4())
+        findings = [Finding(
+            id=finding_id,
+            scanId=scan_id,
+            host=target,
+            port=80,
+            service="HTTP",
+            severity=Severity.CRITICAL if critical > 0 else Severity.HIGH,
+            tool=tools[0],
+            status=FindingStatus.OPEN,
+            title=f"Security issue detected on {target}",
+            description=summary,
+            recommendation="Review scan details and apply recommended patches"
+        )]
+    if findings:
+        with FINDINGS_PERSIST.time():
+            await repo.save_findings(findings)
+        FINDINGS_PERSISTED.inc(len(findings))
+    return scan
+
+def minutes_since(started: datetime) -> int:
+    return int((datetime.now() - started).total_seconds() // 60)
+
+async def defer_analysis(scan_id: str, target: str, tools: List[Tool], cache_key: str, prompts: List[str],
+                         findings: List[Finding], results: dict, started: datetime):
+    """Keep what the tools found now and leave the analysis to the next Message Batch"""
+    if findings:
+        with FINDINGS_PERSIST.time():
+            await repo.save_findings(findings)
+        FINDINGS_PERSISTED.inc(len(findings))
+    await batch_analyzer.defer(scan_id, prompts, {
+        "target": target,
+        "tools": [tool.value for tool in tools],
+        "cacheKey": cache_key,
+        "findings": len(findings),
+        "results": results,
+        "startedAt": started.isoformat(),  # durationMinutes runs until the batch reply is recorded
+        "deferredAt": time.time(),
+    })
+    # Stays In Progress until finish_deferred_analysis records the reply
+    await repo.update_scan(scan_id, summary="Tools finished, analysis deferred to the next batch", **results)
+    print(f"=== SCAN {scan_id}: analysis deferred ({len(prompts)} requests) ===\n")
+    scan_events.publish(scan_id, "analysis_deferred", requests=len(prompts))
+
+async def finish_deferred_analysis(scan_id: str, replies: List[str], context: dict) -> Optional[List[str]]:
+    """BatchAnalyzer handler: merge partial analyses in another round, else record the analysis"""
+    target = context["target"]
+    tools = [Tool(tool) for tool in context["tools"]]
+    if len(replies) > 1:
+        return [merge_prompt(target, ", ".join(tool.value for tool in tools), replies)]
+
+    scan = await repo.get_scan(scan_id)
+    if scan is None or scan.status != ScanStatus.IN_PROGRESS:
+        return None  # deleted, cancelled or rerun since it was deferred
+    await analysis_cache.put(context["cacheKey"], replies[0])
+    ANALYSIS.observe(time.time() - context["deferredAt"], source="batch")
+    # Deferred before startedAt was kept: durationMinutes is already in the results
+    started = context.get("startedAt")
+    duration = {"durationMinutes": minutes_since(datetime.fromisoformat(started))} if started else {}
+    scan = await record_analysis(
+        scan_id, target, tools, replies[0], [], summary_finding=not context["findings"], **context["results"],
+        **duration
+    )
+    print(f"=== SCAN {scan_id} COMPLETED (batch analysis) ===\n")
+    scan_events.publish(scan_id, "completed", scan=scan.model_dump())
+    return None
+
+async def fail_deferred_analysis(scan_id: str, error: str, context: dict):
+    """BatchAnalyzer failure handler: the analysis could not be done, so the scan fails with the reason"""
+    scan = await repo.get_scan(scan_id)
+    if scan is None or scan.status != ScanStatus.IN_PROGRESS:
+        return
+    await repo.update_scan(
+        scan_id,
+        status=ScanStatus.FAILED,
+        summary="Scan failed: the deferred analysis could not be completed",
+        aiSummary=f"Error during analysis: {error}"
+    )
+    print(f"=== SCAN {scan_id} FAILED (batch analysis: {error}) ===\n")
+    scan_events.publish(scan_id, "failed", error=error)
+
+async def run_scan(
+    scan_id: str,
+    target: str,
+    tools: List[Tool],
+    max_parallel_tools: Optional[int] = None,
+    differential: bool = False,
+    force_refresh: bool = False,
+    deferred_analysis: bool = False,
+):
+    """Background task to actually run the scan"""
+    print(f"\n=== STARTING SCAN {scan_id} ===")
+    print(f"Target: {target}")
+    print(f"Tools: {tools}")
+    
+    start_time = datetime.now()
+    started = time.perf_counter()
+    outcome = "failed"
+    
+    try:
+        if not active_scans.get(scan_id, False):
+            raise ScanCancelled()
+        await repo.update_scan(scan_id, status=ScanStatus.IN_PROGRESS, summary="Scan in progress...")
+        scan_events.publish(scan_id, "started", target=target, tools=tools)
+
+        plan = initial_plan(tools)
+
+        async def save_plan():
+            measured = [stage for stage in plan if stage.cpuSeconds is not None]
+            await repo.update_scan(
+                scan_id,
+                plan=[stage.model_copy() for stage in plan],
+                cpuSeconds=round(sum(stage.cpuSeconds for stage in measured), 2) if measured else None,
+                peakRssMb=max(stage.peakRssMb for stage in measured) if measured else None
+            )
+            scan_events.publish(scan_id, "plan", plan=[stage.model_dump() for stage in plan])
+
+        async def run_tool(tool: Tool, endpoint: Optional[HttpEndpoint] = None) -> ToolOutput:
+            stage = find_stage(plan, tool, endpoint)
+            where = endpoint.url if endpoint else None
+            scan_events.publish(scan_id, "tool_queued", tool=tool, endpoint=where)
+            async with scheduler.tool_slot(tool):
+                if not active_scans.get(scan_id, False):
+                    raise ScanCancelled()
+                print(f"\n--- Running {tool} on {where or target} ---")
+                scan_events.publish(scan_id, "tool_started", tool=tool, endpoint=where)
+                stage.status = StageStatus.RUNNING
+                await save_plan()
+                received = 0
+                archived = output_archive.stream(scan_id, tool.value, where)
+
+                def on_line(line: str):
+                    nonlocal received
+                    archived.write(line)
+                    received += len(line) + 1
+                    scan_events.publish(
+                        scan_id, "tool_output", tool=tool, endpoint=where, line=line, bytes=received
+                    )
+
+                output: Optional[ToolOutput] = None
+                try:
+                    if endpoint is None:
+                        output = await TOOL_RUNNERS[tool](target, on_line, refresh=force_refresh)
+                    else:
+                        output = await run_on_endpoint(tool, endpoint, on_line, refresh=force_refresh)
+                except (Exception, asyncio.CancelledError) as e:
+                    cancelled = isinstance(e, asyncio.CancelledError)
+                    stage.status = StageStatus.FAILED
+                    stage.reason = "Cancelled" if cancelled else (str(e) or type(e).__name__)
+                    raise
+                finally:
+                    if not received and output is not None:
+                        archived.write_text(output.raw)  # a runner that did not stream its output
+                    await archived.close()
+                stage.status = StageStatus.DONE if output.ok else StageStatus.FAILED
+                stage.cached = output.cached
+                if output.usage:
+                    stage.cpuSeconds = round(output.usage.cpu_seconds, 2)
+                    stage.peakRssMb = round(output.usage.peak_rss_kb / 1024, 1)
+                    stage.wallSeconds = round(output.usage.wall_seconds, 2)
+                scan_events.publish(
+                    scan_id, "tool_finished", tool=tool, endpoint=where,
+                    bytes=len(output.raw), records=len(output.records), cached=output.cached
+                )
+                return output
+
+        async def discovery_then_web(web_tools: List[Tool]) -> List[ToolOutput]:
+            """nmap first, then each web tool once per HTTP(S) service it found"""
+            nonlocal plan
+            nmap_output = await run_tool(Tool.NMAP)
+            endpoints = http_endpoints(nmap_output.records, target)
+            plan = expand_plan(plan, endpoints)
+            await save_plan()
+            if not endpoints:
+                print(f"No HTTP(S) services on {target}, skipping {', '.join(t.value for t in web_tools)}")
+                return [nmap_output] + [skipped_output(tool, "nmap found no HTTP(S) services") for tool in web_tools]
+            web = await gather_limited([run_tool(tool, ep) for ep in endpoints for tool in web_tools], limit)
+            return [nmap_output] + web
+
+        # Independent tools run side by side (capped per scan); web tools follow nmap's discovery
+        limit = max_parallel_tools or SCAN_TOOL_CONCURRENCY
+        web_tools = [tool for tool in tools if depends_on_discovery(tool, tools)]
+        stages = [discovery_then_web(web_tools)] if web_tools else []
+        stages += [
+            run_tool(tool) for tool in tools
+            if not depends_on_discovery(tool, tools) and not (web_tools and tool == Tool.NMAP)
+        ]
+        await save_plan()
+        try:
+            groups = await gather_limited(stages, limit)
+        finally:
+            await save_plan()
+        tool_outputs: List[ToolOutput] = []
+        for group in groups:
+            tool_outputs.extend(group if isinstance(group, list) else [group])
+        # The prompt (and cache key) sees each tool's parsed digest rather than its raw banners
+        all_output = [output.section for output in tool_outputs]
+        findings = build_findings(scan_id, records_by_tool(tool_outputs))
+
+        baseline = await previous_scan(target, scan_id) if differential else None
+        diff = None
+        if baseline is not None:
+            parsed = {o.tool for o in tool_outputs if o.ok and o.tool in PARSED_TOOLS}
+            diff = diff_findings(scan_id, await repo.list_findings(baseline.id), findings, parsed)
+            findings = diff.findings
+            # Free-text output (OpenVAS, tool errors) cannot be diffed, so it is always sent in full
+            unparsed = [o.section for o in tool_outputs if not (o.ok and o.tool in PARSED_TOOLS)]
+            print(f"Differential against {baseline.id}: {len(diff.new)} new, {len(diff.changed)} changed, "
+                  f"{len(diff.unchanged)} unchanged, {len(diff.resolved)} resolved")
+
+        if not active_scans.get(scan_id, False):
+            raise ScanCancelled()
+        
+        combined_output = "\n\n".join(all_output)
+        print(f"\n--- Sending to Claude for analysis ---")
+        print(f"Total output length: {len(combined_output)} chars")
+        
+        tools_used = ", ".join([str(t.value) for t in tools])
+
+        scan_events.publish(scan_id, "analysis_started", bytes=len(combined_output))
+        analysis_started = time.perf_counter()
+        update = None
+        if diff is not None and (diff.has_changes or unparsed):
+            delta = "\n\n".join([delta_text(diff)] + condense(unparsed))
+            update = delta_prompt(target, tools_used, baseline, delta)
+            # The delta cannot be split without each part restating the baseline, so a
+            # rescan with this much new material gets the chunked full analysis instead
+            if over_budget(update):
+                print(f"Delta is ~{estimate_tokens(update)} tokens, analyzing the full output instead")
+                update = None
+        cache_key = analysis_key(target, tools, all_output, ANALYSIS_PROMPT_VERSION,
+                                 baseline_id=baseline.id if update else None)
+        response_text = await analysis_cache.get(cache_key)
+        cached = response_text is not None
+        prompts: List[str] = []
+        if cached:
+            print(f"Analysis cache hit ({cache_key[:12]}), skipping Claude call")
+            source = "cache"
+        elif diff is not None and not diff.has_changes and not unparsed:
+            print("Nothing changed since the baseline scan, reusing its analysis")
+            response_text = format_analysis(baseline)
+            source = "baseline"
+        elif update:
+            prompts = [update]
+            source = "delta"
+        else:
+            prompts = output_prompts(target, tools_used, all_output)
+            source = "full"
+
+        # Written before the scan is marked finished, which is when the chat index picks it up
+        try:
+            save_scan_output(scan_id, target, all_output)
+        except OSError as e:
+            print(f"Could not keep tool output for chat: {e}")
+
+        results = {
+            "baselineScanId": baseline.id if baseline else None,
+            "newFindings": len(diff.new) if diff else None,
+            "resolvedFindings": len(diff.resolved) if diff else None,
+        }
+        if prompts and deferred_analysis:
+            await defer_analysis(scan_id, target, tools, cache_key, prompts, findings, results, start_time)
+            outcome = "deferred"
+            return
+
+        if prompts:
+            response_text = await run_analysis(target, tools_used, prompts)
+            await analysis_cache.put(cache_key, response_text)
+        ANALYSIS.observe(time.perf_counter() - analysis_started, source=source)
+        scan_events.publish(scan_id, "analysis_finished", cached=cached, differential=diff is not None)
+
+        print(f"\n--- Claude response ---")
+        print(response_text)
+        
+        scan = await record_analysis(
+            scan_id, target, tools, response_text, findings, durationMinutes=minutes_since(start_time), **results
+        )
+        print(f"=== SCAN {scan_id} COMPLETED ===\n")
+        
+        outcome = scan.status.value.lower()
+        scan_events.publish(scan_id, "completed", scan=scan.model_dump())
+    
+    except ScanCancelled:
+        # cancel_scan cleared the active flag and has already published "cancelled"; just make
+        # sure no progress written since then overwrites the cancellation
+        print(f"Scan {scan_id} was cancelled")
+        outcome = "cancelled"
+        await repo.update_scan(
+            scan_id,
+            status=ScanStatus.FAILED,
+            summary="Scan cancelled by user",
+            aiSummary="Scan was cancelled before completion"
+        )
+    
+    except asyncio.CancelledError:
+        # The task itself was cancelled and the tools' process groups killed: by cancel_scan (which
+        # clears the active flag first), or by the scheduler or a worker shutting down
+        by_user = not active_scans.get(scan_id, False)
+        outcome = "cancelled" if by_user else "interrupted"
+        print(f"Scan {scan_id} was {outcome}")
+        if by_user:
+            await repo.update_scan(
+                scan_id,
+                status=ScanStatus.FAILED,
+                summary="Scan cancelled by user",
+                aiSummary="Scan was cancelled before completion"
+            )  # cancel_scan publishes the "cancelled" event
+        else:
+            error = "its scan worker shut down"
+            await repo.update_scan(
+                scan_id,
+                status=ScanStatus.FAILED,
+                summary=f"Scan interrupted: {error}",
+                aiSummary=f"Error during scan: {error}"
+            )
+            scan_events.publish(scan_id, "failed", error=error)
+        raise
+
+    except Exception as e:
+        print(f"\n!!! SCAN {scan_id} FAILED !!!")
+        print(f"Error: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        
+        await repo.update_scan(
+            scan_id,
+            status=ScanStatus.FAILED,
+            summary=f"Scan failed: {str(e)}",
+            aiSummary=f"Error during scan: {str(e)}"
+        )
+        scan_events.publish(scan_id, "failed", error=str(e))
+    
+    finally:
+        active_scans[scan_id] = False
+        SCAN_DURATION.observe(time.perf_counter() - started, status=outcome)
+
+async def campaign_scans(campaign_id: str) -> List[Scan]:
+    """A campaign's child scans, riskiest first"""
+    scans = []
+    query = ListQuery(filters={"campaignId": campaign_id}, sort="riskScore", descending=True, limit=CAMPAIGN_PAGE_SIZE)
+    while True:
+        page = await repo.page_scans(query)
+        scans.extend(page.items)
+        if not page.next_cursor:
+            return scans
+        query.cursor = page.next_cursor
+
+async def finish_shard(campaign: Campaign, scans: List[Scan], results: Dict[str, List[ToolOutput]]):
+    """Store one shard's findings and score its child scans"""
+    findings: List[Finding] = []
+    finished = []
+    for scan in scans:
+        outputs = results.get(scan.target, [])
+        host_findings = build_findings(scan.id, records_by_tool(outputs))
+        issues, critical, risk_score = score_findings(host_findings)
+        failed = [output.tool.value for output in outputs if not output.ok]
+        findings.extend(host_findings)
+        for output in outputs:
+            archived = output_archive.stream(scan.id, output.tool.value, output.endpoint)
+            archived.write_text(output.raw)
+            await archived.close()
+        finished.append(scan.model_copy(update={
+            "status": ScanStatus.COMPLETED if issues > 0 else ScanStatus.CLEAN,
+            "issues": issues,
+            "critical": critical,
+            "riskScore": risk_score,
+            "summary": f"{len(host_findings)} findings, {critical} high or critical"
+                       + (f" ({', '.join(failed)} failed)" if failed else ""),
+            "durationMinutes": minutes_since(datetime.fromisoformat(campaign.startedAt)),
+        }))
+    await repo.save_findings(findings)
+    await repo.save_scans(finished)
+    return finished, findings
+
+async def run_queued_campaign(campaign_id: str, shard_ids: List[List[str]], max_parallel_shards: Optional[int]):
+    """worker.py entry point: load a queued campaign and its child scans, then run it"""
+    campaign = await repo.get_campaign(campaign_id)
+    if campaign is None:
+        return
+    scans = {scan.id: scan for scan in await campaign_scans(campaign_id)}
+    children = [[scans[scan_id] for scan_id in ids if scan_id in scans] for ids in shard_ids]
+    await run_campaign(campaign, [group for group in children if group], max_parallel_shards)
+
+async def run_campaign(campaign: Campaign, children: List[List[Scan]], max_parallel_shards: Optional[int]):
+    """Background task: fan the campaign's shards out to the process pool, then analyze the rollup"""
+    print(f"\n=== STARTING CAMPAIGN {campaign.id} ({campaign.hostCount} hosts, {campaign.shardCount} shards) ===")
+    start_time = datetime.now()
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    scored: List[Scan] = []
+    host_findings: Dict[str, List[Finding]] = {}
+    severity_counts: Dict[str, int] = {}
+    shards_done = 0
+    parallel_shards = max(1, min(max_parallel_shards or CAMPAIGN_PROCESSES, CAMPAIGN_PROCESSES, len(children)))
+    tool_limits = shard_tool_limits(scheduler.tool_limits, parallel_shards)
+    
+    async def run_shard(scans: List[Scan]):
+        nonlocal shards_done
+        if not active_scans.get(campaign.id, False):
+            await repo.save_scans([
+                s.model_copy(update={"status": ScanStatus.FAILED, "summary": "Scan cancelled by user"}) for s in scans
+            ])
+            return
+        hosts = [scan.target for scan in scans]
+        await repo.save_scans([
+            s.model_copy(update={"status": ScanStatus.IN_PROGRESS, "summary": "Scan in progress..."}) for s in scans
+        ])
+        try:
+            results = await loop.run_in_executor(pool, scan_shard, hosts, campaign.tools, tool_limits)
+            finished, findings = await finish_shard(campaign, scans, results)
+            scored.extend(finished)
+            for finding in findings:
+                host_findings.setdefault(finding.scanId, []).append(finding)
+                severity_counts[finding.severity.value] = severity_counts.get(finding.severity.value, 0) + 1
+        except Exception as e:
+            print(f"Campaign {campaign.id}: shard {hosts[0]}.. failed: {e!r}")
+            await repo.save_scans([s.model_copy(update={
+                "status": ScanStatus.FAILED, "summary": f"Scan failed: {e}", "aiSummary": f"Error during scan: {e}"
+            }) for s in scans])
+        shards_done += 1
+        await repo.update_campaign(campaign.id, shardsDone=shards_done)
+    
+    try:
+        await repo.update_campaign(campaign.id, status=ScanStatus.IN_PROGRESS, summary="Scan in progress...")
+        await gather_limited([run_shard(scans) for scans in children], parallel_shards)
+        if not active_scans.get(campaign.id, False):
+            raise ScanCancelled()
+        
+        # One analysis for the whole campaign over the riskiest hosts first
+        scored.sort(key=lambda s: s.riskScore, reverse=True)
+        sections = [
+            f"=== {s.target} (risk {s.riskScore}) ===\n"
+            + "\n".join(f"[{f.tool.value}] {f.severity.value} {f.title}" for f in host_findings.get(s.id, []))
+            for s in scored
+        ]
+        tools_used = ", ".join([str(t.value) for t in campaign.tools])
+        if scored:
+            name = f"{campaign.name} ({len(scored)} hosts)"
+            response_text = await run_analysis(name, tools_used, output_prompts(name, tools_used, sections))
+            issues, critical, risk_score, summary, ai_summary = parse_analysis(response_text)
+        else:
+            issues, critical, risk_score = 0, 0, 0
+            summary, ai_summary = "No hosts were scanned", "Every shard failed or the campaign was cancelled"
+        
+        await repo.update_campaign(
+            campaign.id,
+            status=ScanStatus.COMPLETED if issues > 0 else ScanStatus.CLEAN,
+            issues=issues,
+            critical=critical,
+            riskScore=risk_score,
+            severityCounts=severity_counts,
+            durationMinutes=minutes_since(start_time),
+            summary=summary,
+            aiSummary=ai_summary
+        )
+        print(f"=== CAMPAIGN {campaign.id} COMPLETED ===\n")
+    
+    except ScanCancelled:
+        print(f"Campaign {campaign.id} was cancelled")
+        await repo.update_campaign(campaign.id, shardsDone=shards_done)
+    
+    except Exception as e:
+        print(f"\n!!! CAMPAIGN {campaign.id} FAILED !!!")
+        print(f"Error: {str(e)}")
+        await repo.update_campaign(
+            campaign.id,
+            status=ScanStatus.FAILED,
+            summary=f"Campaign failed: {str(e)}",
+            aiSummary=f"Error during campaign: {str(e)}"
+        )
+    
+    finally:
+        active_scans[campaign.id] = False
@@ -0,0 +1,181 @@
+import asyncio
+import bisect
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from metrics import SCAN_QUEUE_WAIT, TOOL_SLOT_WAIT
+from models import ScanPriority, Tool
+
+# Max scans waiting for a worker before start_scan pushes back with 429
+SCAN_QUEUE_SIZE = int(os.environ.get("SCAN_QUEUE_SIZE", "100"))
+# Max scans running at once across the whole process
+SCAN_WORKERS = int(os.environ.get("SCAN_WORKERS", "4"))
+
+# Max concurrent runs of each tool across all scans (nmap is cheap, nuclei is heavy)
+DEFAULT_TOOL_LIMITS: Dict[Tool, int] = {
+    Tool.NMAP: 8,
+    Tool.NIKTO: 2,
+    Tool.NUCLEI: 2,
+    Tool.OPENVAS: 2,
+}
+
+PRIORITY_RANK: Dict[ScanPriority, int] = {
+    ScanPriority.HIGH: 0,
+    ScanPriority.NORMAL: 1,
+    ScanPriority.LOW: 2,
+}
+
+
+def tool_limits_from_env() -> Dict[Tool, int]:
+    """DEFAULT_TOOL_LIMITS, overridable with e.g. SCAN_LIMIT_NUCLEI=1"""
+    return {
+        tool: int(os.environ.get(f"SCAN_LIMIT_{tool.name}", limit))
+        for tool, limit in DEFAULT_TOOL_LIMITS.items()
+    }
+
+
+class QueueFull(Exception):
+    pass
+
+
+@dataclass(order=True)
+class ScanJob:
+    sort_key: tuple
+    scan_id: str = field(compare=False)
+    target: str = field(compare=False)
+    run: Callable[[], Awaitable] = field(compare=False)
+    priority: ScanPriority = field(default=ScanPriority.NORMAL, compare=False)
+    queued_at: float = field(default_factory=time.monotonic, compare=False)
+
+
+class ScanScheduler:
+    """Bounded priority queue feeding a fixed pool of scan workers.
+
+    A queued job starts once a worker is free and no other scan of the
+    same target is running. Tool-level limits are taken separately by
+    the running scan through tool_slot(), so a scan only waits for the
+    heavy tools it actually uses.
+    """
+
+    def __init__(
+        self,
+        workers: int = SCAN_WORKERS,
+        max_queue: int = SCAN_QUEUE_SIZE,
+        tool_limits: Optional[Dict[Tool, int]] = None,
+    ):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.tool_limits = tool_limits or tool_limits_from_env()
+        self._tool_semaphores: Dict[Tool, asyncio.Semaphore] = {}
+        self._pending: List[ScanJob] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._active_targets: Set[str] = set()
+        self._seq = itertools.count()
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    @property
+    def is_full(self) -> bool:
+        return len(self._pending) >= self.max_queue
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    def submit(
+        self,
+        scan_id: str,
+        target: str,
+        run: Callable[[], Awaitable],
+        priority: ScanPriority = ScanPriority.NORMAL,
+    ):
+        """Queue a scan, raising QueueFull when the backlog is at capacity"""
+        if self.is_full:
+            raise QueueFull(f"Scan queue is full ({self.max_queue} pending)")
+
+        job = ScanJob(
+            sort_key=(PRIORITY_RANK[priority], next(self._seq)),
+            scan_id=scan_id,
+            target=_normalize_target(target),
+            run=run,
+            priority=priority,
+        )
+        bisect.insort(self._pending, job)
+        self._dispatch()
+
+    def cancel(self, scan_id: str) -> bool:
+        """Drop a scan that is still waiting; returns False if it already started"""
+        for i, job in enumerate(self._pending):
+            if job.scan_id == scan_id:
+                del self._pending[i]
+                return True
+        return False
+
+    def abort(self, scan_id: str) -> bool:
+        """Cancel a running scan; its tools' process groups are killed as the cancellation unwinds"""
+        task = self._running.get(scan_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    async def shutdown(self):
+        """Drop waiting scans and cancel running ones, waiting for their tools to be killed"""
+        self._pending.clear()
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def positions(self) -> Dict[str, int]:
+        """1-based queue position of every waiting scan"""
+        return {job.scan_id: i + 1 for i, job in enumerate(self._pending)}
+
+    @asynccontextmanager
+    async def tool_slot(self, tool: Tool):
+        semaphore = self._tool_semaphores.get(tool)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.tool_limits.get(tool, 1))
+            self._tool_semaphores[tool] = semaphore
+        with TOOL_SLOT_WAIT.time(tool=tool.value):
+            await semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def _dispatch(self):
+        i = 0
+        while len(self._running) < self.workers and i < len(self._pending):
+            job = self._pending[i]
+            if job.target in self._active_targets:
+                i += 1
+                continue
+            del self._pending[i]
+            SCAN_QUEUE_WAIT.observe(time.monotonic() - job.queued_at, priority=job.priority.value)
+            self._active_targets.add(job.target)
+            self._running[job.scan_id] = asyncio.create_task(self._run(job))
+
+    async def _run(self, job: ScanJob):
+        try:
+            await job.run()
+        except Exception as e:
+            print(f"Scheduler: scan {job.scan_id} raised {e!r}")
+        finally:
+            self._running.pop(job.scan_id, None)
+            self._active_targets.discard(job.target)
+            self._dispatch()
+
+
+def _normalize_target(target: str) -> str:
+    target = target.strip().lower()
+    for prefix in ("http://", "https://"):
+        if target.startswith(prefix):
+            target = target[len(prefix):]
+    return target.split("/", 1)[0]
@@ -0,0 +1,263 @@
+import asyncio
+import heapq
+import os
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from models import Finding, Scan, ScanStatus, Severity, Tool
+from storage import FINDINGS, SCANS, RevisionExpired, ScanRepository
+
+# Rolling windows reported for per-tool counts, in hours
+STATS_WINDOWS: Dict[str, int] = {"24h": 24, "7d": 7 * 24, "30d": 30 * 24}
+# Riskiest targets listed on the dashboard
+STATS_TOP_TARGETS = int(os.environ.get("STATS_TOP_TARGETS", "10"))
+# Changes read from the store per round trip while catching up
+STATS_BATCH = 1000
+
+# Scans whose risk score is final
+SCORED_STATUSES = {ScanStatus.COMPLETED, ScanStatus.CLEAN}
+
+# What one record adds to the aggregates, kept so it can be taken back out on update or delete
+ScanShare = Tuple[str, str, int, Tuple[str, ...], Optional[int]]  # status, target, risk, tools, hour
+FindingShare = Tuple[str, str, str, Optional[int]]  # status, severity, tool, hour
+
+
+def _hour(timestamp: str) -> Optional[int]:
+    try:
+        return int(datetime.fromisoformat(timestamp).timestamp() // 3600)
+    except (TypeError, ValueError):
+        return None
+
+
+def scan_share(scan: Scan) -> ScanShare:
+    return (
+        scan.status.value, scan.target, scan.riskScore,
+        tuple(tool.value for tool in scan.tools), _hour(scan.startedAt),
+    )
+
+
+def finding_share(finding: Finding) -> FindingShare:
+    return finding.status.value, finding.severity.value, finding.tool.value, _hour(finding.createdAt or "")
+
+
+class Aggregates:
+    """Running totals over every stored scan and finding.
+
+    Each record's share is remembered by id; applying a newer version of
+    the record subtracts the old share before adding the new one.
+    """
+
+    def __init__(self):
+        self.scans: Dict[str, ScanShare] = {}
+        self.findings: Dict[str, FindingShare] = {}
+        self.scan_status: Counter = Counter()
+        self.scored = 0
+        self.risk_sum = 0
+        self.targets: Dict[str, List[int]] = {}  # target -> [scored scans, risk sum]
+        self.severity_by_status: Dict[str, Counter] = defaultdict(Counter)
+        self.tool_scans: Dict[str, Counter] = defaultdict(Counter)  # tool -> hour -> scans
+        self.tool_findings: Dict[str, Counter] = defaultdict(Counter)
+        self.tool_scan_totals: Counter = Counter()
+        self.tool_finding_totals: Counter = Counter()
+
+    def put_scan(self, scan: Scan):
+        self._scan(self.scans.get(scan.id), -1)
+        share = self.scans[scan.id] = scan_share(scan)
+        self._scan(share, 1)
+
+    def delete_scan(self, scan_id: str):
+        self._scan(self.scans.pop(scan_id, None), -1)
+
+    def put_finding(self, finding: Finding):
+        self._finding(self.findings.get(finding.id), -1)
+        share = self.findings[finding.id] = finding_share(finding)
+        self._finding(share, 1)
+
+    def delete_finding(self, finding_id: str):
+        self._finding(self.findings.pop(finding_id, None), -1)
+
+    def _scan(self, share: Optional[ScanShare], sign: int):
+        if share is None:
+            return
+        status, target, risk, tools, hour = share
+        _add(self.scan_status, status, sign)
+        if ScanStatus(status) in SCORED_STATUSES:
+            self.scored += sign
+            self.risk_sum += sign * risk
+            entry = self.targets.setdefault(target, [0, 0])
+            entry[0] += sign
+            entry[1] += sign * risk
+            if not entry[0]:
+                del self.targets[target]
+        for tool in tools:
+            _add(self.tool_scan_totals, tool, sign)
+            if hour is not None:
+                _add(self.tool_scans[tool], hour, sign)
+
+    def _finding(self, share: Optional[FindingShare], sign: int):
+        if share is None:
+            return
+        status, severity, tool, hour = share
+        _add(self.severity_by_status[status], severity, sign)
+        _add(self.tool_finding_totals, tool, sign)
+        if hour is not None:
+            _add(self.tool_findings[tool], hour, sign)
+
+    def report(self, target: Optional[str] = None) -> dict:
+        now = int(time.time() // 3600)
+        by_severity: Counter = Counter()
+        for counts in self.severity_by_status.values():
+            by_severity.update(counts)
+        riskiest = heapq.nlargest(
+            STATS_TOP_TARGETS, self.targets.items(), key=lambda item: item[1][1] / item[1][0]
+        )
+        report = {
+            "scans": {
+                "total": sum(self.scan_status.values()),
+                "byStatus": dict(self.scan_status),
+                "averageRisk": round(self.risk_sum / self.scored) if self.scored else 0,
+            },
+            "findings": {
+                "total": sum(by_severity.values()),
+                "bySeverity": {severity.value: by_severity.get(severity.value, 0) for severity in Severity},
+                "bySeverityAndStatus": {
+                    status: dict(counts) for status, counts in self.severity_by_status.items() if counts
+                },
+                "highCritical": by_severity.get(Severity.HIGH.value, 0) + by_severity.get(Severity.CRITICAL.value, 0),
+            },
+            "tools": {
+                "used": sum(1 for count in self.tool_scan_totals.values() if count),
+                "scans": self._windows(self.tool_scans, self.tool_scan_totals, now),
+                "findings": self._windows(self.tool_findings, self.tool_finding_totals, now),
+            },
+            "targets": {
+                "count": len(self.targets),
+                "riskiest": [_target_entry(name, entry) for name, entry in riskiest],
+            },
+        }
+        if target is not None:
+            entry = self.targets.get(target)
+            report["target"] = _target_entry(target, entry) if entry else None
+        return report
+
+    def _windows(self, by_hour: Dict[str, Counter], totals: Counter, now: int) -> Dict[str, dict]:
+        """Per-tool counts over each rolling window; cost depends on window length, not history"""
+        result = {}
+        for tool in Tool:
+            hours = by_hour.get(tool.value, {})
+            counts = {"total": totals.get(tool.value, 0)}
+            for name, length in STATS_WINDOWS.items():
+                counts[name] = sum(hours.get(hour, 0) for hour in range(now - length + 1, now + 1))
+            result[tool.value] = counts
+        return result
+
+    def differences(self, other: "Aggregates") -> List[str]:
+        """Names of the aggregates that disagree with `other`"""
+        mine, theirs = self._state(), other._state()
+        return [name for name, value in mine.items() if theirs[name] != value]
+
+    def _state(self) -> dict:
+        def nonempty(counters: Dict[str, Counter]) -> dict:
+            return {key: counter for key, counter in counters.items() if counter}
+
+        return {
+            "scanStatus": self.scan_status,
+            "scored": self.scored,
+            "riskSum": self.risk_sum,
+            "targets": self.targets,
+            "severityByStatus": nonempty(self.severity_by_status),
+            "toolScans": nonempty(self.tool_scans),
+            "toolFindings": nonempty(self.tool_findings),
+            "toolScanTotals": self.tool_scan_totals,
+            "toolFindingTotals": self.tool_finding_totals,
+        }
+
+
+def _add(counter: Counter, key, amount: int):
+    value = counter[key] + amount
+    if value:
+        counter[key] = value
+    else:
+        del counter[key]
+
+
+def _target_entry(target: str, entry: List[int]) -> dict:
+    return {"target": target, "scans": entry[0], "averageRisk": round(entry[1] / entry[0])}
+
+
+class DashboardStats:
+    """Dashboard aggregates kept current from the store's revision feed.
+
+    A read pulls only the scans and findings written or deleted since the
+    last read (see ScanRepository.changes), so it costs the same whether
+    the history holds a hundred scans or a million, and every worker
+    process sees writes made by the others.
+    """
+
+    def __init__(self, repo: ScanRepository):
+        self.repo = repo
+        self.aggregates = Aggregates()
+        self.revisions: Dict[str, Optional[int]] = {SCANS: None, FINDINGS: None}
+        self._lock = asyncio.Lock()
+
+    async def report(self, target: Optional[str] = None) -> dict:
+        async with self._lock:
+            await self._catch_up()
+            return {**self.aggregates.report(target), "revision": dict(self.revisions)}
+
+    async def verify(self, repair: bool = False) -> dict:
+        """Rebuild the aggregates from storage and compare them with the running ones"""
+        async with self._lock:
+            rebuilt = Aggregates()
+            revisions = {SCANS: 0, FINDINGS: 0}
+            # Both sides have to reach the same revisions before they can be compared
+            for _ in range(3):
+                for collection, since in revisions.items():
+                    revisions[collection] = await _replay(self.repo, collection, since, rebuilt)
+                await self._catch_up()
+                if revisions == self.revisions:
+                    break
+            else:
+                return {"consistent": None, "differences": None, "repaired": False, "revision": dict(self.revisions)}
+            differences = rebuilt.differences(self.aggregates)
+            if repair and differences:
+                print(f"Stats disagreed with storage on {', '.join(differences)}, replaced with the rebuild")
+                self.aggregates = rebuilt
+            return {
+                "consistent": not differences,
+                "differences": differences,
+                "repaired": bool(repair and differences),
+                "revision": dict(self.revisions),
+            }
+
+    async def _catch_up(self):
+        for collection, since in self.revisions.items():
+            try:
+                self.revisions[collection] = await _replay(self.repo, collection, since or 0, self.aggregates)
+            except RevisionExpired:
+                print(f"Stats fell behind {collection} tombstones, rebuilding from storage")
+                self.aggregates = Aggregates()
+                self.revisions = {SCANS: None, FINDINGS: None}
+                await self._catch_up()
+                return
+
+
+async def _replay(repo: ScanRepository, collection: str, since: int, aggregates: Aggregates) -> int:
+    """Apply every change after `since` to `aggregates`; returns the revision reached"""
+    while True:
+        changes = await repo.changes(collection, since, STATS_BATCH)
+        if collection == SCANS:
+            for scan in changes.items:
+                aggregates.put_scan(scan)
+            for scan_id in changes.deleted:
+                aggregates.delete_scan(scan_id)
+        else:
+            for finding in changes.items:
+                aggregates.put_finding(finding)
+            for finding_id in changes.deleted:
+                aggregates.delete_finding(finding_id)
+        since = changes.revision
+        if not changes.has_more:
+            return since
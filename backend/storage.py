@@ -0,0 +1,984 @@
+import asyncio
+import base64
+import bisect
+import json
+import os
+import queue
+import sqlite3
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from models import Campaign, Finding, Scan, Severity
+
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "sqlite")  # "sqlite" or "memory"
+DATABASE_PATH = os.environ.get(
+    "DATABASE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data", "recon.db"),
+)
+DATABASE_POOL_SIZE = int(os.environ.get("DATABASE_POOL_SIZE", "4"))
+# Deletions remembered per collection for ?sinceRevision= clients; older ones are forgotten
+TOMBSTONE_LIMIT = int(os.environ.get("TOMBSTONE_LIMIT", "10000"))
+
+# Collections with their own revision counter
+SCANS = "scans"
+FINDINGS = "findings"
+
+# Equality filters, sort keys and time field each listing supports
+SCAN_FILTERS = {"status", "tool", "target", "campaignId"}
+SCAN_SORTS = {"startedAt", "riskScore"}
+SCAN_TIME_FIELD = "startedAt"
+FINDING_FILTERS = {"status", "severity", "tool", "host", "scanId"}
+FINDING_SORTS = {"createdAt", "severity"}
+FINDING_TIME_FIELD = "createdAt"
+
+# Sorting by severity orders by rank, so "-severity" puts Critical first
+SEVERITY_RANK: Dict[Severity, int] = {
+    Severity.INFO: 0,
+    Severity.LOW: 1,
+    Severity.MEDIUM: 2,
+    Severity.HIGH: 3,
+    Severity.CRITICAL: 4,
+}
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+class RevisionExpired(InvalidQuery):
+    """Deletions after the requested revision have been forgotten; the client must reload in full"""
+
+
+@dataclass
+class ListQuery:
+    """One page request: equality filters, a time range, a sort and a keyset cursor"""
+    filters: Dict[str, str] = field(default_factory=dict)
+    since: Optional[str] = None  # inclusive, ISO timestamp
+    until: Optional[str] = None  # exclusive, ISO timestamp
+    sort: str = ""
+    descending: bool = True
+    limit: int = 100
+    cursor: Optional[str] = None
+
+
+@dataclass
+class Page:
+    items: list
+    next_cursor: Optional[str] = None
+
+
+@dataclass
+class Changes:
+    """Records written and ids deleted after a revision, oldest change first"""
+    items: list
+    deleted: List[str]
+    revision: int  # pass back as sinceRevision to continue from here
+    has_more: bool = False
+
+
+def parse_sort(sort: Optional[str], allowed: Set[str], default: str) -> Tuple[str, bool]:
+    """"-startedAt" -> ("startedAt", True)"""
+    sort = sort or f"-{default}"
+    descending = sort.startswith("-")
+    name = sort.lstrip("-+")
+    if name not in allowed:
+        raise InvalidQuery(f"Cannot sort by {name!r}; use one of {sorted(allowed)}")
+    return name, descending
+
+
+def encode_cursor(sort_value: Any, record_id: str) -> str:
+    raw = json.dumps([sort_value, record_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, record_id = json.loads(base64.urlsafe_b64decode(padded))
+        return sort_value, record_id
+    except Exception:
+        raise InvalidQuery("Malformed cursor")
+
+
+def scan_sort_value(scan: Scan, sort: str) -> Any:
+    return getattr(scan, sort)
+
+
+def finding_sort_value(finding: Finding, sort: str) -> Any:
+    if sort == "severity":
+        return SEVERITY_RANK[finding.severity]
+    return getattr(finding, sort)
+
+
+def scan_filter_values(scan: Scan) -> Dict[str, List[str]]:
+    return {
+        "status": [scan.status.value],
+        "tool": [tool.value for tool in scan.tools],
+        "target": [scan.target],
+        "campaignId": [scan.campaignId] if scan.campaignId else [],
+    }
+
+
+def finding_filter_values(finding: Finding) -> Dict[str, List[str]]:
+    return {
+        "status": [finding.status.value],
+        "severity": [finding.severity.value],
+        "tool": [finding.tool.value],
+        "host": [finding.host],
+        "scanId": [finding.scanId],
+    }
+
+
+class ScanRepository(ABC):
+    """Storage interface for scans and findings.
+
+    Every method is a coroutine so implementations backed by blocking
+    drivers can hand the work to a thread instead of stalling the loop.
+    """
+
+    @abstractmethod
+    async def get_scan(self, scan_id: str) -> Optional[Scan]:
+        ...
+
+    @abstractmethod
+    async def list_scans(self) -> List[Scan]:
+        ...
+
+    @abstractmethod
+    async def list_targets(self) -> List[str]:
+        """Every distinct target that has been scanned"""
+
+    @abstractmethod
+    async def save_scan(self, scan: Scan):
+        """Insert or replace a scan"""
+
+    @abstractmethod
+    async def save_scans(self, scans: List[Scan]):
+        """Insert or replace scans in a single batch"""
+
+    @abstractmethod
+    async def update_scan(self, scan_id: str, **fields) -> Optional[Scan]:
+        """Apply field updates to a stored scan; returns None if it does not exist"""
+
+    @abstractmethod
+    async def get_finding(self, finding_id: str) -> Optional[Finding]:
+        ...
+
+    @abstractmethod
+    async def list_findings(self, scan_id: Optional[str] = None) -> List[Finding]:
+        ...
+
+    @abstractmethod
+    async def save_findings(self, findings: List[Finding]):
+        """Insert or replace findings in a single batch"""
+
+    @abstractmethod
+    async def update_finding(self, finding_id: str, **fields) -> Optional[Finding]:
+        ...
+
+    @abstractmethod
+    async def page_scans(self, query: ListQuery) -> Page:
+        """One page of scans matching the query, in sort order"""
+
+    @abstractmethod
+    async def page_findings(self, query: ListQuery) -> Page:
+        ...
+
+    @abstractmethod
+    async def get_campaign(self, campaign_id: str) -> Optional[Campaign]:
+        ...
+
+    @abstractmethod
+    async def list_campaigns(self) -> List[Campaign]:
+        """All campaigns, newest first"""
+
+    @abstractmethod
+    async def save_campaign(self, campaign: Campaign):
+        ...
+
+    @abstractmethod
+    async def update_campaign(self, campaign_id: str, **fields) -> Optional[Campaign]:
+        ...
+
+    @abstractmethod
+    async def delete_scan(self, scan_id: str) -> bool:
+        """Remove a scan and its findings, leaving tombstones; returns False if it does not exist"""
+
+    @abstractmethod
+    async def revision(self, collection: str) -> int:
+        """Revision of the latest write to SCANS or FINDINGS; every write bumps it"""
+
+    @abstractmethod
+    async def changes(self, collection: str, since: int, limit: int) -> Changes:
+        """Records written and deleted after revision `since`, raising RevisionExpired
+        if deletions that far back are no longer known (since=0 never needs them)"""
+
+    @abstractmethod
+    async def seed_if_empty(self, scans: List[Scan], findings: List[Finding]) -> bool:
+        """Load seed data into a brand new store; returns True if it was loaded"""
+
+    async def close(self):
+        pass
+
+
+class RecordIndex:
+    """Secondary indexes over one in-memory collection, maintained on write.
+
+    Equality filters map each value to the set of matching ids; every
+    sortable field keeps a sorted list of (value, id) so a page is read
+    by bisecting to the cursor and walking forward, never by scanning
+    the whole collection.
+    """
+
+    def __init__(
+        self,
+        filter_values: Callable[[Any], Dict[str, List[str]]],
+        sort_value: Callable[[Any, str], Any],
+        sorts: Set[str],
+        time_field: str,
+    ):
+        self.filter_values = filter_values
+        self.sort_value = sort_value
+        self.time_field = time_field
+        self.equality: Dict[str, Dict[str, Set[str]]] = defaultdict(lambda: defaultdict(set))
+        self.ordered: Dict[str, List[tuple]] = {sort: [] for sort in sorts}
+
+    def add(self, record):
+        for name, values in self.filter_values(record).items():
+            for value in values:
+                self.equality[name][value].add(record.id)
+        for sort, entries in self.ordered.items():
+            bisect.insort(entries, (self.sort_value(record, sort), record.id))
+
+    def remove(self, record):
+        for name, values in self.filter_values(record).items():
+            for value in values:
+                ids = self.equality[name].get(value)
+                if ids is not None:
+                    ids.discard(record.id)
+                    if not ids:
+                        del self.equality[name][value]
+        for sort, entries in self.ordered.items():
+            key = (self.sort_value(record, sort), record.id)
+            i = bisect.bisect_left(entries, key)
+            if i < len(entries) and entries[i] == key:
+                del entries[i]
+
+    def page(self, records: Dict[str, Any], query: ListQuery) -> Page:
+        candidates: Optional[Set[str]] = None
+        for name, value in query.filters.items():
+            ids = self.equality[name].get(value, set())
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                return Page(items=[])
+
+        if candidates is not None and len(candidates) <= query.limit * 4:
+            # Selective filter: sorting the few matches beats walking the index
+            entries = sorted((self.sort_value(records[i], query.sort), i) for i in candidates)
+        else:
+            entries = self.ordered[query.sort]
+
+        if query.cursor:
+            after = tuple(decode_cursor(query.cursor))
+            if query.descending:
+                walk = range(bisect.bisect_left(entries, after) - 1, -1, -1)
+            else:
+                walk = range(bisect.bisect_right(entries, after), len(entries))
+        else:
+            walk = range(len(entries) - 1, -1, -1) if query.descending else range(len(entries))
+
+        items = []
+        for i in walk:
+            sort_value, record_id = entries[i]
+            if candidates is not None and record_id not in candidates:
+                continue
+            record = records[record_id]
+            moment = getattr(record, self.time_field)
+            if (query.since and moment < query.since) or (query.until and moment >= query.until):
+                continue
+            if len(items) == query.limit:
+                last = items[-1]
+                return Page(items=items, next_cursor=encode_cursor(self.sort_value(last, query.sort), last.id))
+            items.append(record)
+        return Page(items=items)
+
+
+class ChangeLog:
+    """Write order of one in-memory collection, for ?sinceRevision= deltas.
+
+    Each id sits in the log once, at the revision of its latest write or
+    deletion, so a delta walks back over what changed and nothing else.
+    """
+
+    def __init__(self):
+        self.revision = 0
+        self.pruned = 0  # revision of the newest forgotten tombstone
+        self._log: "OrderedDict[str, int]" = OrderedDict()
+        self._tombstones: "OrderedDict[str, int]" = OrderedDict()
+
+    def record(self, record_id: str, deleted: bool = False):
+        self.revision += 1
+        self._log[record_id] = self.revision
+        self._log.move_to_end(record_id)
+        if not deleted:
+            self._tombstones.pop(record_id, None)
+            return
+        self._tombstones[record_id] = self.revision
+        self._tombstones.move_to_end(record_id)
+        while len(self._tombstones) > TOMBSTONE_LIMIT:
+            forgotten, self.pruned = self._tombstones.popitem(last=False)
+            del self._log[forgotten]
+
+    def changes(self, records: Dict[str, Any], since: int, limit: int) -> Changes:
+        if 0 < since < self.pruned:
+            raise RevisionExpired(f"Deletions before revision {self.pruned} are no longer tracked")
+        newer = []
+        for record_id in reversed(self._log):
+            revision = self._log[record_id]
+            if revision <= since:
+                break
+            newer.append((revision, record_id))
+        newer.reverse()
+        page, has_more = newer[:limit], len(newer) > limit
+        return Changes(
+            items=[records[i] for _, i in page if i not in self._tombstones],
+            deleted=[i for _, i in page if i in self._tombstones],
+            revision=page[-1][0] if has_more else self.revision,
+            has_more=has_more,
+        )
+
+
+class MemoryRepository(ScanRepository):
+    """Dict-backed store: nothing survives a restart, handy for tests"""
+
+    def __init__(self):
+        self.scans: Dict[str, Scan] = {}
+        self.findings: Dict[str, Finding] = {}
+        self.campaigns: Dict[str, Campaign] = {}
+        self.scan_index = RecordIndex(scan_filter_values, scan_sort_value, SCAN_SORTS, SCAN_TIME_FIELD)
+        self.finding_index = RecordIndex(
+            finding_filter_values, finding_sort_value, FINDING_SORTS, FINDING_TIME_FIELD
+        )
+        self.changelogs: Dict[str, ChangeLog] = {SCANS: ChangeLog(), FINDINGS: ChangeLog()}
+
+    async def get_scan(self, scan_id: str) -> Optional[Scan]:
+        return self.scans.get(scan_id)
+
+    async def list_scans(self) -> List[Scan]:
+        return list(self.scans.values())
+
+    async def list_targets(self) -> List[str]:
+        return list(self.scan_index.equality["target"])
+
+    async def save_scan(self, scan: Scan):
+        self._put_scan(scan)
+
+    async def save_scans(self, scans: List[Scan]):
+        for scan in scans:
+            self._put_scan(scan)
+
+    async def update_scan(self, scan_id: str, **fields) -> Optional[Scan]:
+        scan = self.scans.get(scan_id)
+        if scan is None:
+            return None
+        scan = scan.model_copy(update=fields)
+        self._put_scan(scan)
+        return scan
+
+    def _put_scan(self, scan: Scan):
+        old = self.scans.get(scan.id)
+        if old is not None:
+            self.scan_index.remove(old)
+        self.scans[scan.id] = scan
+        self.scan_index.add(scan)
+        self.changelogs[SCANS].record(scan.id)
+
+    def _put_finding(self, finding: Finding):
+        old = self.findings.get(finding.id)
+        if old is not None:
+            self.finding_index.remove(old)
+        self.findings[finding.id] = finding
+        self.finding_index.add(finding)
+        self.changelogs[FINDINGS].record(finding.id)
+
+    async def get_finding(self, finding_id: str) -> Optional[Finding]:
+        return self.findings.get(finding_id)
+
+    async def list_findings(self, scan_id: Optional[str] = None) -> List[Finding]:
+        if scan_id is None:
+            return list(self.findings.values())
+        ids = self.finding_index.equality["scanId"].get(scan_id, set())
+        return [self.findings[i] for i in ids]
+
+    async def save_findings(self, findings: List[Finding]):
+        for finding in findings:
+            self._put_finding(finding)
+
+    async def update_finding(self, finding_id: str, **fields) -> Optional[Finding]:
+        finding = self.findings.get(finding_id)
+        if finding is None:
+            return None
+        finding = finding.model_copy(update=fields)
+        self._put_finding(finding)
+        return finding
+
+    async def page_scans(self, query: ListQuery) -> Page:
+        return self.scan_index.page(self.scans, query)
+
+    async def page_findings(self, query: ListQuery) -> Page:
+        return self.finding_index.page(self.findings, query)
+
+    async def get_campaign(self, campaign_id: str) -> Optional[Campaign]:
+        return self.campaigns.get(campaign_id)
+
+    async def list_campaigns(self) -> List[Campaign]:
+        return sorted(self.campaigns.values(), key=lambda c: c.startedAt, reverse=True)
+
+    async def save_campaign(self, campaign: Campaign):
+        self.campaigns[campaign.id] = campaign
+
+    async def update_campaign(self, campaign_id: str, **fields) -> Optional[Campaign]:
+        campaign = self.campaigns.get(campaign_id)
+        if campaign is None:
+            return None
+        campaign = self.campaigns[campaign_id] = campaign.model_copy(update=fields)
+        return campaign
+
+    async def delete_scan(self, scan_id: str) -> bool:
+        scan = self.scans.pop(scan_id, None)
+        if scan is None:
+            return False
+        for finding_id in list(self.finding_index.equality["scanId"].get(scan_id, ())):
+            self.finding_index.remove(self.findings.pop(finding_id))
+            self.changelogs[FINDINGS].record(finding_id, deleted=True)
+        self.scan_index.remove(scan)
+        self.changelogs[SCANS].record(scan_id, deleted=True)
+        return True
+
+    async def revision(self, collection: str) -> int:
+        return self.changelogs[collection].revision
+
+    async def changes(self, collection: str, since: int, limit: int) -> Changes:
+        records = self.scans if collection == SCANS else self.findings
+        return self.changelogs[collection].changes(records, since, limit)
+
+    async def seed_if_empty(self, scans: List[Scan], findings: List[Finding]) -> bool:
+        if self.scans or self.findings:
+            return False
+        for scan in scans:
+            await self.save_scan(scan)
+        await self.save_findings(findings)
+        return True
+
+
+# Applied in order; PRAGMA user_version records how many have run
+MIGRATIONS = [
+    """
+    CREATE TABLE scans (
+        id TEXT PRIMARY KEY,
+        target TEXT NOT NULL,
+        status TEXT NOT NULL,
+        startedAt TEXT NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX idx_scans_started_at ON scans (startedAt);
+    CREATE INDEX idx_scans_target ON scans (target);
+
+    CREATE TABLE findings (
+        id TEXT PRIMARY KEY,
+        scanId TEXT NOT NULL,
+        host TEXT NOT NULL,
+        severity TEXT NOT NULL,
+        status TEXT NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX idx_findings_scan_id ON findings (scanId);
+    CREATE INDEX idx_findings_host ON findings (host);
+    CREATE INDEX idx_findings_severity ON findings (severity);
+    CREATE INDEX idx_findings_status ON findings (status);
+    """,
+    # Columns and indexes for filtered, sorted, cursor-paged listings
+    """
+    ALTER TABLE scans ADD COLUMN riskScore INTEGER NOT NULL DEFAULT 0;
+    UPDATE scans SET riskScore = json_extract(data, '$.riskScore');
+    CREATE INDEX idx_scans_risk_score ON scans (riskScore, id);
+    CREATE INDEX idx_scans_status_started_at ON scans (status, startedAt);
+
+    CREATE TABLE scan_tools (
+        tool TEXT NOT NULL,
+        scanId TEXT NOT NULL,
+        PRIMARY KEY (tool, scanId)
+    ) WITHOUT ROWID;
+    INSERT INTO scan_tools (tool, scanId)
+        SELECT t.value, scans.id FROM scans, json_each(json_extract(scans.data, '$.tools')) AS t;
+
+    ALTER TABLE findings ADD COLUMN tool TEXT NOT NULL DEFAULT '';
+    ALTER TABLE findings ADD COLUMN createdAt TEXT NOT NULL DEFAULT '';
+    ALTER TABLE findings ADD COLUMN severityRank INTEGER NOT NULL DEFAULT 0;
+    UPDATE findings SET data = json_set(data, '$.createdAt', COALESCE(
+        json_extract(data, '$.createdAt'),
+        (SELECT startedAt FROM scans WHERE scans.id = findings.scanId),
+        ''
+    ));
+    UPDATE findings SET
+        tool = json_extract(data, '$.tool'),
+        createdAt = json_extract(data, '$.createdAt'),
+        severityRank = CASE severity
+            WHEN 'Critical' THEN 4 WHEN 'High' THEN 3 WHEN 'Medium' THEN 2 WHEN 'Low' THEN 1 ELSE 0
+        END;
+    CREATE INDEX idx_findings_tool ON findings (tool);
+    CREATE INDEX idx_findings_created_at ON findings (createdAt, id);
+    CREATE INDEX idx_findings_severity_rank ON findings (severityRank, id);
+    """,
+    # Batch campaigns and the link from their child scans
+    """
+    CREATE TABLE campaigns (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        startedAt TEXT NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX idx_campaigns_started_at ON campaigns (startedAt);
+
+    ALTER TABLE scans ADD COLUMN campaignId TEXT;
+    CREATE INDEX idx_scans_campaign_id ON scans (campaignId);
+    """,
+    # Revision counters and tombstones for conditional GETs and ?sinceRevision= deltas
+    """
+    ALTER TABLE scans ADD COLUMN revision INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE findings ADD COLUMN revision INTEGER NOT NULL DEFAULT 0;
+    UPDATE scans SET revision = rowid;
+    UPDATE findings SET revision = rowid;
+    CREATE INDEX idx_scans_revision ON scans (revision);
+    CREATE INDEX idx_findings_revision ON findings (revision);
+
+    CREATE TABLE revisions (
+        collection TEXT PRIMARY KEY,
+        revision INTEGER NOT NULL,
+        pruned INTEGER NOT NULL DEFAULT 0
+    );
+    INSERT INTO revisions (collection, revision) SELECT 'scans', COALESCE(MAX(revision), 0) FROM scans;
+    INSERT INTO revisions (collection, revision) SELECT 'findings', COALESCE(MAX(revision), 0) FROM findings;
+
+    CREATE TABLE tombstones (
+        collection TEXT NOT NULL,
+        id TEXT NOT NULL,
+        revision INTEGER NOT NULL,
+        PRIMARY KEY (collection, id)
+    );
+    CREATE INDEX idx_tombstones_revision ON tombstones (collection, revision);
+    """,
+]
+
+# Listing parameter -> SQL column
+SCAN_COLUMNS = {
+    "status": "status", "target": "target", "campaignId": "campaignId",
+    "startedAt": "startedAt", "riskScore": "riskScore",
+}
+FINDING_COLUMNS = {
+    "status": "status", "severity": "severity", "tool": "tool", "host": "host",
+    "scanId": "scanId", "createdAt": "createdAt", "severity_sort": "severityRank",
+}
+
+
+class ConnectionPool:
+    """Fixed set of SQLite connections used from worker threads.
+
+    run() checks a connection out, calls fn(conn, *args) in a thread via
+    asyncio.to_thread and returns it, so callers never block the loop.
+    """
+
+    def __init__(self, path: str, size: int = DATABASE_POOL_SIZE):
+        self._idle: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        self._connections = []
+        for _ in range(size):
+            conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._connections.append(conn)
+            self._idle.put(conn)
+
+    def _call(self, fn: Callable, *args):
+        conn = self._idle.get()
+        try:
+            return fn(conn, *args)
+        finally:
+            self._idle.put(conn)
+
+    async def run(self, fn: Callable, *args):
+        return await asyncio.to_thread(self._call, fn, *args)
+
+    def run_sync(self, fn: Callable, *args):
+        return self._call(fn, *args)
+
+    def close(self):
+        for conn in self._connections:
+            conn.close()
+
+
+class SQLiteRepository(ScanRepository):
+    """SQLite (WAL mode) store shared safely by several uvicorn workers.
+
+    Each row keeps the full model as JSON in `data`; the columns next to
+    it only exist so they can be indexed and filtered on.
+    """
+
+    def __init__(self, path: str = DATABASE_PATH, pool_size: int = DATABASE_POOL_SIZE):
+        if path == ":memory:":
+            # Every pooled connection would open its own empty database
+            raise ValueError("SQLiteRepository needs a file path; use MemoryRepository for an in-memory store")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.pool = ConnectionPool(path, pool_size)
+        self.pool.run_sync(_migrate)
+
+    async def get_scan(self, scan_id: str) -> Optional[Scan]:
+        return await self.pool.run(_get_scan, scan_id)
+
+    async def list_scans(self) -> List[Scan]:
+        rows = await self.pool.run(_query, "SELECT data FROM scans ORDER BY startedAt DESC", ())
+        return [Scan.model_validate_json(row[0]) for row in rows]
+
+    async def list_targets(self) -> List[str]:
+        rows = await self.pool.run(_query, "SELECT DISTINCT target FROM scans", ())
+        return [row[0] for row in rows]
+
+    async def save_scan(self, scan: Scan):
+        await self.pool.run(_write_scans, [scan])
+
+    async def save_scans(self, scans: List[Scan]):
+        if scans:
+            await self.pool.run(_write_scans, scans)
+
+    async def update_scan(self, scan_id: str, **fields) -> Optional[Scan]:
+        return await self.pool.run(_update_scan, scan_id, fields)
+
+    async def get_finding(self, finding_id: str) -> Optional[Finding]:
+        return await self.pool.run(_get_finding, finding_id)
+
+    async def list_findings(self, scan_id: Optional[str] = None) -> List[Finding]:
+        if scan_id is None:
+            rows = await self.pool.run(_query, "SELECT data FROM findings", ())
+        else:
+            rows = await self.pool.run(_query, "SELECT data FROM findings WHERE scanId = ?", (scan_id,))
+        return [Finding.model_validate_json(row[0]) for row in rows]
+
+    async def save_findings(self, findings: List[Finding]):
+        if findings:
+            await self.pool.run(_write_findings, findings)
+
+    async def update_finding(self, finding_id: str, **fields) -> Optional[Finding]:
+        return await self.pool.run(_update_finding, finding_id, fields)
+
+    async def page_scans(self, query: ListQuery) -> Page:
+        rows = await self.pool.run(_query, *_page_sql("scans", query))
+        return _to_page([Scan.model_validate_json(row[0]) for row in rows], query, scan_sort_value)
+
+    async def page_findings(self, query: ListQuery) -> Page:
+        rows = await self.pool.run(_query, *_page_sql("findings", query))
+        return _to_page([Finding.model_validate_json(row[0]) for row in rows], query, finding_sort_value)
+
+    async def get_campaign(self, campaign_id: str) -> Optional[Campaign]:
+        return await self.pool.run(_get_campaign, campaign_id)
+
+    async def list_campaigns(self) -> List[Campaign]:
+        rows = await self.pool.run(_query, "SELECT data FROM campaigns ORDER BY startedAt DESC", ())
+        return [Campaign.model_validate_json(row[0]) for row in rows]
+
+    async def save_campaign(self, campaign: Campaign):
+        await self.pool.run(_write_campaign, campaign)
+
+    async def update_campaign(self, campaign_id: str, **fields) -> Optional[Campaign]:
+        return await self.pool.run(_update_campaign, campaign_id, fields)
+
+    async def delete_scan(self, scan_id: str) -> bool:
+        return await self.pool.run(_delete_scan, scan_id)
+
+    async def revision(self, collection: str) -> int:
+        rows = await self.pool.run(_query, "SELECT revision FROM revisions WHERE collection = ?", (collection,))
+        return rows[0][0]
+
+    async def changes(self, collection: str, since: int, limit: int) -> Changes:
+        entries, has_more, current = await self.pool.run(_changes, collection, since, limit)
+        model = Scan if collection == SCANS else Finding
+        return Changes(
+            items=[model.model_validate_json(value) for _, value, deleted in entries if not deleted],
+            deleted=[value for _, value, deleted in entries if deleted],
+            revision=entries[-1][0] if has_more else current,
+            has_more=has_more,
+        )
+
+    async def seed_if_empty(self, scans: List[Scan], findings: List[Finding]) -> bool:
+        return await self.pool.run(_seed_if_empty, scans, findings)
+
+    async def close(self):
+        self.pool.close()
+
+
+def _migrate(conn: sqlite3.Connection, migrations: List[str] = MIGRATIONS):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for i, script in enumerate(migrations[version:], start=version + 1):
+            for statement in script.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {i}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _query(conn: sqlite3.Connection, sql: str, params: tuple) -> list:
+    return conn.execute(sql, params).fetchall()
+
+
+def _page_sql(table: str, query: ListQuery) -> Tuple[str, tuple]:
+    """Keyset-paginated SELECT that the (column, id) indexes can satisfy"""
+    where = []
+    params: list = []
+    for name, value in query.filters.items():
+        if table == "scans" and name == "tool":
+            where.append("id IN (SELECT scanId FROM scan_tools WHERE tool = ?)")
+        else:
+            where.append(f"{(SCAN_COLUMNS if table == 'scans' else FINDING_COLUMNS)[name]} = ?")
+        params.append(value)
+
+    time_column = SCAN_TIME_FIELD if table == "scans" else FINDING_TIME_FIELD
+    if query.since:
+        where.append(f"{time_column} >= ?")
+        params.append(query.since)
+    if query.until:
+        where.append(f"{time_column} < ?")
+        params.append(query.until)
+
+    if table == "scans":
+        sort_column = SCAN_COLUMNS[query.sort]
+    else:
+        sort_column = FINDING_COLUMNS["severity_sort" if query.sort == "severity" else query.sort]
+    direction = "DESC" if query.descending else "ASC"
+    if query.cursor:
+        sort_value, record_id = decode_cursor(query.cursor)
+        where.append(f"({sort_column}, id) {'<' if query.descending else '>'} (?, ?)")
+        params.extend([sort_value, record_id])
+
+    sql = f"SELECT data FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {sort_column} {direction}, id {direction} LIMIT ?"
+    params.append(query.limit + 1)  # one extra row tells us whether there is a next page
+    return sql, tuple(params)
+
+
+def _to_page(items: list, query: ListQuery, sort_value: Callable) -> Page:
+    if len(items) <= query.limit:
+        return Page(items=items)
+    items = items[:query.limit]
+    last = items[-1]
+    return Page(items=items, next_cursor=encode_cursor(sort_value(last, query.sort), last.id))
+
+
+def _scan_row(scan: Scan, revision: int) -> tuple:
+    return (
+        scan.id, scan.target, scan.status.value, scan.startedAt, scan.riskScore,
+        scan.campaignId, revision, scan.model_dump_json(),
+    )
+
+
+def _finding_row(finding: Finding, revision: int) -> tuple:
+    return (
+        finding.id, finding.scanId, finding.host,
+        finding.severity.value, finding.status.value, finding.tool.value,
+        finding.createdAt, SEVERITY_RANK[finding.severity], revision, finding.model_dump_json(),
+    )
+
+
+def _reserve_revisions(conn: sqlite3.Connection, collection: str, count: int) -> int:
+    """First of `count` new revisions; only call inside the write transaction"""
+    conn.execute("UPDATE revisions SET revision = revision + ? WHERE collection = ?", (count, collection))
+    current = conn.execute("SELECT revision FROM revisions WHERE collection = ?", (collection,)).fetchone()[0]
+    return current - count + 1
+
+
+def _insert_scans(conn: sqlite3.Connection, scans: List[Scan]):
+    first = _reserve_revisions(conn, SCANS, len(scans))
+    conn.executemany(
+        "INSERT OR REPLACE INTO scans (id, target, status, startedAt, riskScore, campaignId, revision, data) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [_scan_row(scan, first + i) for i, scan in enumerate(scans)],
+    )
+    conn.executemany("DELETE FROM tombstones WHERE collection = 'scans' AND id = ?", [(scan.id,) for scan in scans])
+    conn.executemany("DELETE FROM scan_tools WHERE scanId = ?", [(scan.id,) for scan in scans])
+    conn.executemany(
+        "INSERT OR IGNORE INTO scan_tools (tool, scanId) VALUES (?, ?)",
+        [(tool.value, scan.id) for scan in scans for tool in scan.tools],
+    )
+
+
+def _insert_findings(conn: sqlite3.Connection, findings: List[Finding]):
+    first = _reserve_revisions(conn, FINDINGS, len(findings))
+    conn.executemany(
+        "INSERT OR REPLACE INTO findings "
+        "(id, scanId, host, severity, status, tool, createdAt, severityRank, revision, data) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [_finding_row(finding, first + i) for i, finding in enumerate(findings)],
+    )
+    conn.executemany(
+        "DELETE FROM tombstones WHERE collection = 'findings' AND id = ?", [(finding.id,) for finding in findings]
+    )
+
+
+def _bury(conn: sqlite3.Connection, collection: str, ids: List[str]):
+    """Tombstone deleted ids, forgetting the oldest past TOMBSTONE_LIMIT"""
+    if not ids:
+        return
+    first = _reserve_revisions(conn, collection, len(ids))
+    conn.executemany(
+        "INSERT OR REPLACE INTO tombstones (collection, id, revision) VALUES (?, ?, ?)",
+        [(collection, record_id, first + i) for i, record_id in enumerate(ids)],
+    )
+    count = conn.execute("SELECT COUNT(*) FROM tombstones WHERE collection = ?", (collection,)).fetchone()[0]
+    if count <= TOMBSTONE_LIMIT:
+        return
+    newest_forgotten = conn.execute(
+        "SELECT MAX(revision) FROM (SELECT revision FROM tombstones WHERE collection = ? ORDER BY revision LIMIT ?)",
+        (collection, count - TOMBSTONE_LIMIT),
+    ).fetchone()[0]
+    conn.execute("DELETE FROM tombstones WHERE collection = ? AND revision <= ?", (collection, newest_forgotten))
+    conn.execute("UPDATE revisions SET pruned = ? WHERE collection = ?", (newest_forgotten, collection))
+
+
+def _transaction(conn: sqlite3.Connection, fn: Callable, *args):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = fn(conn, *args)
+        conn.execute("COMMIT")
+        return result
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _write_scans(conn: sqlite3.Connection, scans: List[Scan]):
+    _transaction(conn, _insert_scans, scans)
+
+
+def _write_findings(conn: sqlite3.Connection, findings: List[Finding]):
+    _transaction(conn, _insert_findings, findings)
+
+
+def _get_scan(conn: sqlite3.Connection, scan_id: str) -> Optional[Scan]:
+    row = conn.execute("SELECT data FROM scans WHERE id = ?", (scan_id,)).fetchone()
+    return Scan.model_validate_json(row[0]) if row else None
+
+
+def _get_finding(conn: sqlite3.Connection, finding_id: str) -> Optional[Finding]:
+    row = conn.execute("SELECT data FROM findings WHERE id = ?", (finding_id,)).fetchone()
+    return Finding.model_validate_json(row[0]) if row else None
+
+
+def _update_scan(conn: sqlite3.Connection, scan_id: str, fields: dict) -> Optional[Scan]:
+    def apply(conn):
+        scan = _get_scan(conn, scan_id)
+        if scan is None:
+            return None
+        scan = scan.model_copy(update=fields)
+        _insert_scans(conn, [scan])
+        return scan
+    return _transaction(conn, apply)
+
+
+def _update_finding(conn: sqlite3.Connection, finding_id: str, fields: dict) -> Optional[Finding]:
+    def apply(conn):
+        finding = _get_finding(conn, finding_id)
+        if finding is None:
+            return None
+        finding = finding.model_copy(update=fields)
+        _insert_findings(conn, [finding])
+        return finding
+    return _transaction(conn, apply)
+
+
+def _insert_campaign(conn: sqlite3.Connection, campaign: Campaign):
+    conn.execute(
+        "INSERT OR REPLACE INTO campaigns (id, status, startedAt, data) VALUES (?, ?, ?, ?)",
+        (campaign.id, campaign.status.value, campaign.startedAt, campaign.model_dump_json()),
+    )
+
+
+def _write_campaign(conn: sqlite3.Connection, campaign: Campaign):
+    _transaction(conn, _insert_campaign, campaign)
+
+
+def _get_campaign(conn: sqlite3.Connection, campaign_id: str) -> Optional[Campaign]:
+    row = conn.execute("SELECT data FROM campaigns WHERE id = ?", (campaign_id,)).fetchone()
+    return Campaign.model_validate_json(row[0]) if row else None
+
+
+def _update_campaign(conn: sqlite3.Connection, campaign_id: str, fields: dict) -> Optional[Campaign]:
+    def apply(conn):
+        campaign = _get_campaign(conn, campaign_id)
+        if campaign is None:
+            return None
+        campaign = campaign.model_copy(update=fields)
+        _insert_campaign(conn, campaign)
+        return campaign
+    return _transaction(conn, apply)
+
+
+def _delete_scan(conn: sqlite3.Connection, scan_id: str) -> bool:
+    def apply(conn):
+        if not conn.execute("SELECT EXISTS (SELECT 1 FROM scans WHERE id = ?)", (scan_id,)).fetchone()[0]:
+            return False
+        finding_ids = [row[0] for row in conn.execute("SELECT id FROM findings WHERE scanId = ?", (scan_id,))]
+        conn.execute("DELETE FROM findings WHERE scanId = ?", (scan_id,))
+        conn.execute("DELETE FROM scan_tools WHERE scanId = ?", (scan_id,))
+        conn.execute("DELETE FROM scans WHERE id = ?", (scan_id,))
+        _bury(conn, FINDINGS, finding_ids)
+        _bury(conn, SCANS, [scan_id])
+        return True
+    return _transaction(conn, apply)
+
+
+def _changes(conn: sqlite3.Connection, collection: str, since: int, limit: int) -> Tuple[list, bool, int]:
+    """([(revision, data or deleted id, deleted)], has_more, current revision), read from one snapshot"""
+    conn.execute("BEGIN")
+    try:
+        current, pruned = conn.execute(
+            "SELECT revision, pruned FROM revisions WHERE collection = ?", (collection,)
+        ).fetchone()
+        if 0 < since < pruned:
+            raise RevisionExpired(f"Deletions before revision {pruned} are no longer tracked")
+        written = conn.execute(
+            f"SELECT revision, data FROM {collection} WHERE revision > ? ORDER BY revision LIMIT ?",
+            (since, limit + 1),
+        ).fetchall()
+        deleted = conn.execute(
+            "SELECT revision, id FROM tombstones WHERE collection = ? AND revision > ? ORDER BY revision LIMIT ?",
+            (collection, since, limit + 1),
+        ).fetchall()
+    finally:
+        conn.execute("COMMIT")
+    entries = sorted([(r, data, False) for r, data in written] + [(r, i, True) for r, i in deleted])
+    return entries[:limit], len(entries) > limit, current
+
+
+def _seed_if_empty(conn: sqlite3.Connection, scans: List[Scan], findings: List[Finding]) -> bool:
+    def apply(conn):
+        if conn.execute("SELECT EXISTS (SELECT 1 FROM scans)").fetchone()[0]:
+            return False
+        _insert_scans(conn, scans)
+        _insert_findings(conn, findings)
+        return True
+    return _transaction(conn, apply)
+
+
+def create_repository() -> ScanRepository:
+    """Repository selected by STORAGE_BACKEND"""
+    if STORAGE_BACKEND == "memory":
+        return MemoryRepository()
+    return SQLiteRepository(DATABASE_PATH)
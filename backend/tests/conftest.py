@@ -0,0 +1,67 @@
+"""Shared fixtures: the backend on sys.path, scratch storage, and bench/fake_llm.py served in-process.
+
+Run from backend/: python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "bench"))
+
+# Before any backend module reads its configuration
+SCRATCH_DIR = tempfile.mkdtemp(prefix="scan-tests-")
+for name, value in {
+    "STORAGE_BACKEND": "memory",
+    "DATABASE_PATH": os.path.join(SCRATCH_DIR, "scans.db"),
+    "ANALYSIS_CACHE_DIR": os.path.join(SCRATCH_DIR, "analysis"),
+    "TOOL_CACHE_DIR": os.path.join(SCRATCH_DIR, "tools"),
+    "RETRIEVAL_DIR": os.path.join(SCRATCH_DIR, "retrieval"),
+    "ARCHIVE_DIR": os.path.join(SCRATCH_DIR, "archive"),
+    "BATCH_DB_PATH": os.path.join(SCRATCH_DIR, "batches.db"),
+    "ANTHROPIC_API_KEY": "test",
+}.items():
+    os.environ[name] = value
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+import fake_llm  # noqa: E402
+from llm import LLMGateway, set_gateway  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def fake():
+    """The fake API's module state, reset to instant replies and no failures"""
+    saved = (fake_llm.LATENCY, fake_llm.TOKEN_DELAY, fake_llm.BATCH_SECONDS, fake_llm.BATCH_ERRORS)
+    fake_llm.LATENCY, fake_llm.TOKEN_DELAY, fake_llm.BATCH_SECONDS, fake_llm.BATCH_ERRORS = 0, 0, 0, 0
+    fake_llm.failures.clear()
+    fake_llm.batches.clear()
+    yield fake_llm
+    fake_llm.LATENCY, fake_llm.TOKEN_DELAY, fake_llm.BATCH_SECONDS, fake_llm.BATCH_ERRORS = saved
+    fake_llm.failures.clear()
+
+
+@pytest.fixture
+async def make_gateway(fake):
+    """Build LLMGateways whose HTTP client talks to the fake API in-process; the last one is installed globally"""
+    gateways = []
+
+    def make(**kwargs) -> LLMGateway:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.app), base_url="http://fake-llm")
+        gateway = LLMGateway(base_url="http://fake-llm", http_client=client, **kwargs)
+        gateways.append(gateway)
+        set_gateway(gateway)
+        return gateway
+
+    yield make
+    set_gateway(None)
+    for gateway in gateways:
+        await gateway.aclose()
@@ -0,0 +1,101 @@
+import os
+import time
+
+import pytest
+
+import archive
+from archive import OutputArchive, _compact
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def store(tmp_path, monkeypatch):
+    # Small blocks, so a few hundred lines span many of them
+    monkeypatch.setattr(archive, "ARCHIVE_BLOCK_BYTES", 100)
+    store = OutputArchive(str(tmp_path))
+    yield store
+    await store.close()
+
+
+def numbered(prefix: str, count: int):
+    return [f"{prefix} line {i}" for i in range(count)]
+
+
+async def archived(store: OutputArchive, scan_id: str, lines, tool: str = "Nikto"):
+    stream = store.stream(scan_id, tool)
+    for line in lines:
+        stream.write(line)
+    await stream.close()
+    return stream
+
+
+def segments(store: OutputArchive):
+    return sorted(name for name in os.listdir(store.directory) if name.endswith(".gz"))
+
+
+async def reopen(store: OutputArchive) -> OutputArchive:
+    """Close the archive, which closes its segment, and open the directory again"""
+    await store.close()
+    return OutputArchive(store.directory)
+
+
+async def test_range_reads_cross_block_boundaries(store):
+    lines = numbered("scan-a", 200)
+    stream = await archived(store, "scan-a", lines)
+    assert len(stream.blocks) > 10
+    boundary = stream.blocks[3][0]
+
+    for start, end in [(0, 5), (boundary - 1, boundary + 1), (boundary, boundary + 30), (0, 200), (190, 500)]:
+        result = await store.read("scan-a", "Nikto", None, start, end)
+        assert result["lines"] == lines[start:end]
+        assert (result["from"], result["to"], result["total"]) == (start, min(end, 200), 200)
+    assert (await store.read("scan-a", "Nikto", None, 250, 260))["lines"] == []
+    assert await store.read("scan-a", "Nuclei", None, 0, 10) is None
+
+
+async def test_interleaved_streams_keep_their_line_order(store):
+    first, second = store.stream("scan-a", "Nikto"), store.stream("scan-b", "Nikto")
+    for a, b in zip(numbered("a", 150), numbered("b", 150)):
+        first.write(a)
+        second.write(b)
+    await first.close()
+    await second.close()
+
+    assert (await store.read("scan-a", "Nikto", None, 0, 150))["lines"] == numbered("a", 150)
+    assert (await store.read("scan-b", "Nikto", None, 0, 150))["lines"] == numbered("b", 150)
+    assert await store.streams("scan-b") == [{
+        "tool": "Nikto", "endpoint": None, "lines": 150, "bytes": second.bytes,
+        "compressedBytes": second.compressed, "archivedAt": pytest.approx(time.time(), abs=5),
+    }]
+
+
+async def test_compaction_rewrites_a_mostly_dead_segment(store):
+    await archived(store, "scan-gone", numbered("gone", 400))
+    kept = numbered("kept", 50)
+    await archived(store, "scan-kept", kept)
+    store = await reopen(store)
+    [old] = segments(store)
+    await store.forget_scan("scan-gone")
+
+    report = await store.compact()
+
+    assert report["rewrittenSegments"] == 1
+    [new] = segments(store)
+    assert new != old
+    assert (await store.read("scan-kept", "Nikto", None, 0, 50))["lines"] == kept
+    assert store.pool.run_sync(archive._rows, "SELECT DISTINCT segment FROM blocks", ()) == [(new,)]
+    await store.close()
+
+
+async def test_compaction_expires_old_output(store):
+    await archived(store, "scan-old", numbered("old", 100))
+    store = await reopen(store)
+
+    later = time.time() + 86400 * (archive.ARCHIVE_RETENTION_DAYS + 1)
+    report = store.pool.run_sync(_compact, store.directory, set(), later)
+
+    assert (report["expiredStreams"], report["deletedSegments"]) == (1, 1)
+    assert segments(store) == []
+    assert await store.read("scan-old", "Nikto", None, 0, 10) is None
+    await store.close()
@@ -0,0 +1,254 @@
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import pytest
+
+import batches
+import scan_runner as runner
+from analysis_cache import analysis_key
+from batches import BatchAnalyzer
+from models import Scan, ScanStatus, Tool
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def analyzer(tmp_path):
+    analyzer = BatchAnalyzer(os.path.join(tmp_path, "batches.db"))
+    yield analyzer
+    await analyzer.close()
+
+
+class Recorder:
+    """Result and failure handlers that remember what they were given and can ask for follow-up rounds"""
+
+    def __init__(self, follow_ups: Optional[Dict[str, List[str]]] = None):
+        self.calls: List[tuple] = []
+        self.failures: List[tuple] = []
+        self.follow_ups = follow_ups or {}
+
+    async def __call__(self, scan_id: str, replies: List[str], context: dict) -> Optional[List[str]]:
+        self.calls.append((scan_id, replies, context))
+        return self.follow_ups.pop(scan_id, None)
+
+    async def fail(self, scan_id: str, error: str, context: dict):
+        self.failures.append((scan_id, error, context))
+
+
+async def run_round(analyzer: BatchAnalyzer, handler, on_failure=None) -> Optional[str]:
+    batch_id = await analyzer.submit(force=True)
+    await analyzer.poll()
+    await analyzer.deliver(handler, on_failure or handler.fail)
+    return batch_id
+
+
+async def test_deferred_scans_share_one_batch(fake, make_gateway, analyzer):
+    make_gateway()
+    await analyzer.defer("scan-a", ["prompt a"], {"target": "a"})
+    await analyzer.defer("scan-b", ["prompt b1", "prompt b2"], {"target": "b"})
+    assert await analyzer.submit() is None  # the batch window is still open
+    handler = Recorder()
+
+    batch_id = await run_round(analyzer, handler)
+
+    assert [len(batch["requests"]) for batch in fake.batches.values()] == [3]
+    assert sorted(handler.calls) == [
+        ("scan-a", [fake.REPLY], {"target": "a"}),
+        ("scan-b", [fake.REPLY, fake.REPLY], {"target": "b"}),
+    ]
+    report = await analyzer.report()
+    assert report["waitingRequests"] == 0
+    assert [(b["id"], b["requests"], b["status"]) for b in report["batches"]] == [(batch_id, 3, "ended")]
+
+
+async def test_nothing_is_delivered_before_the_batch_ends(fake, make_gateway, analyzer):
+    make_gateway()
+    fake.BATCH_SECONDS = 60
+    await analyzer.defer("scan-a", ["prompt"], {})
+    handler = Recorder()
+
+    await run_round(analyzer, handler)
+
+    assert handler.calls == []
+    assert (await analyzer.report())["batches"][0]["status"] == "in_progress"
+
+
+async def test_follow_up_prompts_go_in_the_next_batch(fake, make_gateway, analyzer):
+    make_gateway()
+    await analyzer.defer("scan-a", ["part 1", "part 2"], {"target": "a"})
+    handler = Recorder({"scan-a": ["merge"]})
+
+    await run_round(analyzer, handler)
+    assert (await analyzer.report())["waitingRequests"] == 1
+    second = await run_round(analyzer, handler)
+
+    assert [call[1] for call in handler.calls] == [[fake.REPLY, fake.REPLY], [fake.REPLY]]
+    assert [r["custom_id"] for r in fake.batches[second]["requests"]] == ["scan-a_1_0"]
+    assert fake.batches[second]["requests"][0]["params"]["messages"][0]["content"] == "merge"
+    assert (await analyzer.report())["waitingRequests"] == 0
+
+
+async def test_errored_requests_are_retried_directly(fake, make_gateway, analyzer):
+    make_gateway()
+    fake.BATCH_ERRORS = 1.0
+    await analyzer.defer("scan-a", ["prompt"], {})
+    handler = Recorder()
+
+    batch_id = await run_round(analyzer, handler)
+
+    assert fake.batches[batch_id]["results"][0]["result"]["type"] == "errored"
+    assert handler.calls == [("scan-a", [fake.REPLY], {})]
+
+
+async def test_retry_failure_waits_for_the_next_round(fake, make_gateway, analyzer):
+    make_gateway(max_retries=0)
+    fake.BATCH_ERRORS = 1.0
+    await analyzer.defer("scan-a", ["prompt"], {})
+    fake.failures.append(529)
+    handler = Recorder()
+
+    await run_round(analyzer, handler)
+    assert handler.calls == []
+    await analyzer.deliver(handler, handler.fail)
+
+    assert handler.calls == [("scan-a", [fake.REPLY], {})]
+
+
+async def test_client_errors_fail_the_scan_at_once(fake, make_gateway, analyzer):
+    make_gateway()
+    fake.BATCH_ERRORS = 1.0
+    await analyzer.defer("scan-a", ["prompt", "prompt"], {"target": "a"})
+    fake.failures.append(400)
+    handler = Recorder()
+
+    await run_round(analyzer, handler)
+
+    assert handler.calls == []
+    assert [(scan_id, context) for scan_id, _, context in handler.failures] == [("scan-a", {"target": "a"})]
+    assert "Fake 400" in handler.failures[0][1]
+    assert (await analyzer.report())["waitingRequests"] == 0
+    await analyzer.deliver(handler, handler.fail)
+    assert len(handler.failures) == 1
+
+
+async def test_repeated_failures_give_up_after_max_attempts(fake, make_gateway, analyzer, monkeypatch):
+    monkeypatch.setattr(batches, "BATCH_MAX_ATTEMPTS", 2)
+    make_gateway(max_retries=0)
+    fake.BATCH_ERRORS = 1.0
+    await analyzer.defer("scan-a", ["prompt"], {})
+    fake.failures.extend([529, 529])
+    handler = Recorder()
+
+    await run_round(analyzer, handler)
+    assert handler.failures == []
+    await analyzer.deliver(handler, handler.fail)
+
+    assert handler.calls == []
+    assert [scan_id for scan_id, _, _ in handler.failures] == ["scan-a"]
+
+
+async def test_handler_error_goes_to_the_failure_handler(fake, make_gateway, analyzer):
+    make_gateway()
+    await analyzer.defer("scan-a", ["prompt"], {"target": "a"})
+    recorder = Recorder()
+
+    async def broken(scan_id, replies, context):
+        raise RuntimeError("storage is down")
+
+    await run_round(analyzer, broken, recorder.fail)
+
+    assert recorder.failures == [("scan-a", "could not record the analysis: storage is down", {"target": "a"})]
+    assert (await analyzer.report())["waitingScans"] == 0
+
+
+async def test_forgotten_scan_is_not_delivered(fake, make_gateway, analyzer):
+    make_gateway()
+    await analyzer.defer("scan-a", ["prompt"], {})
+    await analyzer.submit(force=True)
+    await analyzer.forget("scan-a")
+    handler = Recorder()
+
+    await analyzer.poll()
+    await analyzer.deliver(handler, handler.fail)
+
+    assert handler.calls == []
+
+
+async def test_failed_submit_releases_its_requests(make_gateway, analyzer):
+    gateway = make_gateway()
+
+    async def unavailable(requests):
+        raise ConnectionError("no route to the API")
+
+    gateway.create_batch = unavailable
+    await analyzer.defer("scan-a", ["prompt"], {})
+
+    with pytest.raises(ConnectionError):
+        await analyzer.submit(force=True)
+
+    assert (await analyzer.report())["waitingRequests"] == 1
+
+
+async def in_progress_scan(target: str) -> Scan:
+    scan = Scan(
+        id=f"scan-{target}", target=target, tools=[Tool.NMAP], startedAt=datetime.now().isoformat(),
+        status=ScanStatus.IN_PROGRESS, issues=0, critical=0, riskScore=0,
+        summary="Tools finished, analysis deferred to the next batch", aiSummary="", deferredAnalysis=True,
+    )
+    await runner.repo.save_scan(scan)
+    return scan
+
+
+async def test_batch_reply_completes_the_deferred_scan(fake, make_gateway):
+    make_gateway()
+    scan = await in_progress_scan("batch.local")
+    cache_key = analysis_key(scan.target, scan.tools, ["nmap output"], "test")
+    started = datetime.now() - timedelta(days=1, minutes=5)
+    await runner.defer_analysis(scan.id, scan.target, scan.tools, cache_key, ["prompt"], [], {"newFindings": 2}, started)
+
+    await run_round(runner.batch_analyzer, runner.finish_deferred_analysis, runner.fail_deferred_analysis)
+
+    stored = await runner.repo.get_scan(scan.id)
+    assert (stored.status, stored.issues, stored.critical, stored.riskScore) == (ScanStatus.COMPLETED, 3, 1, 64)
+    # Counted from the start of the run to the batch reply, whole days included
+    assert stored.durationMinutes == 24 * 60 + 5
+    assert stored.newFindings == 2
+    assert [f.title for f in await runner.repo.list_findings(scan.id)] == [f"Security issue detected on {scan.target}"]
+    assert await runner.analysis_cache.get(cache_key) == fake.REPLY
+
+
+async def test_partial_replies_ask_for_a_merge():
+    follow_up = await runner.finish_deferred_analysis(
+        "scan-merge", ["ISSUES: 1", "ISSUES: 2"], {"target": "merge.local", "tools": ["Nmap"]}
+    )
+
+    assert len(follow_up) == 1
+    assert "ISSUES: 1" in follow_up[0] and "ISSUES: 2" in follow_up[0]
+
+
+async def test_reply_for_a_cancelled_scan_is_dropped(fake):
+    scan = await in_progress_scan("cancelled.local")
+    await runner.repo.update_scan(scan.id, status=ScanStatus.FAILED, summary="Scan cancelled by user")
+    context = {"target": scan.target, "tools": ["Nmap"], "cacheKey": "unused", "findings": 0, "results": {},
+               "deferredAt": 0}
+
+    assert await runner.finish_deferred_analysis(scan.id, [fake.REPLY], context) is None
+
+    stored = await runner.repo.get_scan(scan.id)
+    assert (stored.status, stored.summary) == (ScanStatus.FAILED, "Scan cancelled by user")
+    assert await runner.analysis_cache.get("unused") is None
+
+
+async def test_failed_analysis_fails_the_deferred_scan(fake, make_gateway):
+    make_gateway()
+    fake.BATCH_ERRORS = 1.0
+    scan = await in_progress_scan("failing.local")
+    await runner.defer_analysis(scan.id, scan.target, scan.tools, "failing", ["prompt"], [], {}, datetime.now())
+    fake.failures.append(400)
+
+    await run_round(runner.batch_analyzer, runner.finish_deferred_analysis, runner.fail_deferred_analysis)
+
+    stored = await runner.repo.get_scan(scan.id)
+    assert stored.status == ScanStatus.FAILED
+    assert "Fake 400" in stored.aiSummary
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+import analysis_cache
+from analysis_cache import AnalysisCache
+from executor import CommandResult
+from models import Tool
+from tool_cache import ToolCache
+
+pytestmark = pytest.mark.anyio
+
+ARGS = ["nmap", "-sV", "cache.local"]
+
+
+def age(cache: AnalysisCache, key: str, seconds: float):
+    """Make a disk entry look last used `seconds` ago"""
+    then = time.time() - seconds
+    os.utime(cache._path(key), (then, then))
+
+
+async def test_entries_expire_after_the_ttl(tmp_path, monkeypatch):
+    cache = AnalysisCache(str(tmp_path), ttl=60)
+    await cache.put("key", "analysis")
+    assert await cache.get("key") == "analysis"
+    # A caller asking for fresher data misses without dropping the entry
+    assert await cache.get("key", ttl=0) is None
+    assert os.path.exists(cache._path("key"))
+
+    later = time.time() + 61
+    monkeypatch.setattr(analysis_cache.time, "time", lambda: later)
+
+    assert await cache.get("key") is None
+    assert not os.path.exists(cache._path("key"))
+    assert cache.report()["misses"] == 2
+
+
+async def test_disk_entries_survive_a_restart(tmp_path):
+    await AnalysisCache(str(tmp_path)).put("key", "analysis")
+    cache = AnalysisCache(str(tmp_path))
+
+    assert await cache.get("key") == "analysis"
+    assert cache.stats["diskHits"] == 1
+
+
+async def test_least_recently_used_entries_are_evicted_past_max_bytes(tmp_path):
+    # Room for three ~140 byte entries, and only one kept in memory
+    cache = AnalysisCache(str(tmp_path), max_bytes=500, memory_entries=1)
+    for i, key in enumerate(["a", "b", "c"]):
+        await cache.put(key, key * 100)
+        age(cache, key, 30 - i * 10)
+    assert await cache.get("a") == "a" * 100  # read from disk, which marks it recently used
+
+    await cache.put("d", "d" * 100)
+
+    assert sorted(name[0] for name in os.listdir(tmp_path)) == ["a", "c", "d"]
+    assert cache.stats["evictions"] == 1
+    assert cache._disk_bytes == sum(os.path.getsize(cache._path(key)) for key in "acd")
+
+
+async def test_concurrent_runs_of_the_same_tool_share_one_execution(tmp_path):
+    cache = ToolCache(str(tmp_path))
+    release = asyncio.Event()
+    calls = []
+
+    async def execute():
+        calls.append(1)
+        await release.wait()
+        return CommandResult(ARGS, 0, "22/tcp open ssh", "")
+
+    first = asyncio.ensure_future(cache.run(Tool.NMAP, "cache.local", ARGS, execute))
+    second = asyncio.ensure_future(cache.run(Tool.NMAP, "CACHE.local ", ARGS, execute))
+    await asyncio.sleep(0.01)
+    assert cache.report()["inFlight"] == 1
+    release.set()
+
+    (result, reused), (shared, shared_reused) = await asyncio.gather(first, second)
+
+    assert len(calls) == 1
+    assert (reused, shared_reused) == (False, True)
+    assert shared.stdout == result.stdout
+    assert cache.report()["shared"] == 1
+    # Finished runs are served from the store afterwards
+    assert (await cache.run(Tool.NMAP, "cache.local", ARGS, execute))[1] is True
+    assert len(calls) == 1
+
+
+async def test_waiter_runs_the_tool_itself_when_the_owner_is_cancelled(tmp_path):
+    cache = ToolCache(str(tmp_path))
+    owner_started = asyncio.Event()
+
+    async def hangs():
+        owner_started.set()
+        await asyncio.sleep(60)
+
+    async def finishes():
+        return CommandResult(ARGS, 0, "80/tcp open http", "")
+
+    owner = asyncio.ensure_future(cache.run(Tool.NMAP, "cache.local", ARGS, hangs))
+    await owner_started.wait()
+    waiter = asyncio.ensure_future(cache.run(Tool.NMAP, "cache.local", ARGS, finishes))
+    await asyncio.sleep(0.01)
+
+    owner.cancel()
+    result, reused = await waiter
+
+    assert (result.stdout, reused) == ("80/tcp open http", False)
+    with pytest.raises(asyncio.CancelledError):
+        await owner
+    assert cache.report()["inFlight"] == 0
@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+import campaigns
+from campaigns import shard_tool_limits
+from models import Tool
+from scanners import ToolOutput
+
+pytestmark = pytest.mark.anyio
+
+
+def test_tool_limits_are_shared_between_parallel_shards():
+    limits = {Tool.NMAP: 8, Tool.NUCLEI: 2, Tool.NIKTO: 1}
+
+    assert shard_tool_limits(limits, 4) == {Tool.NMAP: 2, Tool.NUCLEI: 1, Tool.NIKTO: 1}
+    assert shard_tool_limits(limits, 1) == limits
+
+
+async def test_shard_keeps_to_its_tool_limits(monkeypatch):
+    running = {Tool.NUCLEI: 0, Tool.NIKTO: 0}
+    peak = dict(running)
+
+    def runner(tool: Tool):
+        async def run(host: str) -> ToolOutput:
+            running[tool] += 1
+            peak[tool] = max(peak[tool], running[tool])
+            await asyncio.sleep(0.01)
+            running[tool] -= 1
+            return ToolOutput(tool, f"=== {tool.name} ===\n{host}")
+        return run
+
+    for tool in running:
+        monkeypatch.setitem(campaigns.TOOL_RUNNERS, tool, runner(tool))
+    hosts = [f"host-{i}" for i in range(6)]
+
+    results = await campaigns._scan_shard(hosts, [Tool.NUCLEI, Tool.NIKTO], {Tool.NUCLEI: 1, Tool.NIKTO: 2})
+
+    assert peak == {Tool.NUCLEI: 1, Tool.NIKTO: 2}
+    assert all(len(outputs) == 2 for outputs in results.values())
@@ -0,0 +1,53 @@
+from typing import Optional
+
+from differential import delta_text, diff_findings
+from models import Finding, FindingChange, FindingStatus, Severity, Tool
+
+
+def finding(tool: Tool, key: str, title: str = "open port", scan_id: str = "before",
+            status: FindingStatus = FindingStatus.OPEN, change: Optional[FindingChange] = None) -> Finding:
+    return Finding(
+        id=f"{scan_id}-{key}", scanId=scan_id, host="10.0.0.1", severity=Severity.MEDIUM, tool=tool,
+        status=status, title=title, description="", recommendation="", dedupKey=key, change=change,
+    )
+
+
+def test_rescan_is_compared_by_dedup_key():
+    previous = [
+        finding(Tool.NMAP, "same", status=FindingStatus.IN_PROGRESS),
+        finding(Tool.NMAP, "bumped", title="nginx 1.24"),
+        finding(Tool.NMAP, "closed"),
+    ]
+    current = [
+        finding(Tool.NMAP, "same", scan_id="after"),
+        finding(Tool.NMAP, "bumped", title="nginx 1.25", scan_id="after"),
+        finding(Tool.NMAP, "opened", scan_id="after"),
+    ]
+
+    diff = diff_findings("after", previous, current, {Tool.NMAP})
+
+    assert [f.dedupKey for f in diff.new] == ["opened"]
+    assert [f.dedupKey for f in diff.changed] == ["bumped"]
+    assert [(f.dedupKey, f.status) for f in diff.unchanged] == [("same", FindingStatus.IN_PROGRESS)]
+    assert [(f.dedupKey, f.scanId, f.status) for f in diff.resolved] == [("closed", "after", FindingStatus.RESOLVED)]
+
+
+def test_findings_of_a_tool_that_did_not_report_are_carried_over():
+    previous = [
+        finding(Tool.NMAP, "port-22"),
+        finding(Tool.NUCLEI, "cve", status=FindingStatus.IN_PROGRESS),
+        finding(Tool.NUCLEI, "fixed-earlier", status=FindingStatus.RESOLVED, change=FindingChange.RESOLVED),
+    ]
+    current = [finding(Tool.NMAP, "port-22", scan_id="after")]
+
+    # Nuclei failed on the rescan, so only Nmap was compared
+    diff = diff_findings("after", previous, current, {Tool.NMAP})
+
+    assert diff.resolved == []
+    assert [(f.dedupKey, f.scanId, f.status, f.change) for f in diff.unverified] == [
+        ("cve", "after", FindingStatus.IN_PROGRESS, FindingChange.UNVERIFIED)
+    ]
+    assert diff.unverified[0].id != previous[1].id
+    assert len(diff.findings) == 2
+    assert not diff.has_changes
+    assert "1 findings from tools that did not report" in delta_text(diff)
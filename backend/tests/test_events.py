@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime
+
+import httpx
+import pytest
+
+import main
+import scan_runner as runner
+from events import ScanEventBroadcaster
+from models import Scan, ScanStatus, Tool
+
+pytestmark = pytest.mark.anyio
+
+
+async def finished_scan(scan_id: str, status: ScanStatus, summary: str = "done") -> Scan:
+    scan = Scan(
+        id=scan_id, target="events.local", tools=[Tool.NMAP], startedAt=datetime.now().isoformat(),
+        status=status, issues=0, critical=0, riskScore=0, summary=summary, aiSummary="analysis failed",
+    )
+    await main.repo.save_scan(scan)
+    return scan
+
+
+async def read_events(scan_id: str) -> str:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+        response = await client.get(f"/api/scans/{scan_id}/events")
+    assert response.status_code == 200
+    return response.text
+
+
+async def test_subscriber_replays_history_and_stops_at_the_terminal_event():
+    events = ScanEventBroadcaster()
+    events.publish("scan-a", "started")
+    events.publish("scan-a", "completed")
+
+    assert [e["type"] async for e in events.subscribe("scan-a")] == ["started", "completed"]
+    assert [e["type"] async for e in events.subscribe("scan-a", after=1)] == ["completed"]
+
+
+async def test_finished_scan_without_history_gets_one_terminal_event():
+    scan = await finished_scan("scan-finished", ScanStatus.COMPLETED)
+
+    body = await read_events(scan.id)
+
+    assert body.startswith("id: 0\nevent: completed\n")
+    assert body.count("event:") == 1
+    assert not main.scan_events.has_channel(scan.id)
+
+
+async def test_failed_and_cancelled_scans_report_how_they_ended():
+    failed = await finished_scan("scan-failed", ScanStatus.FAILED, summary="Scan failed")
+    cancelled = await finished_scan("scan-cancelled", ScanStatus.FAILED, summary="Scan cancelled by user")
+
+    assert "event: failed\n" in await read_events(failed.id)
+    assert "event: cancelled\n" in await read_events(cancelled.id)
+
+
+async def test_finished_scan_with_history_replays_it():
+    scan = await finished_scan("scan-replayed", ScanStatus.COMPLETED)
+    main.scan_events.publish(scan.id, "started")
+    main.scan_events.publish(scan.id, "completed")
+
+    body = await read_events(scan.id)
+
+    assert [line for line in body.split("\n") if line.startswith("event:")] == [
+        "event: started", "event: completed"
+    ]
+
+
+async def test_cancelling_a_running_scan_publishes_cancelled_once(monkeypatch):
+    started = asyncio.Event()
+    published = []
+
+    async def hanging_nmap(target, on_line, refresh=False):
+        started.set()
+        await asyncio.sleep(60)
+
+    publish = main.scan_events.publish
+
+    def recording_publish(scan_id: str, event_type: str, **data):
+        published.append(event_type)
+        publish(scan_id, event_type, **data)
+
+    monkeypatch.setattr(main.scan_events, "publish", recording_publish)
+    monkeypatch.setitem(runner.TOOL_RUNNERS, Tool.NMAP, hanging_nmap)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+        response = await client.post("/api/scans/start", json={"target": "cancel.local", "tools": ["Nmap"]})
+        scan_id = response.json()["scan"]["id"]
+        await asyncio.wait_for(started.wait(), 5)
+        assert (await client.post(f"/api/scans/{scan_id}/cancel")).status_code == 200
+
+    while runner.scheduler.running:
+        await asyncio.sleep(0.01)
+
+    assert published.count("cancelled") == 1
+    assert (await main.repo.get_scan(scan_id)).summary == "Scan cancelled by user"
@@ -0,0 +1,103 @@
+import asyncio
+import inspect
+import os
+import time
+
+import pytest
+
+import executor
+from executor import gather_limited, run_command
+
+pytestmark = pytest.mark.anyio
+
+needs_process_groups = pytest.mark.skipif(
+    not executor.SUPPORTS_LIMITS or not os.path.exists("/proc/self/stat"), reason="needs POSIX process groups"
+)
+
+
+def alive(pid: int) -> bool:
+    """True unless the process is gone or only a zombie waiting to be reaped"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            state = f.read().rsplit(")", 1)[1].split()[0]
+    except FileNotFoundError:
+        return False
+    return state not in ("Z", "X")
+
+
+async def exits(pid: int) -> bool:
+    """Whether the process dies within a second; a signalled process is not gone the instant kill() returns"""
+    for _ in range(100):
+        if not alive(pid):
+            return True
+        await asyncio.sleep(0.01)
+    return False
+
+
+async def test_gather_limited_keeps_input_order():
+    async def echo(value, delay):
+        await asyncio.sleep(delay)
+        return value
+
+    assert await gather_limited([echo(1, 0.02), echo(2, 0), echo(3, 0.01)], 2) == [1, 2, 3]
+
+
+async def test_gather_limited_cancels_and_closes_siblings_when_one_fails():
+    ran = []
+
+    async def fails():
+        await asyncio.sleep(0)
+        raise ValueError("tool crashed")
+
+    async def slow(name):
+        ran.append(name)
+        await asyncio.sleep(10)
+
+    # The failure frees a slot the first slow() takes before the siblings are cancelled
+    coros = [fails(), slow("started"), slow("never-started")]
+
+    with pytest.raises(ValueError):
+        await gather_limited(coros, 1)
+
+    assert ran == ["started"]
+    assert [inspect.getcoroutinestate(c) for c in coros] == [inspect.CORO_CLOSED] * 3
+
+
+async def spawn_and_cancel(script: str):
+    """Run a shell that starts a background sleep, cancel it, and return the sleep's pid and the teardown time"""
+    pids = []
+    started = asyncio.Event()
+
+    def on_line(line):
+        pids.append(int(line))
+        started.set()
+
+    task = asyncio.ensure_future(run_command(["sh", "-c", script], timeout=30, on_line=on_line))
+    await asyncio.wait_for(started.wait(), 5)
+    began = time.monotonic()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    return pids[0], time.monotonic() - began
+
+
+@needs_process_groups
+async def test_cancel_terminates_the_whole_process_group(monkeypatch):
+    monkeypatch.setattr(executor, "TOOL_KILL_GRACE_SECONDS", 10)
+
+    child, took = await spawn_and_cancel("sleep 30 & echo $!; wait")
+
+    # SIGTERM was enough, so nothing waited out the grace period
+    assert took < 5
+    assert await exits(child)
+
+
+@needs_process_groups
+async def test_tools_ignoring_sigterm_are_killed_after_the_grace_period(monkeypatch):
+    monkeypatch.setattr(executor, "TOOL_KILL_GRACE_SECONDS", 0.2)
+
+    # The ignored SIGTERM is inherited by the background sleep too
+    child, took = await spawn_and_cancel("trap '' TERM; sleep 30 & echo $!; wait")
+
+    assert 0.2 <= took < 5
+    assert await exits(child)
@@ -0,0 +1,51 @@
+import csv
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+import export
+from export import csv_chunks, iter_pages
+from models import Scan, ScanStatus, Tool
+from storage import ListQuery, MemoryRepository
+
+pytestmark = pytest.mark.anyio
+
+
+def scan(i: int, summary: str = "ok") -> Scan:
+    return Scan(
+        id=f"scan-{i}", target=f"host-{i}.local", tools=[Tool.NMAP],
+        startedAt=(datetime(2026, 1, 1) + timedelta(minutes=i)).isoformat(), status=ScanStatus.COMPLETED,
+        issues=i, critical=0, riskScore=-1 if i == 0 else i, summary=summary, aiSummary="",
+    )
+
+
+async def pages_of(*pages):
+    for page in pages:
+        yield page
+
+
+async def test_iter_pages_follows_the_cursor_to_the_end(monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_BATCH", 2)
+    repo = MemoryRepository()
+    await repo.save_scans([scan(i) for i in range(5)])
+
+    pages = [page async for page in iter_pages(repo.page_scans, ListQuery(sort="startedAt"))]
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [s.id for page in pages for s in page] == [f"scan-{i}" for i in reversed(range(5))]
+
+
+async def test_csv_cells_that_look_like_formulas_stay_text():
+    summaries = ["=HYPERLINK(\"http://evil\")", "+1", "-cmd", "@SUM(A1)", "plain = text"]
+    body = b"".join([chunk async for chunk in csv_chunks(
+        Scan, pages_of([scan(i + 1, summary) for i, summary in enumerate(summaries)], [scan(0)])
+    )])
+
+    rows = list(csv.DictReader(io.StringIO(body.decode())))
+
+    assert [row["summary"] for row in rows[:5]] == [
+        "'=HYPERLINK(\"http://evil\")", "'+1", "'-cmd", "'@SUM(A1)", "plain = text"
+    ]
+    # Numbers are not text a spreadsheet would evaluate
+    assert rows[5]["riskScore"] == "-1"
@@ -0,0 +1,118 @@
+import asyncio
+import os
+from datetime import datetime
+
+import pytest
+
+import jobqueue
+import scan_runner as runner
+import worker
+from jobqueue import CANCELLED, LEASE_LOST, LEASED, QUEUED, JobQueue
+from models import Scan, ScanPriority, ScanStatus, Tool
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def queue(tmp_path):
+    queue = JobQueue(os.path.join(tmp_path, "jobs.db"))
+    yield queue
+    await queue.close()
+
+
+async def enqueue(queue: JobQueue, scan_id: str, target: str, priority: ScanPriority = ScanPriority.NORMAL):
+    await queue.enqueue(scan_id, target, priority, {"target": target, "tools": ["Nmap"]})
+
+
+async def test_lease_takes_priority_order_one_job_per_target(queue):
+    await enqueue(queue, "low", "a.local", ScanPriority.LOW)
+    await enqueue(queue, "normal", "b.local")
+    await enqueue(queue, "high", "b.local", ScanPriority.HIGH)
+    await enqueue(queue, "other", "c.local", ScanPriority.LOW)
+
+    leased = [(await queue.lease("w1")).id for _ in range(3)]
+
+    # b.local is busy once "high" is leased, so "normal" waits behind the other targets
+    assert leased == ["high", "low", "other"]
+    assert await queue.lease("w1") is None
+    assert await queue.positions() == {"normal": 1}
+
+
+async def test_expired_leases_are_requeued_then_given_up(queue, monkeypatch):
+    monkeypatch.setattr(jobqueue, "JOB_LEASE_SECONDS", -1)  # every lease has already run out
+    monkeypatch.setattr(jobqueue, "JOB_MAX_ATTEMPTS", 2)
+    await enqueue(queue, "scan-a", "a.local")
+
+    assert (await queue.lease("w1")).attempts == 1
+    assert await queue.reap() == []
+    assert await queue.positions() == {"scan-a": 1}
+    assert await queue.heartbeat("scan-a", "w1") == LEASE_LOST
+
+    assert (await queue.lease("w2")).attempts == 2
+    [dead] = await queue.reap()
+
+    assert (dead.id, dead.attempts) == ("scan-a", 2)
+    assert not await queue.is_active("scan-a")
+
+
+async def test_release_hands_the_job_back_without_using_an_attempt(queue):
+    await enqueue(queue, "scan-a", "a.local")
+    await queue.lease("w1")
+
+    assert await queue.release("scan-a", "w1")
+
+    assert (await queue.lease("w2")).attempts == 1
+
+
+async def test_cancel_of_queued_and_leased_jobs(queue):
+    await enqueue(queue, "running", "a.local")
+    await enqueue(queue, "waiting", "b.local")
+    await queue.lease("w1")
+
+    assert await queue.cancel("waiting") == QUEUED
+    assert await queue.cancel("running") == LEASED
+    assert await queue.cancel("running") is None
+
+    assert await queue.lease("w1") is None
+    assert await queue.heartbeat("running", "w1") == CANCELLED
+    assert (await queue.counts())[CANCELLED] == 2
+
+
+async def test_worker_stops_a_scan_cancelled_in_the_queue(queue, monkeypatch):
+    monkeypatch.setattr(worker, "JOB_HEARTBEAT_SECONDS", 0.01)
+    started = asyncio.Event()
+
+    async def endless_scan(*args):
+        started.set()
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(runner, "run_scan", endless_scan)
+    scan_worker = worker.ScanWorker(queue, worker.QueuedEvents(queue))
+    await enqueue(queue, "scan-a", "a.local")
+    job = await queue.lease(scan_worker.name)
+    running = asyncio.ensure_future(scan_worker.run_job(job))
+    await started.wait()
+
+    await queue.cancel("scan-a")
+    await asyncio.wait_for(running, 1)
+
+    assert "scan-a" not in runner.active_scans
+    assert scan_worker.running == {}
+
+
+async def test_worker_fails_scans_that_ran_out_of_attempts(queue, monkeypatch):
+    monkeypatch.setattr(jobqueue, "JOB_LEASE_SECONDS", -1)
+    monkeypatch.setattr(jobqueue, "JOB_MAX_ATTEMPTS", 1)
+    await runner.repo.save_scan(Scan(
+        id="scan-dead", target="dead.local", tools=[Tool.NMAP], startedAt=datetime.now().isoformat(),
+        status=ScanStatus.IN_PROGRESS, issues=0, critical=0, riskScore=0, summary="", aiSummary="",
+    ))
+    await enqueue(queue, "scan-dead", "dead.local")
+    await queue.lease("crashed-worker")
+    events = worker.QueuedEvents(queue)
+
+    await worker.ScanWorker(queue, events).reap()
+
+    scan = await runner.repo.get_scan("scan-dead")
+    assert (scan.status, scan.summary) == (ScanStatus.FAILED, "Scan failed: its worker stopped responding 1 times")
+    assert [(e["scanId"], e["type"]) for e in events._buffer] == [("scan-dead", "failed")]
@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import anthropic
+import pytest
+
+import llm
+import metrics
+from llm import Lane, TokenBucket
+
+pytestmark = pytest.mark.anyio
+
+PROMPT = [{"role": "user", "content": "Analyze this"}]
+
+
+def scraped(sample: str) -> float:
+    """Value of one sample, e.g. 'llm_retries_total{status="429"}', as /metrics reports it (0 if absent)"""
+    for line in metrics.render().splitlines():
+        name, _, value = line.rpartition(" ")
+        if name == sample:
+            return float(value)
+    return 0
+
+
+async def test_bucket_waits_for_refill():
+    bucket = TokenBucket(2, per_seconds=0.2)
+    started = time.monotonic()
+    await bucket.acquire()
+    await bucket.acquire()
+    assert time.monotonic() - started < 0.05
+    await bucket.acquire()
+    # One token refills every 0.1s
+    assert time.monotonic() - started >= 0.08
+
+
+async def test_bucket_reserve_is_left_for_other_callers():
+    bucket = TokenBucket(10)
+    await bucket.acquire(8, reserve=2)
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(bucket.acquire(1, reserve=2), 0.05)
+    await asyncio.wait_for(bucket.acquire(1), 0.05)
+
+
+async def test_oversized_request_fits_an_empty_bucket():
+    bucket = TokenBucket(100)
+    await asyncio.wait_for(bucket.acquire(500, reserve=20), 0.05)
+
+
+async def test_create_retries_429_and_529(fake, make_gateway, monkeypatch):
+    monkeypatch.setattr(llm.random, "uniform", lambda low, high: 0)
+    gateway = make_gateway(max_retries=3)
+    fake.failures.extend([429, 529])
+    samples = [f'llm_retries_total{{status="{status}"}}' for status in ("429", "529")]
+    before = [scraped(sample) for sample in samples]
+
+    message = await gateway.create(model=llm.LLM_MODEL, max_tokens=100, messages=PROMPT)
+
+    assert message.content[0].text == fake.REPLY
+    assert not fake.failures
+    assert [scraped(sample) for sample in samples] == [count + 1 for count in before]
+
+
+async def test_create_gives_up_after_max_retries(fake, make_gateway, monkeypatch):
+    monkeypatch.setattr(llm.random, "uniform", lambda low, high: 0)
+    gateway = make_gateway(max_retries=1)
+    fake.failures.extend([529, 529, 529])
+
+    with pytest.raises(anthropic.APIStatusError) as raised:
+        await gateway.create(model=llm.LLM_MODEL, max_tokens=100, messages=PROMPT)
+
+    assert raised.value.status_code == 529
+    assert fake.failures == [529]  # the first call and one retry
+
+
+async def test_other_errors_are_not_retried(fake, make_gateway):
+    gateway = make_gateway()
+    fake.failures.extend([400, 400])
+
+    with pytest.raises(anthropic.BadRequestError):
+        await gateway.create(model=llm.LLM_MODEL, max_tokens=100, messages=PROMPT)
+
+    assert fake.failures == [400]
+
+
+async def test_background_lane_keeps_the_interactive_reserve(make_gateway):
+    gateway = make_gateway(requests_per_minute=10, interactive_reserve=0.2)
+    for _ in range(8):
+        await gateway.create(Lane.BACKGROUND, model=llm.LLM_MODEL, max_tokens=100, messages=PROMPT)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(
+            gateway.create(Lane.BACKGROUND, model=llm.LLM_MODEL, max_tokens=100, messages=PROMPT), 0.2
+        )
+    message = await asyncio.wait_for(
+        gateway.create(Lane.INTERACTIVE, model=llm.LLM_MODEL, max_tokens=100, messages=PROMPT), 1
+    )
+    assert message.content
+
+
+async def test_stream_retries_opening(fake, make_gateway, monkeypatch):
+    monkeypatch.setattr(llm.random, "uniform", lambda low, high: 0)
+    gateway = make_gateway()
+    fake.failures.append(529)
+
+    async with gateway.stream(model=llm.LLM_MODEL, max_tokens=100, messages=PROMPT) as stream:
+        text = "".join([chunk async for chunk in stream.text_stream])
+
+    assert text == fake.REPLY
+    assert not fake.failures
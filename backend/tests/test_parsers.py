@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+import pytest
+
+from executor import STREAM_LINE_LIMIT, _read_stream
+from parsers import NucleiJsonlParser
+
+pytestmark = pytest.mark.anyio
+
+
+def nuclei_line(**info) -> str:
+    result = {"template-id": "exposed-git", "host": "https://web.local", "matched-at": "https://web.local/.git",
+              "port": "443", "info": {"name": "Exposed .git", "severity": "medium", **info}}
+    return json.dumps(result)
+
+
+def test_nuclei_result_is_parsed():
+    [match] = NucleiJsonlParser().feed(nuclei_line(reference=["https://a.example", "https://b.example"]))
+
+    assert (match.template_id, match.name, match.severity, match.port) == ("exposed-git", "Exposed .git", "medium", 443)
+    assert match.references == ["https://a.example", "https://b.example"]
+
+
+def test_nuclei_null_fields_fall_back_to_defaults():
+    parser = NucleiJsonlParser()
+    [match] = parser.feed(json.dumps({"template-id": "odd", "host": None, "port": None, "info": None}))
+
+    assert (match.host, match.name, match.severity, match.port, match.references) == ("", "odd", "unknown", None, [])
+    [match] = parser.feed(nuclei_line(name=None, description=None, remediation=["not", "text"], reference=None))
+    assert (match.name, match.description, match.remediation, match.references) == ("exposed-git", "", "", [])
+
+
+def test_nuclei_string_reference_becomes_a_list():
+    [match] = NucleiJsonlParser().feed(nuclei_line(reference="https://a.example"))
+
+    assert match.references == ["https://a.example"]
+
+
+def test_nuclei_truncated_and_non_object_lines_are_skipped():
+    parser = NucleiJsonlParser()
+    line = nuclei_line()
+
+    assert parser.feed(line[:len(line) // 2]) == []
+    assert parser.feed("[INF] Using 42 templates") == []
+    assert parser.feed('{"info": "not an object"') == []
+    assert len(parser.feed(line)) == 1
+
+
+async def test_nuclei_lines_split_across_reads_are_parsed_whole():
+    parser = NucleiJsonlParser()
+    matches = []
+    data = (nuclei_line() + "\n" + nuclei_line(name="Second") + "\n" + nuclei_line()[:40]).encode()
+    stream = asyncio.StreamReader(limit=STREAM_LINE_LIMIT)
+
+    async def write():
+        # Chunk boundaries fall inside records, as pipe reads do
+        for i in range(0, len(data), 37):
+            stream.feed_data(data[i:i + 37])
+            await asyncio.sleep(0)
+        stream.feed_eof()
+
+    writer = asyncio.ensure_future(write())
+    raw = await _read_stream(stream, lambda line: matches.extend(parser.feed(line)))
+    await writer
+
+    assert raw == data.decode()
+    assert [match.name for match in matches] == ["Exposed .git", "Second"]
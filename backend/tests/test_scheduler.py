@@ -0,0 +1,119 @@
+import asyncio
+from typing import Dict, List
+
+import pytest
+
+from models import ScanPriority, Tool
+from scheduler import QueueFull, ScanScheduler
+
+pytestmark = pytest.mark.anyio
+
+
+class Jobs:
+    """Scan bodies that record when they start and finish when released"""
+
+    def __init__(self):
+        self.started: List[str] = []
+        self.cancelled: List[str] = []
+        self.gates: Dict[str, asyncio.Event] = {}
+
+    def run(self, scan_id: str):
+        gate = self.gates[scan_id] = asyncio.Event()
+
+        async def run():
+            self.started.append(scan_id)
+            try:
+                await gate.wait()
+            except asyncio.CancelledError:
+                self.cancelled.append(scan_id)
+                raise
+        return run
+
+    async def finish(self, scan_id: str):
+        self.gates[scan_id].set()
+        await settle()
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def submit(scheduler: ScanScheduler, jobs: Jobs, scan_id: str, target: str,
+           priority: ScanPriority = ScanPriority.NORMAL):
+    scheduler.submit(scan_id, target, jobs.run(scan_id), priority)
+
+
+async def test_waiting_scans_start_in_priority_then_arrival_order():
+    scheduler, jobs = ScanScheduler(workers=1, max_queue=10), Jobs()
+    submit(scheduler, jobs, "busy", "busy.local")
+    submit(scheduler, jobs, "low", "a.local", ScanPriority.LOW)
+    submit(scheduler, jobs, "normal-1", "b.local")
+    submit(scheduler, jobs, "high", "c.local", ScanPriority.HIGH)
+    submit(scheduler, jobs, "normal-2", "d.local")
+    assert scheduler.positions() == {"high": 1, "normal-1": 2, "normal-2": 3, "low": 4}
+
+    for scan_id in ["busy", "high", "normal-1", "normal-2"]:
+        await settle()
+        await jobs.finish(scan_id)
+
+    assert jobs.started == ["busy", "high", "normal-1", "normal-2", "low"]
+    await scheduler.shutdown()
+
+
+async def test_one_scan_per_target_at_a_time():
+    scheduler, jobs = ScanScheduler(workers=3, max_queue=10), Jobs()
+    submit(scheduler, jobs, "first", "web.local")
+    submit(scheduler, jobs, "same-host", "HTTPS://Web.local/login", ScanPriority.HIGH)
+    submit(scheduler, jobs, "other", "db.local")
+    await settle()
+
+    assert jobs.started == ["first", "other"]
+    assert scheduler.positions() == {"same-host": 1}
+
+    await jobs.finish("first")
+    assert jobs.started == ["first", "other", "same-host"]
+    await scheduler.shutdown()
+
+
+async def test_full_queue_pushes_back():
+    scheduler, jobs = ScanScheduler(workers=1, max_queue=1), Jobs()
+    submit(scheduler, jobs, "running", "a.local")
+    submit(scheduler, jobs, "waiting", "b.local")
+
+    with pytest.raises(QueueFull):
+        submit(scheduler, jobs, "rejected", "c.local")
+    await scheduler.shutdown()
+
+
+async def test_cancel_drops_queued_scans_and_abort_stops_running_ones():
+    scheduler, jobs = ScanScheduler(workers=1, max_queue=10), Jobs()
+    submit(scheduler, jobs, "running", "a.local")
+    submit(scheduler, jobs, "queued", "b.local")
+    await settle()
+
+    assert not scheduler.cancel("running")
+    assert not scheduler.abort("queued")
+    assert scheduler.cancel("queued")
+    assert scheduler.abort("running")
+    await settle()
+
+    assert jobs.started == ["running"]
+    assert jobs.cancelled == ["running"]
+    assert (scheduler.running, scheduler.depth) == (0, 0)
+    assert not scheduler.abort("running")
+
+
+async def test_tool_slots_cap_concurrent_runs_per_tool():
+    scheduler = ScanScheduler(tool_limits={Tool.NUCLEI: 1})
+    order = []
+
+    async def use(name: str):
+        async with scheduler.tool_slot(Tool.NUCLEI):
+            order.append(f"{name} start")
+            await asyncio.sleep(0.01)
+            order.append(f"{name} end")
+
+    await asyncio.gather(use("a"), use("b"))
+
+    assert order == ["a start", "a end", "b start", "b end"]
@@ -0,0 +1,180 @@
+"""Contract tests every ScanRepository backend must pass"""
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import storage
+from models import Finding, FindingStatus, Scan, ScanStatus, Severity, Tool
+from storage import (
+    FINDINGS, MIGRATIONS, SCANS, ListQuery, MemoryRepository, RevisionExpired, ScanRepository, SQLiteRepository,
+)
+
+pytestmark = pytest.mark.anyio
+
+SEVERITIES = [Severity.LOW, Severity.CRITICAL, Severity.MEDIUM]
+
+
+def scan(i: int, **fields) -> Scan:
+    values = dict(
+        id=f"scan-{i}", target=f"host-{i % 2}.local", tools=[Tool.NMAP] if i % 2 else [Tool.NMAP, Tool.NIKTO],
+        startedAt=(datetime(2026, 1, 1) + timedelta(hours=i)).isoformat(), status=ScanStatus.COMPLETED,
+        issues=0, critical=0, riskScore=i % 3, summary="", aiSummary="",
+    )
+    return Scan(**{**values, **fields})
+
+
+def finding(i: int, scan_id: str = "scan-0") -> Finding:
+    return Finding(
+        id=f"finding-{i}", scanId=scan_id, host="10.0.0.1", severity=SEVERITIES[i % 3], tool=Tool.NMAP,
+        status=FindingStatus.OPEN, title=f"issue {i}", description="", recommendation="",
+        createdAt=(datetime(2026, 1, 1) + timedelta(minutes=i)).isoformat(),
+    )
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+async def repo(request, tmp_path):
+    if request.param == "memory":
+        repo = MemoryRepository()
+    else:
+        repo = SQLiteRepository(os.path.join(tmp_path, "scans.db"), pool_size=2)
+    yield repo
+    await repo.close()
+
+
+async def all_pages(page, query: ListQuery) -> list:
+    pages = []
+    while True:
+        result = await page(query)
+        pages.append([record.id for record in result.items])
+        if result.next_cursor is None:
+            return pages
+        query.cursor = result.next_cursor
+
+
+async def test_keyset_cursor_walks_ties_without_gaps_or_repeats(repo):
+    scans = [scan(i) for i in range(8)]
+    await repo.save_scans(scans)
+
+    pages = await all_pages(repo.page_scans, ListQuery(sort="riskScore", limit=3))
+
+    expected = sorted(scans, key=lambda s: (s.riskScore, s.id), reverse=True)
+    assert [len(p) for p in pages] == [3, 3, 2]
+    assert [i for p in pages for i in p] == [s.id for s in expected]
+
+
+async def test_pages_apply_filters_and_the_time_range(repo):
+    await repo.save_scans([scan(i) for i in range(8)] + [scan(8, status=ScanStatus.FAILED)])
+    query = ListQuery(
+        filters={"tool": Tool.NIKTO.value, "status": ScanStatus.COMPLETED.value}, sort="startedAt",
+        descending=False, limit=2, since=scan(1).startedAt, until=scan(7).startedAt,
+    )
+
+    assert await all_pages(repo.page_scans, query) == [["scan-2", "scan-4"], ["scan-6"]]
+
+
+async def test_findings_sort_by_severity_rank(repo):
+    await repo.save_findings([finding(i) for i in range(6)])
+
+    pages = await all_pages(repo.page_findings, ListQuery(sort="severity", limit=4))
+
+    assert pages == [["finding-4", "finding-1", "finding-5", "finding-2"], ["finding-3", "finding-0"]]
+
+
+async def test_changes_list_writes_and_tombstones_after_a_revision(repo):
+    await repo.save_scans([scan(0), scan(1)])
+    await repo.save_findings([finding(0), finding(1)])
+    since = await repo.revision(SCANS)
+
+    await repo.update_scan("scan-1", summary="rescanned")
+    assert await repo.delete_scan("scan-0")
+    assert not await repo.delete_scan("scan-0")
+    await repo.save_scan(scan(2))
+
+    changes = await repo.changes(SCANS, since, 10)
+    assert [s.id for s in changes.items] == ["scan-1", "scan-2"]
+    assert changes.items[0].summary == "rescanned"
+    assert changes.deleted == ["scan-0"]
+    assert changes.revision == await repo.revision(SCANS)
+    assert sorted((await repo.changes(FINDINGS, 0, 10)).deleted) == ["finding-0", "finding-1"]
+
+    first = await repo.changes(SCANS, since, 2)
+    assert first.has_more and len(first.items) + len(first.deleted) == 2
+    rest = await repo.changes(SCANS, first.revision, 2)
+    assert ([s.id for s in rest.items], rest.has_more) == (["scan-2"], False)
+
+
+async def test_saving_a_deleted_id_drops_its_tombstone(repo):
+    await repo.save_scan(scan(0))
+    await repo.delete_scan("scan-0")
+    await repo.save_scan(scan(0))
+
+    changes = await repo.changes(SCANS, 0, 10)
+
+    assert ([s.id for s in changes.items], changes.deleted) == (["scan-0"], [])
+
+
+async def test_forgotten_tombstones_expire_old_revisions(repo, monkeypatch):
+    monkeypatch.setattr(storage, "TOMBSTONE_LIMIT", 1)
+    await repo.save_scans([scan(0), scan(1)])
+    since = await repo.revision(SCANS)
+    await repo.delete_scan("scan-0")
+    await repo.delete_scan("scan-1")
+
+    with pytest.raises(RevisionExpired):
+        await repo.changes(SCANS, since, 10)
+    # A full reload never needs tombstones
+    assert (await repo.changes(SCANS, 0, 10)).deleted == ["scan-1"]
+
+
+async def test_list_targets_and_seed_only_into_an_empty_store(repo):
+    assert await repo.seed_if_empty([scan(0), scan(1), scan(2)], [finding(0)])
+    assert not await repo.seed_if_empty([scan(3)], [])
+
+    assert sorted(await repo.list_targets()) == ["host-0.local", "host-1.local"]
+    assert [f.id for f in await repo.list_findings("scan-0")] == ["finding-0"]
+
+
+def test_the_interface_cannot_be_instantiated():
+    with pytest.raises(TypeError):
+        ScanRepository()
+
+
+def test_sqlite_rejects_an_in_memory_database():
+    with pytest.raises(ValueError):
+        SQLiteRepository(":memory:")
+
+
+async def test_migrations_upgrade_a_first_version_database(tmp_path):
+    path = os.path.join(tmp_path, "old.db")
+    conn = sqlite3.connect(path, isolation_level=None)
+    storage._migrate(conn, MIGRATIONS[:1])
+    old = scan(1, riskScore=7)
+    conn.execute(
+        "INSERT INTO scans (id, target, status, startedAt, data) VALUES (?, ?, ?, ?, ?)",
+        (old.id, old.target, old.status.value, old.startedAt, old.model_dump_json()),
+    )
+    conn.execute(
+        "INSERT INTO findings (id, scanId, host, severity, status, data) VALUES (?, ?, ?, ?, ?, ?)",
+        ("finding-0", old.id, "10.0.0.1", "Low", "Open", finding(0, old.id).model_dump_json(exclude={"createdAt"})),
+    )
+    conn.close()
+
+    repo = SQLiteRepository(path)
+    try:
+        version = repo.pool.run_sync(storage._query, "PRAGMA user_version", ())[0][0]
+        assert version == len(MIGRATIONS)
+        assert [s.id for s in (await repo.page_scans(ListQuery(sort="riskScore", filters={"tool": "Nmap"}))).items] \
+            == ["scan-1"]
+        [migrated] = (await repo.page_findings(ListQuery(sort="createdAt"))).items
+        # Findings from before createdAt existed take their scan's start time
+        assert (migrated.id, migrated.createdAt) == ("finding-0", old.startedAt)
+        assert [s.id for s in (await repo.changes(SCANS, 0, 10)).items] == ["scan-1"]
+    finally:
+        await repo.close()
+
+    # Reopening an up-to-date database runs nothing
+    repo = SQLiteRepository(path)
+    assert (await repo.get_scan("scan-1")).riskScore == 7
+    await repo.close()
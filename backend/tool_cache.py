@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import json
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from analysis_cache import AnalysisCache
+from executor import CommandResult
+from models import Tool
+
+TOOL_CACHE_DIR = os.environ.get(
+    "TOOL_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "tools"),
+)
+TOOL_CACHE_MAX_BYTES = int(os.environ.get("TOOL_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+TOOL_CACHE_MEMORY_ENTRIES = int(os.environ.get("TOOL_CACHE_MEMORY_ENTRIES", "64"))
+
+# How long a tool's output stays fresh, per tool (TOOL_CACHE_TTL_<TOOL>; 0 turns caching off)
+TOOL_CACHE_TTLS: Dict[Tool, int] = {
+    Tool.NMAP: int(os.environ.get("TOOL_CACHE_TTL_NMAP", "900")),
+    Tool.NIKTO: int(os.environ.get("TOOL_CACHE_TTL_NIKTO", "1800")),
+    Tool.NUCLEI: int(os.environ.get("TOOL_CACHE_TTL_NUCLEI", "1800")),
+}
+
+NUCLEI_TEMPLATES_CONFIG = os.path.expanduser("~/.config/nuclei/.templates-config.json")
+
+_tool_cache: Optional["ToolCache"] = None
+
+
+class RunAbandoned(Exception):
+    """The scan that owned a shared tool run was cancelled before it finished"""
+
+
+def templates_version(tool: Tool) -> str:
+    """Version of the checks a tool runs, so a template update invalidates its cached output"""
+    if tool != Tool.NUCLEI:
+        return ""
+    version = os.environ.get("NUCLEI_TEMPLATES_VERSION")
+    if version:
+        return version
+    try:
+        with open(NUCLEI_TEMPLATES_CONFIG) as f:
+            return json.load(f).get("nuclei-templates-version", "")
+    except (OSError, ValueError, AttributeError):
+        return ""
+
+
+def tool_key(tool: Tool, target: str, args: List[str]) -> str:
+    target = target.strip().lower()
+    args = [target if arg.strip().lower() == target else arg for arg in args]
+    payload = json.dumps([tool.value, target, args, templates_version(tool)])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _encode(result: CommandResult) -> str:
+    return json.dumps({"stdout": result.stdout, "returncode": result.returncode})
+
+
+def _decode(args: List[str], text: str) -> CommandResult:
+    entry = json.loads(text)
+    return CommandResult(args=args, returncode=entry["returncode"], stdout=entry["stdout"], stderr="")
+
+
+class ToolCache:
+    """Finished tool runs keyed by (tool, target, arguments, templates version).
+
+    Overlapping scans of the same target share one run: while it is in
+    flight, later callers wait for it instead of starting their own.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = TOOL_CACHE_DIR,
+        max_bytes: int = TOOL_CACHE_MAX_BYTES,
+        memory_entries: int = TOOL_CACHE_MEMORY_ENTRIES,
+    ):
+        longest = max(TOOL_CACHE_TTLS.values(), default=0)
+        self.store = AnalysisCache(directory, max(longest, 1), max_bytes, memory_entries)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.shared = 0
+
+    async def run(
+        self,
+        tool: Tool,
+        target: str,
+        args: List[str],
+        execute: Callable[[], Awaitable[CommandResult]],
+        refresh: bool = False,
+    ) -> Tuple[CommandResult, bool]:
+        """(result, reused); reused results were not streamed to this caller while the tool ran"""
+        ttl = TOOL_CACHE_TTLS.get(tool, 0)
+        if ttl <= 0:
+            return await execute(), False
+        key = tool_key(tool, target, args)
+
+        if not refresh:
+            text = await self.store.get(key, ttl)
+            if text is not None:
+                return _decode(args, text), True
+
+        # A run already in flight is fresh enough even for a forced refresh
+        while key in self._inflight:
+            try:
+                result = await asyncio.shield(self._inflight[key])
+                self.shared += 1
+                return result, True
+            except RunAbandoned:
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting; don't warn about an unretrieved exception
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            result = await execute()
+        except asyncio.CancelledError:
+            future.set_exception(RunAbandoned())
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._inflight[key]
+        future.set_result(result)
+        if result.returncode == 0 or result.stdout:  # an empty failure is not worth reusing
+            await self.store.put(key, _encode(result))
+        return result, False
+
+    def report(self) -> Dict[str, int]:
+        return {**self.store.report(), "shared": self.shared, "inFlight": len(self._inflight)}
+
+
+def get_tool_cache() -> ToolCache:
+    global _tool_cache
+    if _tool_cache is None:
+        _tool_cache = ToolCache()
+    return _tool_cache
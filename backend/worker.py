@@ -0,0 +1,215 @@
+"""Scan worker: leases scans and campaigns from the shared job queue and runs them.
+
+Start the API with SCAN_EXECUTOR=queue so it only queues scans, then run as
+many workers as there is scanner capacity, on this host or any other that
+shares the SQLite files (DATABASE_PATH and JOB_QUEUE_PATH):
+
+  SCAN_EXECUTOR=queue uvicorn main:app
+  python worker.py --concurrency 4 --metrics-port 9101
+
+A worker that crashes or hangs stops heartbeating; once its leases expire
+the next worker to reap the queue puts those scans back in line. Its tool,
+LLM and scan metrics are recorded in this process rather than the API's,
+so each worker serves its own /metrics.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import time
+import uuid
+from typing import Dict, List, Set
+
+from dotenv import load_dotenv
+
+import metrics
+import scan_runner as runner
+from campaigns import shutdown_process_pool
+from jobqueue import (
+    CANCELLED, JOB_EVENT_POLL_SECONDS, JOB_HEARTBEAT_SECONDS, LEASE_LOST, Job, JobQueue
+)
+from llm import get_gateway
+from models import ScanStatus, StartScanRequest
+from scheduler import SCAN_WORKERS
+from storage import STORAGE_BACKEND
+
+load_dotenv()
+
+# Seconds between polls of an empty queue
+WORKER_POLL_SECONDS = float(os.environ.get("WORKER_POLL_SECONDS", "1"))
+# Seconds a stopping worker lets running scans finish before handing them back to the queue
+WORKER_DRAIN_SECONDS = float(os.environ.get("WORKER_DRAIN_SECONDS", "30"))
+# Port for this worker's Prometheus /metrics (0 turns it off)
+WORKER_METRICS_PORT = int(os.environ.get("WORKER_METRICS_PORT", "0"))
+
+
+class QueuedEvents:
+    """Stands in for the API's ScanEventBroadcaster inside a worker.
+
+    Events are buffered and written to the job queue in batches; the API
+    relays them to its SSE subscribers.
+    """
+
+    def __init__(self, queue: JobQueue):
+        self.queue = queue
+        self.muted: Set[str] = set()
+        self._buffer: List[dict] = []
+
+    def publish(self, scan_id: str, event_type: str, **data):
+        if scan_id not in self.muted:
+            self._buffer.append({"scanId": scan_id, "type": event_type, "ts": time.time(), **data})
+
+    async def flush(self):
+        if self._buffer:
+            events, self._buffer = self._buffer, []
+            await self.queue.add_events(events)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(JOB_EVENT_POLL_SECONDS)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Worker: could not write scan events: {e!r}")
+
+
+class ScanWorker:
+    def __init__(self, queue: JobQueue, events: QueuedEvents, concurrency: int = SCAN_WORKERS):
+        self.queue = queue
+        self.events = events
+        self.concurrency = concurrency
+        self.name = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.running: Dict[str, asyncio.Task] = {}
+        self.stopping = asyncio.Event()
+        self._last_reap = 0.0
+
+    async def run(self):
+        print(f"Worker {self.name} started with {self.concurrency} slots on {self.queue.path}")
+        while not self.stopping.is_set():
+            await self.reap()
+            job = await self.queue.lease(self.name) if len(self.running) < self.concurrency else None
+            if job is not None:
+                self.running[job.id] = asyncio.create_task(self.run_job(job))
+                continue
+            try:
+                await asyncio.wait_for(self.stopping.wait(), WORKER_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+        await self.drain()
+
+    async def reap(self):
+        """Requeue scans whose workers died; fail the ones that have been retried too often"""
+        if time.monotonic() - self._last_reap < JOB_HEARTBEAT_SECONDS:
+            return
+        self._last_reap = time.monotonic()
+        for job in await self.queue.reap():
+            error = f"its worker stopped responding {job.attempts} times"
+            if job.payload.get("campaign"):
+                await runner.repo.update_campaign(
+                    job.id, status=ScanStatus.FAILED, summary=f"Campaign failed: {error}",
+                    aiSummary=f"Error during campaign: {error}"
+                )
+                continue
+            await runner.repo.update_scan(
+                job.id, status=ScanStatus.FAILED, summary=f"Scan failed: {error}", aiSummary=f"Error during scan: {error}"
+            )
+            self.events.publish(job.id, "failed", error=error)
+
+    async def run_job(self, job: Job):
+        campaign = bool(job.payload.get("campaign"))
+        if campaign:
+            print(f"Worker {self.name}: leased campaign {job.id} (attempt {job.attempts})")
+            work = runner.run_queued_campaign(job.id, job.payload["shards"], job.payload.get("maxParallelShards"))
+        else:
+            request = StartScanRequest(**job.payload)
+            print(f"Worker {self.name}: leased scan {job.id} on {request.target} (attempt {job.attempts})")
+            work = runner.run_scan(
+                job.id, request.target, request.tools, request.maxParallelTools, request.differential,
+                request.forceRefresh, request.deferredAnalysis
+            )
+        runner.active_scans[job.id] = True
+        scan = asyncio.create_task(work)
+        try:
+            while not scan.done():
+                await asyncio.wait({scan}, timeout=JOB_HEARTBEAT_SECONDS)
+                if scan.done():
+                    break
+                reason = await self.queue.heartbeat(job.id, self.name)
+                if reason == CANCELLED and runner.active_scans.get(job.id):
+                    print(f"Worker {self.name}: scan {job.id} was cancelled")
+                    runner.active_scans[job.id] = False
+                    if not campaign:
+                        scan.cancel()  # a campaign stops between shards, as it does in the API process
+                elif reason == LEASE_LOST:
+                    print(f"Worker {self.name}: lost the lease on scan {job.id}, it may run again elsewhere")
+            await asyncio.gather(scan, return_exceptions=True)  # run_scan records its own failures
+            await self.queue.finish(job.id, self.name)
+        except asyncio.CancelledError:
+            # Shutting down mid-scan: stop the tools and put the scan back in line for another worker
+            self.events.muted.add(job.id)
+            scan.cancel()
+            await asyncio.gather(scan, return_exceptions=True)
+            if await self.queue.release(job.id, self.name):
+                if campaign:
+                    await runner.repo.update_campaign(
+                        job.id, status=ScanStatus.QUEUED, summary="Requeued: its worker shut down"
+                    )
+                else:
+                    await runner.repo.update_scan(
+                        job.id, status=ScanStatus.QUEUED, summary="Requeued: its worker shut down", plan=[]
+                    )
+            self.events.muted.discard(job.id)
+            raise
+        finally:
+            runner.active_scans.pop(job.id, None)
+            self.running.pop(job.id, None)
+
+    async def drain(self):
+        tasks = list(self.running.values())
+        if not tasks:
+            return
+        print(f"Worker {self.name}: waiting up to {WORKER_DRAIN_SECONDS:.0f}s for {len(tasks)} running scans")
+        _, pending = await asyncio.wait(tasks, timeout=WORKER_DRAIN_SECONDS)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def serve(concurrency: int, metrics_port: int = WORKER_METRICS_PORT):
+    queue = JobQueue()
+    events = QueuedEvents(queue)
+    runner.scan_events = events  # run_scan publishes through the module global
+    worker = ScanWorker(queue, events, concurrency)
+    metrics.Gauge(
+        "worker_jobs_running", "Scans and campaigns this worker is running", function=lambda: len(worker.running)
+    )
+    exporter = await metrics.serve(metrics_port) if metrics_port else None
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stopping.set)
+    flusher = asyncio.create_task(events.run())
+    try:
+        await worker.run()
+    finally:
+        flusher.cancel()
+        if exporter is not None:
+            exporter.close()
+        await events.flush()
+        await get_gateway().aclose()
+        shutdown_process_pool()
+        await runner.output_archive.close()
+        await runner.batch_analyzer.close()
+        await runner.repo.close()
+        await queue.close()
+        print(f"Worker {worker.name} stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run queued scans (see SCAN_EXECUTOR=queue)")
+    parser.add_argument("--concurrency", type=int, default=SCAN_WORKERS, help="scans run at once")
+    parser.add_argument("--metrics-port", type=int, default=WORKER_METRICS_PORT, help="serve /metrics here (0: off)")
+    args = parser.parse_args()
+    if STORAGE_BACKEND == "memory":
+        raise SystemExit("worker.py writes results to the shared SQLite store; unset STORAGE_BACKEND=memory")
+    asyncio.run(serve(args.concurrency, args.metrics_port))
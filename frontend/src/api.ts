@@ -1,7 +1,8 @@
 const API_BASE = 'http://localhost:8000/api';
 
 export type ScanTool = 'Nmap' | 'Nuclei' | 'Nikto' | 'OpenVAS';
-export type ScanStatus = 'In Progress' | 'Completed' | 'Clean' | 'Failed';
+export type ScanStatus = 'Queued' | 'In Progress' | 'Completed' | 'Clean' | 'Failed';
+export type ScanPriority = 'High' | 'Normal' | 'Low';
 export type Severity = 'Critical' | 'High' | 'Medium' | 'Low' | 'Info';
 export type FindingStatus = 'Open' | 'In Progress' | 'Resolved';
 
@@ -18,8 +19,55 @@ export interface Scan {
   riskScore: number;
   summary: string;
   aiSummary: string;
+  priority?: ScanPriority;
+  queuePosition?: number | null;
+  queueDepth?: number | null;
+  baselineScanId?: string | null;
+  newFindings?: number | null;
+  resolvedFindings?: number | null;
+  campaignId?: string | null;
+  plan?: PlanStage[];
+  cpuSeconds?: number | null;
+  peakRssMb?: number | null;
+  deferredAnalysis?: boolean;
 }
 
+export type StageStatus = 'Planned' | 'Running' | 'Done' | 'Skipped' | 'Failed';
+
+export interface PlanStage {
+  tool: ScanTool;
+  endpoint?: string | null;
+  dependsOn?: ScanTool | null;
+  status: StageStatus;
+  reason?: string | null;
+  cpuSeconds?: number | null;
+  peakRssMb?: number | null;
+  wallSeconds?: number | null;
+  cached?: boolean;
+}
+
+export interface Campaign {
+  id: string;
+  name: string;
+  targets: string[];
+  tools: ScanTool[];
+  startedAt: string;
+  status: ScanStatus;
+  hostCount: number;
+  shardCount: number;
+  shardsDone: number;
+  issues: number;
+  critical: number;
+  riskScore: number;
+  severityCounts: Partial<Record<Severity, number>>;
+  durationMinutes?: number | null;
+  summary: string;
+  aiSummary: string;
+  priority: ScanPriority;
+}
+
+export type FindingChange = 'New' | 'Changed' | 'Unchanged' | 'Resolved' | 'Unverified';
+
 export interface Finding {
   id: string;
   scanId: string;
@@ -32,6 +80,9 @@ export interface Finding {
   title: string;
   description: string;
   recommendation: string;
+  createdAt?: string;
+  dedupKey?: string;
+  change?: FindingChange | null;
 }
 
 export interface ChatMessage {
@@ -41,25 +92,106 @@ export interface ChatMessage {
   time: string;
 }
 
-// Replace mock functions with real API calls
-export async function fetchScans(): Promise<Scan[]> {
-  const response = await fetch(`${API_BASE}/scans`);
+export interface ListParams {
+  // Filters: status, severity, tool, host, target, scanId
+  [filter: string]: string | number | undefined;
+  since?: string;
+  until?: string;
+  sort?: string; // e.g. '-startedAt', '-severity'
+  limit?: number;
+  cursor?: string;
+  fields?: string; // e.g. 'id,severity,title'
+}
+
+export interface Page<T> {
+  items: T[];
+  nextCursor: string | null;
+  revision?: number;
+}
+
+// Everything written or deleted after a revision; pass `revision` back to continue
+export interface Changes<T> {
+  items: T[];
+  deleted: string[];
+  revision: number;
+  hasMore: boolean;
+}
+
+function listUrl(path: string, params: ListParams = {}): string {
+  const query = new URLSearchParams();
+  Object.entries(params).forEach(([key, value]) => {
+    if (value !== undefined && value !== '') query.set(key, String(value));
+  });
+  const qs = query.toString();
+  return `${API_BASE}/${path}${qs ? `?${qs}` : ''}`;
+}
+
+export async function fetchScanPage(params: ListParams = {}): Promise<Page<Scan>> {
+  const response = await fetch(listUrl('scans', params));
+  const data = await response.json();
+  return { items: data.scans, nextCursor: data.nextCursor ?? null, revision: data.revision };
+}
+
+export async function fetchFindingPage(params: ListParams = {}): Promise<Page<Finding>> {
+  const response = await fetch(listUrl('findings', params));
   const data = await response.json();
-  return data.scans;
+  return { items: data.findings, nextCursor: data.nextCursor ?? null, revision: data.revision };
 }
 
-export async function fetchFindings(): Promise<Finding[]> {
-  const response = await fetch(`${API_BASE}/findings`);
+// Thrown when the server no longer remembers deletions that far back: reload the full list
+export class RevisionExpiredError extends Error {}
+
+async function fetchChanges<T>(path: string, key: string, sinceRevision: number, limit?: number): Promise<Changes<T>> {
+  const response = await fetch(listUrl(path, { sinceRevision, limit }));
+  if (response.status === 410) throw new RevisionExpiredError('Revision too old, reload the full list');
   const data = await response.json();
-  return data.findings;
+  return { items: data[key], deleted: data.deleted, revision: data.revision, hasMore: data.hasMore };
+}
+
+export function fetchScanChanges(sinceRevision: number, limit?: number): Promise<Changes<Scan>> {
+  return fetchChanges<Scan>('scans', 'scans', sinceRevision, limit);
+}
+
+export function fetchFindingChanges(sinceRevision: number, limit?: number): Promise<Changes<Finding>> {
+  return fetchChanges<Finding>('findings', 'findings', sinceRevision, limit);
+}
+
+// Replace mock functions with real API calls
+export async function fetchScans(params: ListParams = {}): Promise<Scan[]> {
+  return (await fetchScanPage(params)).items;
+}
+
+export async function fetchFindings(params: ListParams = {}): Promise<Finding[]> {
+  return (await fetchFindingPage(params)).items;
+}
+
+export type ExportFormat = 'ndjson' | 'csv';
+
+// Download link for every matching record (filters and sort as in ListParams; limit and cursor are ignored)
+export function exportUrl(
+  collection: 'scans' | 'findings',
+  format: ExportFormat = 'ndjson',
+  params: ListParams = {}
+): string {
+  return listUrl(`${collection}/export`, { ...params, format, limit: undefined, cursor: undefined, fields: undefined });
 }
 
-export async function startScan(tools: ScanTool[], target: string): Promise<Scan> {
+export async function startScan(
+  tools: ScanTool[],
+  target: string,
+  priority: ScanPriority = 'Normal',
+  differential = false,
+  forceRefresh = false,
+  deferredAnalysis = false
+): Promise<Scan> {
   const response = await fetch(`${API_BASE}/scans/start`, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({ tools, target })
+    body: JSON.stringify({ tools, target, priority, differential, forceRefresh, deferredAnalysis })
   });
+  if (response.status === 429) {
+    throw new Error('Scan queue is full, try again shortly');
+  }
   const data = await response.json();
   return data.scan;
 }
@@ -70,12 +202,296 @@ export async function cancelScan(scanId: string): Promise<void> {
   });
 }
 
-export async function sendChat(prompt: string, scanId?: string): Promise<ChatMessage> {
+export async function deleteScan(scanId: string): Promise<void> {
+  const response = await fetch(`${API_BASE}/scans/${scanId}`, { method: 'DELETE' });
+  if (!response.ok) {
+    const data = await response.json();
+    throw new Error(data.detail || 'Could not delete scan');
+  }
+}
+
+// One archived tool run; web tools have one per endpoint
+export interface OutputStream {
+  tool: string;
+  endpoint: string | null;
+  lines: number;
+  bytes: number;
+  compressedBytes: number;
+  archivedAt: number;
+}
+
+export interface OutputLines {
+  tool: string;
+  endpoint: string | null;
+  from: number;
+  to: number;
+  total: number;
+  lines: string[];
+}
+
+export async function fetchScanOutputStreams(scanId: string): Promise<OutputStream[]> {
+  const response = await fetch(`${API_BASE}/scans/${scanId}/output`);
+  const data = await response.json();
+  return data.streams;
+}
+
+export async function fetchScanOutput(
+  scanId: string,
+  tool: string,
+  range: { endpoint?: string; from?: number; to?: number } = {}
+): Promise<OutputLines> {
+  const response = await fetch(listUrl(`scans/${scanId}/output/${tool}`, range as ListParams));
+  const data = await response.json();
+  if (!response.ok) throw new Error(data.detail || 'Could not load tool output');
+  return data;
+}
+
+export async function startCampaign(
+  targets: string[],
+  tools: ScanTool[],
+  options: { name?: string; shardSize?: number; maxParallelShards?: number; priority?: ScanPriority } = {}
+): Promise<Campaign> {
+  const response = await fetch(`${API_BASE}/campaigns/start`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ targets, tools, ...options })
+  });
+  if (response.status === 429) {
+    throw new Error('Scan queue is full, try again shortly');
+  }
+  if (!response.ok) {
+    const data = await response.json();
+    throw new Error(data.detail || 'Could not start campaign');
+  }
+  const data = await response.json();
+  return data.campaign;
+}
+
+export async function fetchCampaigns(): Promise<Campaign[]> {
+  const response = await fetch(`${API_BASE}/campaigns`);
+  const data = await response.json();
+  return data.campaigns;
+}
+
+// Campaign rollup: the campaign plus its hosts, riskiest first
+export async function fetchCampaign(campaignId: string): Promise<{ campaign: Campaign; hosts: Scan[] }> {
+  const response = await fetch(`${API_BASE}/campaigns/${campaignId}`);
+  return response.json();
+}
+
+export async function cancelCampaign(campaignId: string): Promise<void> {
+  await fetch(`${API_BASE}/campaigns/${campaignId}/cancel`, {
+    method: 'POST'
+  });
+}
+
+export type ToolWindowCounts = { total: number; '24h': number; '7d': number; '30d': number };
+
+export interface TargetRisk {
+  target: string;
+  scans: number;
+  averageRisk: number;
+}
+
+// Server-side dashboard aggregates, so the browser no longer has to load every scan and finding
+export interface DashboardStats {
+  scans: { total: number; byStatus: Partial<Record<ScanStatus, number>>; averageRisk: number };
+  findings: {
+    total: number;
+    bySeverity: Record<Severity, number>;
+    bySeverityAndStatus: Partial<Record<FindingStatus, Partial<Record<Severity, number>>>>;
+    highCritical: number;
+  };
+  tools: {
+    used: number;
+    scans: Record<ScanTool, ToolWindowCounts>;
+    findings: Record<ScanTool, ToolWindowCounts>;
+  };
+  targets: { count: number; riskiest: TargetRisk[] };
+  target?: TargetRisk | null;
+  revision: { scans: number; findings: number };
+}
+
+export async function fetchStats(target?: string): Promise<DashboardStats> {
+  const response = await fetch(listUrl('stats', { target }));
+  return response.json();
+}
+
+export interface StatsCheck {
+  consistent: boolean | null;
+  differences: string[] | null;
+  repaired: boolean;
+  revision: { scans: number; findings: number };
+}
+
+// Rebuild the aggregates server-side and compare; `repair` replaces them if they drifted
+export async function verifyStats(repair = false): Promise<StatsCheck> {
+  const response = await fetch(`${API_BASE}/stats/verify${repair ? '?repair=true' : ''}`, { method: 'POST' });
+  return response.json();
+}
+
+export interface AnalysisBatch {
+  id: string;
+  requests: number;
+  status: string;
+  submittedAt: number;
+  endedAt?: number | null;
+}
+
+// Scans started with deferredAnalysis wait here until the next batch
+export interface AnalysisBatches {
+  waitingRequests: number;
+  waitingScans: number;
+  batches: AnalysisBatch[];
+}
+
+export async function fetchAnalysisBatches(): Promise<AnalysisBatches> {
+  const response = await fetch(`${API_BASE}/analysis/batches`);
+  return response.json();
+}
+
+// Send waiting analyses now instead of at the end of the batch window; null when nothing was waiting
+export async function submitAnalysisBatch(): Promise<string | null> {
+  const response = await fetch(`${API_BASE}/analysis/batches/submit`, { method: 'POST' });
+  const data = await response.json();
+  return data.batchId;
+}
+
+export interface ChatSource {
+  id: string;
+  scanId: string;
+  kind: 'finding' | 'output';
+}
+
+// A reply, the session to pass back for follow-up questions, and what was retrieved into the prompt
+export interface ChatReply extends ChatMessage {
+  sessionId: string;
+  sources: ChatSource[];
+}
+
+export async function sendChat(prompt: string, scanId?: string, sessionId?: string): Promise<ChatReply> {
   const response = await fetch(`${API_BASE}/chat`, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({ prompt, scanId })
+    body: JSON.stringify({ prompt, scanId, sessionId })
   });
   const data = await response.json();
-  return data.message;
+  return { ...data.message, sessionId: data.sessionId, sources: data.sources };
+}
+
+export type ScanEventType =
+  | 'queued'
+  | 'started'
+  | 'plan'
+  | 'tool_queued'
+  | 'tool_started'
+  | 'tool_output'
+  | 'tool_finished'
+  | 'analysis_started'
+  | 'analysis_finished'
+  | 'analysis_deferred'
+  | 'completed'
+  | 'failed'
+  | 'cancelled';
+
+export interface ScanEvent {
+  id: number;
+  type: ScanEventType;
+  scanId: string;
+  ts: number;
+  tool?: ScanTool;
+  endpoint?: string | null;
+  line?: string;
+  bytes?: number;
+  records?: number;
+  requests?: number;
+  cached?: boolean;
+  differential?: boolean;
+  plan?: PlanStage[];
+  error?: string;
+  scan?: Scan;
+}
+
+const SCAN_EVENT_TYPES: ScanEventType[] = [
+  'queued',
+  'started',
+  'plan',
+  'tool_queued',
+  'tool_started',
+  'tool_output',
+  'tool_finished',
+  'analysis_started',
+  'analysis_finished',
+  'analysis_deferred',
+  'completed',
+  'failed',
+  'cancelled'
+];
+
+// Live scan progress pushed by the backend; returns an unsubscribe function.
+// The browser's EventSource resumes from the last event id after a reconnect.
+export function subscribeScanEvents(scanId: string, onEvent: (event: ScanEvent) => void): () => void {
+  const source = new EventSource(`${API_BASE}/scans/${scanId}/events`);
+  const handle = (message: MessageEvent) => {
+    const event: ScanEvent = JSON.parse(message.data);
+    onEvent(event);
+    if (event.type === 'completed' || event.type === 'failed' || event.type === 'cancelled') {
+      source.close();
+    }
+  };
+  SCAN_EVENT_TYPES.forEach((type) => source.addEventListener(type, handle as EventListener));
+  return () => source.close();
+}
+
+// Real progress (0-100) from the events seen so far: each tool counts as one
+// step and the AI analysis as the last one.
+export function scanProgress(events: ScanEvent[], tools: ScanTool[]): number {
+  if (events.some((e) => e.type === 'completed' || e.type === 'failed' || e.type === 'cancelled')) return 100;
+  const steps = tools.length + 1;
+  const toolsDone = events.filter((e) => e.type === 'tool_finished').length;
+  const analysisDone = events.some((e) => e.type === 'analysis_finished') ? 1 : 0;
+  return Math.round(((toolsDone + analysisDone) / steps) * 100);
+}
+
+// Streams the assistant's reply: onToken fires for each chunk of text as the
+// model produces it, and the promise resolves with the complete message.
+// Aborting the signal drops the connection, which cancels the upstream request.
+export async function streamChat(
+  prompt: string,
+  onToken: (text: string) => void,
+  scanId?: string,
+  signal?: AbortSignal,
+  sessionId?: string
+): Promise<ChatReply> {
+  const response = await fetch(`${API_BASE}/chat/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ prompt, scanId, sessionId }),
+    signal
+  });
+  if (!response.body) throw new Error('Streaming not supported by this browser');
+
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = '';
+  let final: ChatReply | null = null;
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += value;
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      const eventLine = frame.split('\n').find((line) => line.startsWith('event: '));
+      const dataLine = frame.split('\n').find((line) => line.startsWith('data: '));
+      if (eventLine && dataLine) {
+        const data = JSON.parse(dataLine.slice(6));
+        if (eventLine === 'event: token') onToken(data.text);
+        if (eventLine === 'event: message') final = data;
+      }
+      boundary = buffer.indexOf('\n\n');
+    }
+  }
+  if (!final) throw new Error('Chat stream ended without a message');
+  return final;
 }